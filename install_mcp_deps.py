@@ -11,7 +11,8 @@ def install_mcp_dependencies():
         "uvicorn>=0.24.0",
         "websockets>=12.0",
         "aiohttp>=3.9.0",
-        "pydantic>=2.5.0"
+        "pydantic>=2.5.0",
+        "msgpack>=1.0.0"
     ]
     
     print("🔧 Installing MCP dependencies...")
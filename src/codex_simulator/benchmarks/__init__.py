@@ -0,0 +1,16 @@
+"""
+Benchmark harnesses for CodexSimulator.
+
+Each harness writes machine-readable JSON results and can compare them against a
+stored baseline, so performance regressions show up offline.
+"""
+
+from .stats import (
+    LatencySummary, Regression, summarize_latencies, percentile,
+    compare_to_baseline, load_results, write_results
+)
+
+__all__ = [
+    'LatencySummary', 'Regression', 'summarize_latencies', 'percentile',
+    'compare_to_baseline', 'load_results', 'write_results'
+]
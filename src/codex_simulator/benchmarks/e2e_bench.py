@@ -0,0 +1,487 @@
+"""
+End-to-End Command Benchmark
+Runs a corpus of terminal commands through CodexSimulator with a scripted stand-in
+for CustomGeminiLLM, and reports where each command's time goes.
+
+Every LLM call is answered from a canned transcript after a fixed simulated
+latency, so runs are deterministic and offline, and changes in framework
+overhead (crew construction, routing, CrewAI execution, tool calls, CLAUDE.md
+I/O) show up against a stored baseline.
+
+Usage:
+    python -m codex_simulator.benchmarks.e2e_bench --repeat 5 --llm-latency 0.05
+    python -m codex_simulator.benchmarks.e2e_bench --baseline benchmarks/e2e_baseline.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from crewai.llms.base_llm import BaseLLM
+
+from .stats import compare_to_baseline, load_results, summarize_latencies, write_results
+
+BENCHMARK_NAME = "e2e"
+MODES = ("flow", "crew")
+
+# Where a command's wall time is attributed; each phase excludes time spent in phases nested inside it
+PHASES = ("crew_construction", "routing", "framework", "tool_execution", "claude_md_io", "llm")
+
+# Agent roles from config/agents.yaml, used to address transcript turns
+COMMANDER = "Terminal Command Orchestrator"
+FILE_NAVIGATOR = "File System Operations Expert"
+CODE_EXECUTOR = "Secure Code and Command Execution Specialist"
+
+UNSCRIPTED_ANSWER = "Thought: I now know the final answer\nFinal Answer: (no scripted response)"
+
+# Settings that keep a run offline and free of interactive prompts; set only when absent
+OFFLINE_ENVIRONMENT = {
+    "BRAVE_API_KEY": "offline-benchmark",  # SerpAPITool refuses to construct without one
+    "CREWAI_TRACING_ENABLED": "false",
+    "CREWAI_DISABLE_TELEMETRY": "true",
+    "CREWAI_TESTING": "true",  # Suppresses CrewAI's first-run trace viewing prompt
+    "OTEL_SDK_DISABLED": "true"
+}
+
+@dataclass
+class Turn:
+    """One scripted LLM response, given to the next agent whose role contains agent"""
+    agent: str
+    response: str
+
+def act(agent: str, tool: str, **arguments) -> Turn:
+    """A turn in which the agent calls a tool"""
+    return Turn(agent, f"Thought: I should use {tool}\nAction: {tool}\nAction Input: {json.dumps(arguments)}")
+
+def answer(agent: str, text: str) -> Turn:
+    """A turn in which the agent gives its final answer"""
+    return Turn(agent, f"Thought: I now know the final answer\nFinal Answer: {text}")
+
+@dataclass
+class CommandCase:
+    """A representative command and the transcript that answers it"""
+    name: str
+    command: str
+    turns: List[Turn] = field(default_factory=list)
+
+CORPUS: List[CommandCase] = [
+    CommandCase("help", "help"),
+    CommandCase("pwd", "pwd"),
+    CommandCase("cd", "cd src"),
+    CommandCase("list_files", "show the files in this directory", [
+        act(COMMANDER, "delegate_tool", task="List the files in the current directory", context="",
+            coworker="FileNavigator"),
+        act(FILE_NAVIGATOR, "safe_directory_tool", directory_path="."),
+        answer(FILE_NAVIGATOR, "hello.py, notes.md, src/"),
+        answer(COMMANDER, "The directory contains hello.py, notes.md and src/.")
+    ]),
+    CommandCase("read_file", "read the file notes.md", [
+        act(COMMANDER, "delegate_tool", task="Read notes.md", context="", coworker="FileNavigator"),
+        act(FILE_NAVIGATOR, "safe_file_read_tool", file_path="notes.md"),
+        answer(FILE_NAVIGATOR, "notes.md lists two TODO items."),
+        answer(COMMANDER, "notes.md lists two TODO items.")
+    ]),
+    CommandCase("run_script", "run python3 hello.py", [
+        act(COMMANDER, "delegate_tool", task="Run python3 hello.py", context="", coworker="CodeExecutor"),
+        act(CODE_EXECUTOR, "safe_shell_tool", command="python3 hello.py"),
+        answer(CODE_EXECUTOR, "The script printed: Hello, World!"),
+        answer(COMMANDER, "hello.py printed: Hello, World!")
+    ]),
+    CommandCase("multi_step", "find the TODO items in notes.md and then run hello.py", [
+        act(COMMANDER, "delegate_tool", task="Find TODO items in notes.md", context="", coworker="FileNavigator"),
+        act(FILE_NAVIGATOR, "safe_file_read_tool", file_path="notes.md"),
+        answer(FILE_NAVIGATOR, "TODO: write tests; TODO: update docs"),
+        act(COMMANDER, "delegate_tool", task="Run python3 hello.py", context="", coworker="CodeExecutor"),
+        act(CODE_EXECUTOR, "safe_shell_tool", command="python3 hello.py"),
+        answer(CODE_EXECUTOR, "Hello, World!"),
+        answer(COMMANDER, "Found two TODO items; hello.py printed Hello, World!")
+    ]),
+    CommandCase("explain", "explain how agent delegation works", [
+        answer(COMMANDER, "The commander routes each request to the specialist that owns it.")
+    ])
+]
+
+# Files the corpus reads and runs, created fresh for every pass over it
+WORKSPACE_FILES = {
+    "notes.md": "# Notes\n\n- TODO: write tests\n- TODO: update docs\n",
+    "hello.py": "print('Hello, World!')\n",
+    "src/__init__.py": ""
+}
+
+class _Frame:
+    __slots__ = ("phase", "child_time")
+
+    def __init__(self, phase: str):
+        self.phase = phase
+        self.child_time = 0.0
+
+_current_frame: ContextVar[Optional[_Frame]] = ContextVar("benchmark_phase", default=None)
+
+class PhaseTimer:
+    """
+    Attributes wall time to phases.
+
+    Phases nest: time spent in an inner phase is counted there and not again in
+    the enclosing one, so the phases of a command add up to its total. Nesting
+    follows the context, so it carries across asyncio tasks and to_thread calls.
+    """
+
+    def __init__(self):
+        self._totals: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        parent = _current_frame.get()
+        frame = _Frame(name)
+        token = _current_frame.set(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            _current_frame.reset(token)
+            with self._lock:
+                self._totals[name] += elapsed - frame.child_time
+                if parent is not None:
+                    parent.child_time += elapsed
+
+    def wrap(self, func: Callable, name: str) -> Callable:
+        """func, timed as phase name on every call"""
+        @wraps(func)
+        def timed(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+        return timed
+
+    def collect(self) -> Dict[str, float]:
+        """Seconds per phase since the last collect"""
+        with self._lock:
+            totals, self._totals = dict(self._totals), defaultdict(float)
+        return totals
+
+@contextlib.contextmanager
+def instrument(timer: PhaseTimer, targets: Sequence[Tuple[Any, str, str]]) -> Iterator[None]:
+    """Time the (owner, attribute, phase) methods, on classes or instances, until exit"""
+    patched = []
+    try:
+        for owner, attribute, phase in targets:
+            own = attribute in vars(owner)
+            original = vars(owner)[attribute] if own else None
+            setattr(owner, attribute, timer.wrap(getattr(owner, attribute), phase))
+            patched.append((owner, attribute, own, original))
+        yield
+    finally:
+        for owner, attribute, own, original in reversed(patched):
+            if own:
+                setattr(owner, attribute, original)
+            else:
+                delattr(owner, attribute)
+
+class ScriptedLLM(BaseLLM):
+    """
+    Deterministic stand-in for CustomGeminiLLM.
+
+    Each call is answered with the next loaded turn addressed to the calling
+    agent's role, after a fixed simulated latency. Calls with no turn left get a
+    bare final answer and are counted in unscripted; turns never asked for stay
+    in remaining.
+    """
+
+    def __init__(self, latency: float = 0.0, timer: Optional[PhaseTimer] = None):
+        super().__init__(model="scripted", temperature=0.0)
+        self.latency = latency
+        self.timer = timer
+        self.calls = 0
+        self.unscripted = 0
+        self._turns: List[Turn] = []
+        self._lock = threading.Lock()
+
+    def load(self, turns: Sequence[Turn]):
+        """Replace the remaining transcript and reset the counters"""
+        with self._lock:
+            self._turns = list(turns)
+            self.calls = 0
+            self.unscripted = 0
+
+    @property
+    def remaining(self) -> int:
+        return len(self._turns)
+
+    def _next_response(self, role: str) -> str:
+        with self._lock:
+            self.calls += 1
+            for index, turn in enumerate(self._turns):
+                if turn.agent.lower() in role.lower():
+                    return self._turns.pop(index).response
+            self.unscripted += 1
+            return UNSCRIPTED_ANSWER
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None, from_agent=None):
+        with self.timer.phase("llm") if self.timer else contextlib.nullcontext():
+            # CrewAI's agent executor passes the task, not the agent
+            agent = from_agent or getattr(from_task, "agent", None)
+            response = self._next_response(getattr(agent, "role", "") or "")
+            if self.latency:
+                time.sleep(self.latency)
+            return response
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def get_context_window_size(self) -> int:
+        return 1_000_000
+
+def create_workspace() -> str:
+    """A temporary directory holding WORKSPACE_FILES"""
+    workspace = tempfile.mkdtemp(prefix="codex-e2e-")
+    for relative_path, content in WORKSPACE_FILES.items():
+        path = os.path.join(workspace, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as workspace_file:
+            workspace_file.write(content)
+    return workspace
+
+def _instrumentation_targets(simulator: Any) -> List[Tuple[Any, str, str]]:
+    """Methods timed during a run, by phase"""
+    from crewai import Agent, Crew
+    from crewai.tools.structured_tool import CrewStructuredTool
+
+    targets = [
+        (simulator, "_run_with_flow", "routing"),
+        (simulator, "_run_with_crew_only", "routing"),
+        (simulator, "_handle_cd_command", "routing"),
+        (simulator, "_create_terminal_crew", "crew_construction"),
+        (simulator, "_ensure_claude_md_exists", "claude_md_io"),
+        (simulator, "_load_claude_context", "claude_md_io"),
+        (simulator, "_load_user_context", "claude_md_io"),
+        (simulator, "_update_claude_md", "claude_md_io"),
+        (Crew, "kickoff", "framework"),
+        (Agent, "execute_task", "framework"),
+        (CrewStructuredTool, "invoke", "tool_execution")
+    ]
+    try:
+        from ..flows.crew_factories import CrewFactory
+        from ..flows.terminal_flow import TerminalAssistantFlow
+    except ImportError:
+        # Without the flow package _run_with_flow falls back to crew-only mode; nothing flow-specific to time
+        return targets
+    targets.append((TerminalAssistantFlow, "kickoff", "routing"))
+    targets.extend(
+        (CrewFactory, name, "crew_construction")
+        for name in ("create_file_crew", "create_code_crew", "create_research_crew", "create_terminal_crew")
+    )
+    return targets
+
+@dataclass
+class _CaseSamples:
+    totals: List[float] = field(default_factory=list)
+    phases: Dict[str, float] = field(default_factory=lambda: defaultdict(float))
+    fallbacks: int = 0
+    llm_calls: int = 0
+    unscripted: int = 0
+    unused: int = 0
+
+def _run_pass(
+    mode: str,
+    corpus: Sequence[CommandCase],
+    llm: ScriptedLLM,
+    timer: PhaseTimer,
+    samples: Optional[Dict[str, _CaseSamples]]
+) -> float:
+    """
+    Run the corpus once on a fresh simulator in a fresh workspace, adding to samples.
+
+    Returns:
+        Seconds spent constructing the simulator
+    """
+    from ..crew import CodexSimulator, StateTracker
+
+    workspace = create_workspace()
+    original_cwd = os.getcwd()
+    try:
+        os.chdir(workspace)
+        started = time.perf_counter()
+        simulator = CodexSimulator(llm=llm)
+        # The tracker is shared by the class; give each pass its own
+        simulator._state = StateTracker(workspace)
+        startup = time.perf_counter() - started
+
+        crew_only = simulator._run_with_crew_only
+        fallbacks: List[str] = []
+
+        def fall_back(command: str) -> str:
+            fallbacks.append(command)
+            return crew_only(command)
+
+        with instrument(timer, _instrumentation_targets(simulator)):
+            if mode == "flow":
+                # Calls made from inside _run_with_flow are fallbacks to crew-only mode
+                simulator._run_with_crew_only = timer.wrap(fall_back, "routing")
+                run = simulator._run_with_flow
+            else:
+                run = simulator._run_with_crew_only
+            for case in corpus:
+                simulator.cwd = workspace
+                llm.load(case.turns)
+                del fallbacks[:]
+                timer.collect()
+                started = time.perf_counter()
+                run(case.command)
+                elapsed = time.perf_counter() - started
+                phases = timer.collect()
+                if samples is None:
+                    continue
+                sample = samples[case.name]
+                sample.totals.append(elapsed)
+                for phase, seconds in phases.items():
+                    sample.phases[phase] += seconds
+                sample.fallbacks += len(fallbacks)
+                sample.llm_calls += llm.calls
+                sample.unscripted += llm.unscripted
+                sample.unused += llm.remaining
+        return startup
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+def run_corpus(
+    modes: Sequence[str] = MODES,
+    repeat: int = 3,
+    warmup: int = 1,
+    llm_latency: float = 0.0,
+    corpus: Sequence[CommandCase] = CORPUS,
+    verbose: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Run every command of the corpus through each mode, repeat times after warmup passes.
+
+    Each pass uses a fresh simulator and workspace, and every command starts in
+    the workspace root. The process working directory is the workspace for the
+    duration, since tools resolve relative paths against it.
+
+    Returns:
+        One case per mode and command, plus one per mode for simulator startup
+    """
+    timer = PhaseTimer()
+    llm = ScriptedLLM(latency=llm_latency, timer=timer)
+    samples: Dict[str, Dict[str, _CaseSamples]] = {mode: defaultdict(_CaseSamples) for mode in modes}
+    startups: Dict[str, List[float]] = {mode: [] for mode in modes}
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        for mode in modes:
+            for _ in range(warmup):
+                _run_pass(mode, corpus, llm, timer, None)
+            for _ in range(repeat):
+                startups[mode].append(_run_pass(mode, corpus, llm, timer, samples[mode]))
+
+    cases: List[Dict[str, Any]] = []
+    for mode in modes:
+        cases.append({
+            "name": f"{mode}/startup",
+            "mode": mode,
+            "runs": len(startups[mode]),
+            "latency_ms": summarize_latencies(startups[mode]).to_dict()
+        })
+        for case in corpus:
+            sample = samples[mode][case.name]
+            runs = max(len(sample.totals), 1)
+            accounted = sum(sample.phases.values())
+            phases_ms = {phase: sample.phases.get(phase, 0.0) * 1000.0 / runs for phase in PHASES}
+            phases_ms["other"] = (sum(sample.totals) - accounted) * 1000.0 / runs
+            cases.append({
+                "name": f"{mode}/{case.name}",
+                "mode": mode,
+                "command": case.command,
+                "runs": runs,
+                "latency_ms": summarize_latencies(sample.totals).to_dict(),
+                "phases_ms": phases_ms,
+                "fallbacks": sample.fallbacks,
+                "llm_calls": sample.llm_calls / runs,
+                "unscripted_turns": sample.unscripted,
+                "unused_turns": sample.unused
+            })
+    return cases
+
+def format_case(case: Dict[str, Any]) -> str:
+    line = f"{case['name']:<22} mean {case['latency_ms']['mean']:>9.2f} ms"
+    if "phases_ms" in case:
+        line += "  " + "  ".join(f"{phase} {ms:.2f}" for phase, ms in case["phases_ms"].items() if ms >= 0.005)
+        if case["fallbacks"]:
+            line += f"  [fell back to crew x{case['fallbacks']}]"
+        if case["unscripted_turns"] or case["unused_turns"]:
+            line += f"  [transcript drift: {case['unscripted_turns']} unscripted, {case['unused_turns']} unused]"
+    return line
+
+# Framework phases compared against a baseline; simulated LLM time is fixed by the run's settings
+COMPARED_METRICS = ("latency_ms.p50", "latency_ms.p95") + tuple(
+    f"phases_ms.{phase}" for phase in PHASES if phase != "llm"
+)
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Command line entry point; exits 1 when results regress against the baseline"""
+    parser = argparse.ArgumentParser(description="Benchmark per-command overhead with a scripted LLM")
+    parser.add_argument("--mode", nargs="+", choices=MODES, default=list(MODES),
+                        help="flow runs _run_with_flow, crew runs _run_with_crew_only")
+    parser.add_argument("--command", nargs="+", choices=[case.name for case in CORPUS],
+                        help="Corpus commands to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes over the corpus per mode")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed passes before the timed ones")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated seconds per LLM call")
+    parser.add_argument("--verbose", action="store_true", help="Show the assistant's and CrewAI's output")
+    parser.add_argument("--output", default="e2e_benchmark.json", help="Where to write the results")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Also write the results to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Relative change counted as a regression")
+    parser.add_argument("--min-delta", type=float, default=0.5,
+                        help="Milliseconds a metric must also move by to count as a regression")
+    args = parser.parse_args(argv)
+
+    for name, value in OFFLINE_ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    corpus = [case for case in CORPUS if not args.command or case.name in args.command]
+    cases = run_corpus(args.mode, args.repeat, args.warmup, args.llm_latency, corpus, args.verbose)
+    for case in cases:
+        print(format_case(case))
+    config = {
+        "modes": args.mode,
+        "commands": [case.name for case in corpus],
+        "repeat": args.repeat,
+        "warmup": args.warmup,
+        "llm_latency": args.llm_latency
+    }
+    write_results(args.output, BENCHMARK_NAME, cases, config)
+    print(f"Results written to {args.output}")
+
+    if not args.baseline:
+        return 0
+    if args.save_baseline or not os.path.exists(args.baseline):
+        write_results(args.baseline, BENCHMARK_NAME, cases, config)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    regressions, unmatched = compare_to_baseline(
+        cases, load_results(args.baseline), lower_is_better=COMPARED_METRICS, higher_is_better=(),
+        tolerance=args.tolerance, min_delta=args.min_delta
+    )
+    for name in unmatched:
+        print(f"No baseline for {name}")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+"""
+MCP Benchmark
+Load-tests MCPServer with synthetic tools, driven by concurrent MCPClient instances.
+
+The server runs in its own process so clients and server do not share an event
+loop or interpreter lock; only the "local" transport hosts it in-process, since
+that is what it measures.
+
+Usage:
+    python -m codex_simulator.benchmarks.mcp_bench --transport http websocket --clients 1 8
+    python -m codex_simulator.benchmarks.mcp_bench --baseline benchmarks/mcp_baseline.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import aiohttp
+
+from ..mcp.client import MCPClient
+from ..mcp.schemas import MCPConnectionConfig
+from ..mcp.server import MCPServer
+from .stats import compare_to_baseline, load_results, summarize_latencies, write_results
+
+BENCHMARK_NAME = "mcp"
+TRANSPORTS = ("http", "websocket", "unix", "local")
+
+# Synthetic tools; module level so the process pool can pickle cpu-bound calls
+
+async def sleep_tool(duration: float = 0.01) -> str:
+    """Stands in for tools that wait on I/O"""
+    await asyncio.sleep(duration)
+    return "ok"
+
+def cpu_tool(rounds: int = 20000) -> str:
+    """Stands in for tools that compute; runs in the server's process pool"""
+    digest = b""
+    for _ in range(rounds):
+        digest = hashlib.sha256(digest).digest()
+    return digest.hex()
+
+async def payload_tool(size: int = 256 * 1024) -> str:
+    """Stands in for tools returning large results, such as file reads"""
+    return "x" * size
+
+@dataclass
+class Scenario:
+    """One synthetic workload: a tool and the arguments every call uses"""
+    name: str
+    tool: str
+    arguments: Dict[str, Any] = field(default_factory=dict)
+
+SCENARIOS: Dict[str, Scenario] = {
+    "sleep": Scenario("sleep", "bench_sleep", {"duration": 0.01}),
+    "cpu": Scenario("cpu", "bench_cpu", {"rounds": 20000}),
+    "payload": Scenario("payload", "bench_payload", {"size": 256 * 1024})
+}
+
+def create_benchmark_server(host: str = "127.0.0.1", port: int = 8000, **server_options) -> MCPServer:
+    """MCPServer with the synthetic benchmark tools registered"""
+    server = MCPServer(host=host, port=port, **server_options)
+    server.register_tool("bench_sleep", sleep_tool, kind="async")
+    server.register_tool("bench_cpu", cpu_tool, kind="cpu")
+    server.register_tool("bench_payload", payload_tool, kind="async")
+    return server
+
+def _serve(host: str, port: int, uds: Optional[str]):
+    """Server process entry point"""
+    server = create_benchmark_server(host, port, uds=uds)
+    asyncio.run(server.start(log_level="warning"))
+
+def _free_port(host: str) -> int:
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+class ServerProcess:
+    """
+    The benchmark server in a child process, listening on TCP and a Unix socket.
+
+    The process is spawned, so scripts using this need the usual
+    if __name__ == "__main__" guard.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: Optional[int] = None, startup_timeout: float = 30.0):
+        self.host = host
+        self.port = port or _free_port(host)
+        self.startup_timeout = startup_timeout
+        self._socket_dir = tempfile.mkdtemp(prefix="mcp-bench-")
+        self.uds = os.path.join(self._socket_dir, "mcp.sock")
+        self._process: Optional[multiprocessing.Process] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def unix_url(self) -> str:
+        return f"unix://{self.uds}"
+
+    async def __aenter__(self) -> "ServerProcess":
+        context = multiprocessing.get_context("spawn")
+        self._process = context.Process(target=_serve, args=(self.host, self.port, self.uds))
+        self._process.start()
+        deadline = time.monotonic() + self.startup_timeout
+        async with aiohttp.ClientSession() as session:
+            while True:
+                if not self._process.is_alive():
+                    raise RuntimeError(f"Benchmark server exited with code {self._process.exitcode}")
+                try:
+                    async with session.get(f"{self.url}/info") as response:
+                        if response.status == 200 and os.path.exists(self.uds):
+                            return self
+                except aiohttp.ClientError:
+                    pass
+                if time.monotonic() > deadline:
+                    await self.__aexit__(None, None, None)
+                    raise TimeoutError(f"Benchmark server did not start within {self.startup_timeout}s")
+                await asyncio.sleep(0.1)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._process is not None:
+            self._process.terminate()
+            await asyncio.get_running_loop().run_in_executor(None, self._process.join, 10)
+            self._process = None
+        try:
+            os.unlink(self.uds)
+        except FileNotFoundError:
+            pass
+        os.rmdir(self._socket_dir)
+
+@dataclass
+class BenchmarkConfig:
+    """What to run; every scenario runs on every transport at every client count"""
+    scenarios: List[str] = field(default_factory=lambda: list(SCENARIOS))
+    transports: List[str] = field(default_factory=lambda: ["http", "websocket"])
+    clients: List[int] = field(default_factory=lambda: [1, 8])
+    requests: int = 50
+    warmup: int = 5
+    timeout: int = 60
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "scenarios": {name: SCENARIOS[name].arguments for name in self.scenarios},
+            "transports": self.transports,
+            "clients": self.clients,
+            "requests_per_client": self.requests,
+            "warmup_per_client": self.warmup,
+            "timeout": self.timeout
+        }
+
+async def _call(client: MCPClient, scenario: Scenario, latencies: Optional[List[float]]) -> bool:
+    """One timed invocation; returns whether it succeeded"""
+    started = time.perf_counter()
+    try:
+        response = await client.invoke_tool(scenario.tool, scenario.arguments)
+        succeeded = response.success
+    except Exception:
+        succeeded = False
+    if latencies is not None and succeeded:
+        latencies.append(time.perf_counter() - started)
+    return succeeded
+
+async def run_case(
+    server_url: str,
+    transport: str,
+    scenario: Scenario,
+    clients: int,
+    requests: int,
+    warmup: int = 0,
+    timeout: int = 60
+) -> Dict[str, Any]:
+    """
+    Drive one scenario with concurrent clients, each sending requests back to back.
+
+    Returns:
+        The case's results: throughput over the timed phase and latency of
+        successful calls; failed calls are counted in errors
+    """
+    mcp_clients = []
+    for index in range(clients):
+        config = MCPConnectionConfig(
+            server_url=server_url,
+            client_id=f"bench_{index}",
+            timeout=timeout,
+            retry_attempts=1,
+            transport="local" if transport == "local" else "network"
+        )
+        mcp_clients.append(MCPClient(config, f"bench_{uuid.uuid4().hex[:8]}_{index}"))
+    try:
+        await asyncio.gather(*(client.connect(use_websocket=transport != "http") for client in mcp_clients))
+        for client in mcp_clients:
+            for _ in range(warmup):
+                await _call(client, scenario, None)
+
+        latencies: List[float] = []
+
+        async def drive(client: MCPClient) -> int:
+            errors = 0
+            for _ in range(requests):
+                if not await _call(client, scenario, latencies):
+                    errors += 1
+            return errors
+
+        started = time.perf_counter()
+        errors = sum(await asyncio.gather(*(drive(client) for client in mcp_clients)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await asyncio.gather(*(client.disconnect() for client in mcp_clients), return_exceptions=True)
+
+    return {
+        "name": f"{scenario.name}/{transport}/c{clients}",
+        "scenario": scenario.name,
+        "transport": transport,
+        "clients": clients,
+        "requests": clients * requests,
+        "errors": errors,
+        "duration_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": summarize_latencies(latencies).to_dict()
+    }
+
+async def run_benchmarks(config: BenchmarkConfig, report=print) -> List[Dict[str, Any]]:
+    """Run every configured case and return their results"""
+    cases: List[Dict[str, Any]] = []
+
+    async def run_all(urls: Dict[str, str], transports: Sequence[str]):
+        for scenario_name in config.scenarios:
+            for transport in transports:
+                for clients in config.clients:
+                    case = await run_case(
+                        urls[transport], transport, SCENARIOS[scenario_name], clients,
+                        config.requests, config.warmup, config.timeout
+                    )
+                    cases.append(case)
+                    report(format_case(case))
+
+    network = [t for t in config.transports if t != "local"]
+    if network:
+        async with ServerProcess() as server:
+            await run_all({"http": server.url, "websocket": server.url, "unix": server.unix_url}, network)
+    if "local" in config.transports:
+        server = create_benchmark_server()
+        await server.startup()
+        try:
+            await run_all({"local": server.local_url}, ["local"])
+        finally:
+            await server.shutdown()
+    return cases
+
+def format_case(case: Dict[str, Any]) -> str:
+    latency = case["latency_ms"]
+    return (
+        f"{case['name']:<28} {case['throughput_rps']:>9.1f} req/s  "
+        f"p50 {latency['p50']:>8.2f}  p95 {latency['p95']:>8.2f}  p99 {latency['p99']:>8.2f} ms  "
+        f"errors {case['errors']}"
+    )
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Command line entry point; exits 1 when results regress against the baseline"""
+    parser = argparse.ArgumentParser(description="Benchmark the MCP server and client")
+    parser.add_argument("--scenario", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--transport", nargs="+", choices=TRANSPORTS, default=["http", "websocket"])
+    parser.add_argument("--clients", nargs="+", type=int, default=[1, 8], help="Concurrent client counts to run")
+    parser.add_argument("--requests", type=int, default=50, help="Timed requests per client")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed requests per client before each case")
+    parser.add_argument("--timeout", type=int, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--output", default="mcp_benchmark.json", help="Where to write the results")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Also write the results to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    config = BenchmarkConfig(
+        scenarios=args.scenario,
+        transports=args.transport,
+        clients=args.clients,
+        requests=args.requests,
+        warmup=args.warmup,
+        timeout=args.timeout
+    )
+    cases = asyncio.run(run_benchmarks(config))
+    payload = write_results(args.output, BENCHMARK_NAME, cases, config.to_dict())
+    print(f"Results written to {args.output}")
+
+    if not args.baseline:
+        return 0
+    if args.save_baseline or not os.path.exists(args.baseline):
+        write_results(args.baseline, BENCHMARK_NAME, cases, payload["config"])
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    regressions, unmatched = compare_to_baseline(cases, load_results(args.baseline), tolerance=args.tolerance)
+    for name in unmatched:
+        print(f"No baseline for {name}")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
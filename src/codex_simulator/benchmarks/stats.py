@@ -0,0 +1,150 @@
+"""
+Benchmark Statistics
+Latency summaries, result files and baseline comparison shared by the benchmark harnesses.
+"""
+
+import json
+import math
+import os
+import platform
+import sys
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+RESULTS_VERSION = 1
+
+@dataclass
+class LatencySummary:
+    """Latency distribution of one benchmark case, in milliseconds"""
+    count: int
+    mean: float
+    p50: float
+    p95: float
+    p99: float
+    max: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+@dataclass
+class Regression:
+    """A metric that moved the wrong way by more than the tolerance"""
+    case: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def change(self) -> float:
+        """Relative change from the baseline, e.g. 0.25 for 25% higher"""
+        return (self.current - self.baseline) / self.baseline if self.baseline else math.inf
+
+    def __str__(self) -> str:
+        return f"{self.case} {self.metric}: {self.baseline:.3f} -> {self.current:.3f} ({self.change:+.1%})"
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Linearly interpolated percentile (0-100) of already sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * q / 100.0
+    low = math.floor(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+def summarize_latencies(seconds: Iterable[float]) -> LatencySummary:
+    """Summarize latencies given in seconds"""
+    values = sorted(value * 1000.0 for value in seconds)
+    if not values:
+        return LatencySummary(count=0, mean=0.0, p50=0.0, p95=0.0, p99=0.0, max=0.0)
+    return LatencySummary(
+        count=len(values),
+        mean=sum(values) / len(values),
+        p50=percentile(values, 50),
+        p95=percentile(values, 95),
+        p99=percentile(values, 99),
+        max=values[-1]
+    )
+
+def environment() -> Dict[str, Any]:
+    """Where the results were measured; comparisons across machines are only indicative"""
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count()
+    }
+
+def write_results(path: str, benchmark: str, cases: List[Dict[str, Any]], config: Dict[str, Any]) -> Dict[str, Any]:
+    """Write a results file and return its contents"""
+    payload = {
+        "version": RESULTS_VERSION,
+        "benchmark": benchmark,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "config": config,
+        "cases": cases
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as results_file:
+        json.dump(payload, results_file, indent=2)
+    return payload
+
+def load_results(path: str) -> Dict[str, Any]:
+    """
+    Read a results file written by write_results.
+
+    Raises:
+        ValueError: If the file is not a results file of a supported version
+    """
+    with open(path) as results_file:
+        payload = json.load(results_file)
+    if not isinstance(payload, dict) or payload.get("version") != RESULTS_VERSION:
+        raise ValueError(f"{path} is not a version {RESULTS_VERSION} benchmark results file")
+    return payload
+
+def _get_metric(case: Dict[str, Any], metric: str) -> Optional[float]:
+    """Look up a dotted metric path such as latency_ms.p95"""
+    value: Any = case
+    for part in metric.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return float(value) if isinstance(value, (int, float)) else None
+
+def compare_to_baseline(
+    cases: List[Dict[str, Any]],
+    baseline: Dict[str, Any],
+    lower_is_better: Sequence[str] = ("latency_ms.p50", "latency_ms.p95", "latency_ms.p99"),
+    higher_is_better: Sequence[str] = ("throughput_rps",),
+    tolerance: float = 0.10,
+    min_delta: float = 0.0
+) -> Tuple[List[Regression], List[str]]:
+    """
+    Compare cases with the baseline's cases of the same name.
+
+    A metric regresses when it moves the wrong way by more than tolerance
+    relative to the baseline and by more than min_delta in absolute terms, which
+    keeps jitter in very small values from counting.
+
+    Returns:
+        Regressions beyond the relative tolerance, and the names of cases that
+        have no baseline to compare with
+    """
+    baseline_cases = {case["name"]: case for case in baseline.get("cases", [])}
+    regressions: List[Regression] = []
+    unmatched: List[str] = []
+    for case in cases:
+        reference = baseline_cases.get(case["name"])
+        if reference is None:
+            unmatched.append(case["name"])
+            continue
+        for metric, worse in [(m, 1.0) for m in lower_is_better] + [(m, -1.0) for m in higher_is_better]:
+            current, previous = _get_metric(case, metric), _get_metric(reference, metric)
+            if current is None or previous is None or previous <= 0:
+                continue
+            change = worse * (current - previous)
+            if change > min_delta and change / previous > tolerance:
+                regressions.append(Regression(case["name"], metric, previous, current))
+    return regressions, unmatched
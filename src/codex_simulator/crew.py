@@ -38,6 +38,8 @@ from codex_simulator.tools.website_tool import WebsiteTool
 from codex_simulator.utils.delegation_fix import get_delegation_handler
 from codex_simulator.utils.file_operations import FileOperationsManager
 from codex_simulator.utils.tool_adapter import patch_tool_methods
+from codex_simulator.utils.tracing import get_tracer, install_crewai_hooks, trace_tool, traced
+from codex_simulator.utils.token_accounting import ContextSection, fit_to_budget, install_token_accounting, task_context_budget
 from codex_simulator.utils.simple_knowledge import SimpleKnowledge  # Add this import
 from codex_simulator.tools.fs_cache_tool import FSCacheTool    # new import
 from codex_simulator.tools.execution_profiler_tool import ExecutionProfilerTool  # new import
@@ -47,6 +49,9 @@ from codex_simulator.tools.pdf_reader_tool import PDFReaderTool # Import PDFRead
 # Add MCP imports
 from .mcp import MCPClient, MCPToolWrapper, MCPConnectionConfig, create_mcp_client, wrap_tools_with_mcp
 
+# Most of CLAUDE.md that goes into a task prompt, about 1000 characters
+CLAUDE_CONTEXT_TOKENS = 250
+
 # Class for structured state tracking
 class StateTracker:
     """Tracks state across agent interactions"""
@@ -117,12 +122,13 @@ def remove_competing_delegation_tools(agent):
 class CodexSimulator:
     """Main class for the CodexSimulator terminal assistant with Flow orchestration support."""
     
-    def __init__(self, use_mcp: bool = False, mcp_server_url: str = "http://localhost:8000"):
+    def __init__(self, use_mcp: bool = False, mcp_server_url: str = "http://localhost:8000", llm: Optional[Any] = None):
         """Initialize CodexSimulator with optional MCP support.
         
         Args:
             use_mcp: Whether to enable MCP integration
             mcp_server_url: URL of the MCP server
+            llm: LLM shared by all agents instead of Gemini, e.g. a scripted stand-in for benchmarks
         """
         self.use_mcp = use_mcp
         self.mcp_server_url = mcp_server_url
@@ -131,11 +137,17 @@ class CodexSimulator:
         
         # Initialize state tracker and LLM
         self.state_tracker = StateTracker()
-        self.llm = self._create_llm()
+        self._injected_llm = llm
+        self.llm = llm if llm is not None else self._create_llm()
         
         # Flow control
         self.flow_enabled = True 
         
+        # Agent executions show up as spans in the per-command trace,
+        # which also feeds the per-command token accounting
+        install_crewai_hooks()
+        install_token_accounting()
+        
         # Removed: asyncio.create_task(self._initialize_mcp())
         # MCP initialization will be handled by initialize_mcp_if_needed
     
@@ -721,6 +733,8 @@ You can also use natural language queries like:
     def _get_llm(self):
         """Get the LLM instance configured specifically for Google Gemini,
         using the custom google-generativeai SDK wrapper."""
+        if self._injected_llm is not None:
+            return self._injected_llm
         
         try:
             model_env_name = os.environ['MODEL'] 
@@ -929,6 +943,7 @@ You can also use natural language queries like:
             knowledge=knowledge, # This will be None
         )
 
+    @traced("crew.construct", kind="crew")
     def _create_terminal_crew(self, command: str, user_context: str, claude_context: str = "") -> Crew:
         """Create a dedicated crew for handling terminal commands with enhanced delegation"""
         # Create the terminal commander agent (this will be the manager)
@@ -951,6 +966,11 @@ You can also use natural language queries like:
         for ag in all_agents_in_this_crew_setup:
             remove_competing_delegation_tools(ag)
         
+        # Time each specialist tool call; the manager's delegate tool traces its own hops
+        for ag in [file_nav_agent, code_exec_agent, web_research_agent, pdf_analyst_agent]:
+            for tool in ag.tools or []:
+                trace_tool(tool)
+        
         # Create explicit agent references dictionary for delegation
         agent_registry = {
             "FileNavigator": file_nav_agent,
@@ -966,18 +986,35 @@ You can also use natural language queries like:
         print(f"Manager agent ('{terminal_agent.role}') tools set with custom delegate tool")
         
         # Create task with comprehensive context
-        task_description = (
-            f"Process the user's terminal command or query: '{command}'\n\n"
-            f"Current working directory: {self.cwd}\n"
-            f"User context: {user_context}\n"
-            f"Command history: {', '.join(self.command_history[-5:]) if self.command_history else 'None'}\n"
-            f"Session context: {claude_context[:1000] + '...' if len(claude_context) > 1000 else claude_context}\n\n"
+        instructions = (
             f"CRITICAL INSTRUCTION FOR MANAGER (YOU - {terminal_agent.role}): You are a manager. Your role is to understand the task and delegate sub-tasks to your specialist coworkers using the delegation tool.\n"
             f"Available specialists: FileNavigator (file operations), CodeExecutor (code execution), WebResearcher (web searches), PDFDocumentAnalyst (PDF analysis).\n"
             f"After receiving results from coworkers, synthesize them into a final answer for the user.\n"
             f"Provide a clear and helpful final response to the user's query, reflecting the action taken or delegated. "
             f"If the command involved a directory change, make sure to include the new directory path in your final response."
         )
+        # Keep the prompt within the task budget; CLAUDE.md goes first, then user context, then history
+        context = fit_to_budget([
+            ContextSection("command", command, required=True),
+            ContextSection("cwd", self.cwd, required=True),
+            ContextSection("instructions", instructions, required=True),
+            ContextSection("history", ', '.join(self.command_history[-5:]) if self.command_history else 'None', priority=3, keep="tail"),
+            ContextSection("user_context", user_context, priority=2),
+            ContextSection("claude_context", claude_context, priority=1, max_tokens=CLAUDE_CONTEXT_TOKENS)
+        ], task_context_budget())
+        span = get_tracer().current_span()
+        if span is not None:
+            span.set_attribute("context_tokens", context.tokens)
+            span.set_attribute("context_trimmed", ",".join(context.trimmed))
+        sections = context.sections
+        task_description = (
+            f"Process the user's terminal command or query: '{sections['command']}'\n\n"
+            f"Current working directory: {sections['cwd']}\n"
+            f"User context: {sections['user_context']}\n"
+            f"Command history: {sections['history']}\n"
+            f"Session context: {sections['claude_context']}\n\n"
+            f"{sections['instructions']}"
+        )
         
         task = Task(
             description=task_description,
@@ -1004,10 +1041,12 @@ You can also use natural language queries like:
         # Initialize MCP if needed
         await self.initialize_mcp_if_needed()
         
-        if self.flow_enabled:
-            return self._run_with_flow(command)
-        else:
-            return self._run_with_crew_only(command)  # Fallback to current implementation
+        # Root span of this command's trace, shown by the REPL "trace" command
+        with get_tracer().span("command", "command", command=command, mode="flow" if self.flow_enabled else "crew"):
+            if self.flow_enabled:
+                return self._run_with_flow(command)
+            else:
+                return self._run_with_crew_only(command)  # Fallback to current implementation
 
     def _run_with_flow(self, command: str) -> str:
         """Run command through flow orchestration"""
@@ -1023,7 +1062,8 @@ You can also use natural language queries like:
             print(f"Starting flow with command: {command}")
             
             # Kickoff Flow properly
-            flow_result = self.terminal_flow.kickoff()
+            with get_tracer().span("flow.kickoff", "flow"):
+                flow_result = self.terminal_flow.kickoff()
             
             # Extract response from flow result
             if isinstance(flow_result, dict):
@@ -1116,21 +1156,16 @@ You can also use natural language queries like:
         # Load context
         user_context = self._load_user_context()
         claude_context = self._load_claude_context()
-        # Enhanced check for help and commands request directly
-        help_keywords = ["help", "command", "available", "what can you do", "list all", "show me"]
-        command_lower = command.strip().lower() # Corrected to lower()
-        is_help_request = any(kw in command_lower for kw in help_keywords) and \
-                          ("command" in command_lower or "help" in command_lower or "available" in command_lower or "what can you do" in command_lower)
-        if command_lower in ["help", "commands", "list commands", "show commands", "available commands", 
-                             "what commands are available", "what can you do", "list all available commands i can run"] or is_help_request:
+        route = self._route_command(command)
+        if route == "help":
             result = self._get_available_commands()
             self._update_claude_md(command, result)
             return result
         # Handle directory changes
-        if command.strip().startswith("cd "): # Corrected to startswith()
+        if route == "cd":
             return self._handle_cd_command(command)
         # Handle basic pwd/directory query
-        if command_lower in ["pwd", "where am i", "what directory am i in", "current directory"]:
+        if route == "pwd":
             result = f"Current directory: {self.cwd}"
             self._update_claude_md(command, result)
             return result
@@ -1144,7 +1179,8 @@ You can also use natural language queries like:
                 'user_context': user_context,
                 'claude_context': claude_context
             }
-            crew_result = terminal_crew.kickoff(inputs=inputs)
+            with get_tracer().span("crew.kickoff", "crew"):
+                crew_result = terminal_crew.kickoff(inputs=inputs)
             # Handle CrewOutput object vs string - extract string content
             if hasattr(crew_result, 'raw_output'):
                 result = str(crew_result.raw_output)
@@ -1167,6 +1203,27 @@ You can also use natural language queries like:
             self._update_claude_md(command, error_result)
             return error_result
 
+    def _route_command(self, command: str) -> str:
+        """Classify a command as "help", "cd", "pwd" or "crew" (anything the crew handles)"""
+        with get_tracer().span("router.classify", "router") as span:
+            # Enhanced check for help and commands request directly
+            help_keywords = ["help", "command", "available", "what can you do", "list all", "show me"]
+            command_lower = command.strip().lower() # Corrected to lower()
+            is_help_request = any(kw in command_lower for kw in help_keywords) and \
+                              ("command" in command_lower or "help" in command_lower or "available" in command_lower or "what can you do" in command_lower)
+            if command_lower in ["help", "commands", "list commands", "show commands", "available commands", 
+                                 "what commands are available", "what can you do", "list all available commands i can run"] or is_help_request:
+                route = "help"
+            elif command.strip().startswith("cd "): # Corrected to startswith()
+                route = "cd"
+            elif command_lower in ["pwd", "where am i", "what directory am i in", "current directory"]:
+                route = "pwd"
+            else:
+                route = "crew"
+            if span is not None:
+                span.set_attribute("route", route)
+            return route
+
     def _handle_cd_command(self, command: str) -> str:
         """Handle directory changes explicitly"""
         directory = command.strip()[3:].strip()
@@ -1195,6 +1252,7 @@ You can also use natural language queries like:
             print(f"Warning: Could not load user preferences: {e}")
         return user_context
 
+    @traced("claude_md.load", kind="io")
     def _load_claude_context(self) -> str:
         """Load CLAUDE.md context"""
         claude_context = ""
@@ -1207,6 +1265,7 @@ You can also use natural language queries like:
                 print(f"Warning: Could not read CLAUDE.md: {e}")
         return claude_context
 
+    @traced("claude_md.ensure", kind="io")
     def _ensure_claude_md_exists(self):
         """Ensure that CLAUDE.md file exists in the current directory."""
         claude_md_path = os.path.join(self.cwd, "CLAUDE.md") # Ensure CWD is used
@@ -1227,6 +1286,7 @@ You can also use natural language queries like:
             with open(claude_md_path, "w", encoding="utf-8") as f:
                 f.write(initial_content)
 
+    @traced("claude_md.update", kind="io")
     def _update_claude_md(self, command: str, result: str):
         """Update the CLAUDE.md file with enhanced formatting"""
         claude_md_path = os.path.join(self.cwd, "CLAUDE.md") # Ensure CWD is used
@@ -1301,6 +1361,8 @@ You can also use natural language queries like:
 - `search [query]` - Search the web for information
 - `exit` or `quit` - Exit the terminal assistant
 - `help` or `commands` - Show this list of commands
+- `trace` - Show where the last command spent its time
+- `tokens` - Show the token usage of the last command and the session
 ## Natural Language Interface
 You can also use natural language queries like:
 - "Show files in current directory"
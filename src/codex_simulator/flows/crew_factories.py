@@ -8,6 +8,7 @@ from ..tools import (
     SafeShellTool, SerpAPITool, WebsiteTool
 )
 from ..tools.delegate_tool import DelegateTool, MCPDelegateTool
+from ..utils.tracing import trace_tool, traced
 
 class CrewFactory:
     """Factory for creating specialized crews with optional MCP integration"""
@@ -24,6 +25,11 @@ class CrewFactory:
             return wrap_tools_with_mcp(tool_names, self.mcp_client)
         return tools
     
+    def _traced_tools(self, tools: List[Any]) -> List[Any]:
+        """Record each tool call as a span in the command's trace"""
+        return [trace_tool(tool) for tool in tools]
+    
+    @traced("crew.construct.file", kind="crew")
     def create_file_crew(self, context: Dict[str, Any]) -> Crew:
         """Create a crew specialized for file operations with MCP support"""
         
@@ -34,7 +40,7 @@ class CrewFactory:
         ]
         
         # Wrap with MCP if enabled
-        tools = self._wrap_tools_if_mcp(tools)
+        tools = self._traced_tools(self._wrap_tools_if_mcp(tools))
         
         file_navigator = Agent(
             role='Expert File System Navigator',
@@ -65,11 +71,12 @@ class CrewFactory:
         
         return crew
     
+    @traced("crew.construct.code", kind="crew")
     def create_code_crew(self, context: Dict[str, Any]) -> Crew:
         """Create a crew specialized for code execution with MCP support"""
         
         tools = [SafeShellTool(), SafeFileReadTool(), SafeFileWriteTool()]
-        tools = self._wrap_tools_if_mcp(tools)
+        tools = self._traced_tools(self._wrap_tools_if_mcp(tools))
         
         code_executor = Agent(
             role='Secure Code Execution Specialist',
@@ -99,11 +106,12 @@ class CrewFactory:
         
         return crew
     
+    @traced("crew.construct.web", kind="crew")
     def create_web_crew(self, context: Dict[str, Any]) -> Crew:
         """Create a crew specialized for web research with MCP support"""
         
         tools = [SerpAPITool(), WebsiteTool()]
-        tools = self._wrap_tools_if_mcp(tools)
+        tools = self._traced_tools(self._wrap_tools_if_mcp(tools))
         
         web_researcher = Agent(
             role='Expert Web Research Specialist',
@@ -133,6 +141,7 @@ class CrewFactory:
         
         return crew
     
+    @traced("crew.construct.terminal", kind="crew")
     def create_terminal_crew(self, context: Dict[str, Any]) -> Crew:
         """Create a comprehensive crew for general terminal operations."""
         
@@ -143,7 +152,7 @@ class CrewFactory:
             role="File System Operations Expert",
             goal="Navigate file systems, read files, and manage directories safely",
             backstory="I am an expert in file system operations.",
-            tools=[SafeDirectoryTool(), SafeFileReadTool(), SafeFileWriteTool()],
+            tools=self._traced_tools([SafeDirectoryTool(), SafeFileReadTool(), SafeFileWriteTool()]),
             llm=self.llm,
             verbose=True
         )
@@ -153,7 +162,7 @@ class CrewFactory:
             role="Secure Code and Command Execution Specialist", 
             goal="Execute code and commands safely",
             backstory="I specialize in secure code execution.",
-            tools=[SafeShellTool(), SafeFileReadTool(), SafeFileWriteTool()],
+            tools=self._traced_tools([SafeShellTool(), SafeFileReadTool(), SafeFileWriteTool()]),
             llm=self.llm,
             verbose=True
         )
@@ -163,7 +172,7 @@ class CrewFactory:
             role="Internet Research Analyst",
             goal="Conduct web searches and provide information",
             backstory="I am an expert researcher.",
-            tools=[SerpAPITool(), WebsiteTool()],
+            tools=self._traced_tools([SerpAPITool(), WebsiteTool()]),
             llm=self.llm,
             verbose=True
         )
@@ -202,18 +211,18 @@ class CrewFactory:
         )
     
     async def _update_mcp_context(self, context: Dict[str, Any]):
-        """Update MCP server with current context"""
+        """Update MCP server with the parts of the current context that changed"""
         if self.mcp_client:
             try:
-                await self.mcp_client.update_state(
-                    state_updates={
-                        "current_command": context.get('command', ''),
-                        "cwd": context.get('cwd', ''),
-                        "timestamp": context.get('timestamp', ''),
-                        "context_data": context
-                    },
-                    scope="session"
-                )
+                # Flat keys let sync_state send only changed entries and let
+                # subscribers watch the "context." prefix
+                state = {
+                    "current_command": context.get('command', ''),
+                    "cwd": context.get('cwd', ''),
+                    "timestamp": context.get('timestamp', ''),
+                }
+                state.update({f"context.{key}": value for key, value in context.items()})
+                await self.mcp_client.sync_state(state, scope="session")
             except Exception as e:
                 print(f"Failed to update MCP context: {e}")
 
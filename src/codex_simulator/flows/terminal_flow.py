@@ -4,6 +4,7 @@ from crewai import Flow, or_
 from crewai.flow.flow import listen, start
 from ..flows.crew_factories import CrewFactory
 from ..flows.state_manager import StateTracker
+from ..utils.tracing import get_tracer
 
 class TerminalAssistantFlow(Flow):
     """Flow for handling terminal assistant operations with intelligent routing."""
@@ -27,7 +28,14 @@ class TerminalAssistantFlow(Flow):
         self.state["parsed_command"] = command
         self.state["timestamp"] = datetime.now().isoformat()
         
-        # Classify command intent
+        with get_tracer().span("router.classify", "router") as span:
+            route = self._classify(command)
+            if span is not None:
+                span.set_attribute("route", route)
+        return route
+    
+    def _classify(self, command: str) -> str:
+        """Classify command intent by keyword."""
         if any(keyword in command.lower() for keyword in ["help", "commands", "what can you do"]):
             return "simple_query"
         elif any(keyword in command.lower() for keyword in ["list", "ls", "files", "directory"]):
@@ -161,6 +169,8 @@ class TerminalAssistantFlow(Flow):
 - `search [query]` - Search the web for information
 - `exit` or `quit` - Exit the terminal assistant
 - `help` or `commands` - Show this list of commands
+- `trace` - Show where the last command spent its time
+- `tokens` - Show the token usage of the last command and the session
 ## Natural Language Interface
 You can also use natural language queries like:
 - "Show files in current directory"
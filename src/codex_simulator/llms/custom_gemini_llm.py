@@ -7,6 +7,9 @@ from langchain_core.callbacks.manager import CallbackManagerForLLMRun
 from langchain_core.language_models.llms import LLM
 from pydantic.v1 import Field, root_validator # Updated import for Pydantic v1 compatibility
 
+from ..utils.token_accounting import get_token_ledger
+from ..utils.tracing import Span, detached_span, get_tracer
+
 class CustomGeminiLLM(LLM):
     """
     Custom LangChain LLM wrapper for Google Gemini API using the google-generativeai client.
@@ -62,8 +65,20 @@ class CustomGeminiLLM(LLM):
         **kwargs: Any,
     ) -> str:
         """
-        Call out to Gemini's generate_content method.
+        Call out to Gemini's generate_content method, recorded as an llm span
+        with the token counts Gemini reports. With tracing off the counts go
+        straight to the token ledger instead.
         """
+        attributes = {"model": self.model, "prompt_chars": len(prompt)}
+        with get_tracer().span(f"llm:{self.model}", "llm", **attributes) as span:
+            call_span = span if span is not None else detached_span(f"llm:{self.model}", "llm", **attributes)
+            text = self._generate_content(prompt, stop, call_span, **kwargs)
+            call_span.set_attribute("completion_chars", len(text))
+            if span is None:
+                get_token_ledger().record_untraced(call_span)
+            return text
+
+    def _generate_content(self, prompt: str, stop: Optional[List[str]], span: Span, **kwargs: Any) -> str:
         generation_config_params = {"temperature": self.temperature}
         
         if "temperature" in kwargs: # Allow overriding temperature
@@ -82,6 +97,7 @@ class CustomGeminiLLM(LLM):
                 generation_config=generation_config,
                 **kwargs 
             )
+            self._record_usage(span, response)
             
             if response.text:
                 return response.text
@@ -105,8 +121,19 @@ class CustomGeminiLLM(LLM):
             return "Error: Empty response from Gemini API or content blocked."
 
         except Exception as e:
+            span.record_error(e)
             return f"Error generating content with Gemini: {e}"
 
+    @staticmethod
+    def _record_usage(span: Span, response: Any):
+        """Copy Gemini's usage_metadata token counts onto the span"""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        span.set_attribute("prompt_tokens", getattr(usage, "prompt_token_count", None))
+        span.set_attribute("completion_tokens", getattr(usage, "candidates_token_count", None))
+        span.set_attribute("total_tokens", getattr(usage, "total_token_count", None))
+
 
     @property
     def _identifying_params(self) -> Mapping[str, Any]:
@@ -9,6 +9,8 @@ from datetime import datetime
 from .crew import CodexSimulator
 # Keep the import but we won't use it actively
 from .utils.delegation_fix import apply_delegation_fix
+from .utils.tracing import format_flame, get_tracer
+from .utils.token_accounting import format_token_report, get_token_ledger
 
 warnings.filterwarnings("ignore", category=SyntaxWarning, module="pysbd")
 
@@ -71,6 +73,18 @@ def run_report(topic='AI LLMs'):
             traceback.print_exc()
         print("\nTrying run_direct_py312.py might be more reliable for now.")
 
+# REPL commands printing where the last command spent its time and its tokens
+TRACE_COMMAND = "trace"
+TOKENS_COMMAND = "tokens"
+
+def print_last_trace():
+    """Print a flame-style breakdown of the last command's trace"""
+    print(format_flame(get_tracer().last_trace))
+
+def print_token_usage():
+    """Print the last command's token usage by agent and tool, and session totals"""
+    print(format_token_report(get_token_ledger()))
+
 def run_terminal_assistant(show_warning=True):
     """Run the terminal assistant in interactive mode"""
     crew = CodexSimulator()
@@ -83,6 +97,7 @@ def run_terminal_assistant(show_warning=True):
         print("you should review any commands before allowing them to execute.")
         print("The assistant will only run in the current directory and subdirectories.")
         print("Type 'exit' or 'quit' to exit the assistant.")
+        print(f"Type '{TRACE_COMMAND}' to see where the last command spent its time, '{TOKENS_COMMAND}' for its token usage.")
         print("=" * 80)
     
     print("Claude Code Terminal Assistant initialized.")
@@ -95,6 +110,12 @@ def run_terminal_assistant(show_warning=True):
             if command.lower() in ['exit', 'quit']:
                 print("Exiting Claude Code Terminal Assistant. Goodbye!")
                 break
+            if command.strip().lower() == TRACE_COMMAND:
+                print_last_trace()
+                continue
+            if command.strip().lower() == TOKENS_COMMAND:
+                print_token_usage()
+                continue
                 
             result = crew.terminal_assistant(command)
             print(f"\n{result}")
@@ -146,6 +167,13 @@ async def run_terminal_assistant_with_flows_async():
                 if not command:
                     continue
                 
+                if command.lower() == TRACE_COMMAND:
+                    print_last_trace()
+                    continue
+                if command.lower() == TOKENS_COMMAND:
+                    print_token_usage()
+                    continue
+                
                 # Process command
                 result = await assistant.terminal_assistant(command)
                 print(result)
@@ -177,6 +205,12 @@ def run_hybrid_mode():
         command = input("\n💻 Enter command: ").strip()
         if command.lower() in ['quit', 'exit']:
             break
+        if command.lower() == TRACE_COMMAND:
+            print_last_trace()
+            continue
+        if command.lower() == TOKENS_COMMAND:
+            print_token_usage()
+            continue
         
         # Intelligent selection based on command complexity
         complexity_score = simulator._assess_command_complexity(command)
@@ -227,17 +261,14 @@ def test():
     except Exception as e:
         raise Exception(f"An error occurred while testing the crew: {e}")
 
-def run_mcp_server_standalone():
-    """Run standalone MCP server for development"""
-    from .mcp.server import run_mcp_server
+def _standalone_mcp_tools():
+    """Tool functions and registration options for the standalone MCP server"""
     from .tools import (
         SafeDirectoryTool, SafeFileReadTool, SafeFileWriteTool,
         SafeShellTool, SerpAPITool, WebsiteTool
     )
     from .tools.pdf_reader_tool import PDFReaderTool # Added import
     
-    print("🚀 Starting standalone MCP server...")
-    
     # Create tool instances for registration
     tools = {
         "safe_directory_tool": SafeDirectoryTool()._run,
@@ -249,11 +280,64 @@ def run_mcp_server_standalone():
         "pdf_reader_tool": PDFReaderTool()._run # Added PDFReaderTool
     }
     
+    def _path(key: str):
+        return lambda args: [os.path.abspath(args.get(key, "."))]
+    
+    def _pdf_path(args):
+        argument = args.get("argument")
+        path = argument.get("pdf_path", "") if isinstance(argument, dict) else argument
+        return [os.path.abspath(path or ".")]
+    
+    # Read-only tools are cached and coalesced; writes invalidate what they touch
+    tool_options = {
+        "safe_directory_tool": {"idempotent": True, "cache_ttl": 5.0, "depends_on": _path("directory_path")},
+        "safe_file_read_tool": {"idempotent": True, "cache_ttl": 30.0, "depends_on": _path("file_path")},
+        "pdf_reader_tool": {"idempotent": True, "cache_ttl": 300.0, "depends_on": _pdf_path},
+        "safe_file_write_tool": {"invalidates": _path("file_path")},
+        "safe_shell_tool": {"invalidates": lambda args: ["*"]}
+    }
+    # Text extraction runs in the process pool
+    cpu_bound_tools = {"pdf_reader_tool"}
+    return tools, tool_options, cpu_bound_tools
+
+def _configure_standalone_mcp_server(server):
+    """Register the standalone tools on one worker's MCPServer"""
+    tools, tool_options, cpu_bound_tools = _standalone_mcp_tools()
+    for tool_name, tool_func in tools.items():
+        kind = "cpu" if tool_name in cpu_bound_tools else None
+        server.register_tool(tool_name, tool_func, kind=kind, **tool_options.get(tool_name, {}))
+
+def run_mcp_server_standalone():
+    """Run standalone MCP server for development"""
+    from .mcp.server import run_mcp_server
+    
+    print("🚀 Starting standalone MCP server...")
+    
+    # MCP_WORKERS > 1 serves the port from several processes sharing SQLite state
+    workers = int(os.getenv("MCP_WORKERS", "1"))
+    if workers > 1:
+        from .mcp.workers import run_mcp_server_workers
+        run_mcp_server_workers(
+            host="localhost",
+            port=8000,
+            workers=workers,
+            state_path=os.getenv("MCP_SHARED_STATE", "mcp_state.sqlite3"),
+            configure=_configure_standalone_mcp_server,
+            uds=os.getenv("MCP_UDS")
+        )
+        return
+    
+    tools, tool_options, cpu_bound_tools = _standalone_mcp_tools()
+    
     # Run server with registered tools
     asyncio.run(run_mcp_server(
         host="localhost",
         port=8000,
-        tools=tools
+        tools=tools,
+        cpu_bound_tools=cpu_bound_tools,
+        tool_options=tool_options,
+        state_dir=os.getenv("MCP_STATE_DIR"),  # Persist shared context across restarts when set
+        uds=os.getenv("MCP_UDS")  # Also listen on this Unix socket for agents on the same host
     ))
 
 def terminal_assistant():
@@ -7,31 +7,50 @@ context sharing, and unified message routing across agents in the CodexSimulator
 
 from .schemas import (
     MCPMessage, MCPToolInvocationRequest, MCPToolInvocationResponse,
+    MCPToolBatchRequest, MCPToolBatchResponse, MCPToolResultChunk,
     MCPContextFetchRequest, MCPContextFetchResponse,
     MCPStateUpdateRequest, MCPStateUpdateResponse,
     MCPErrorResponse, MCPHeartbeatMessage,
-    MCPConnectionConfig, MCPServerInfo,
-    validate_mcp_message, MCP_VERSION
+    MCPSubscribeRequest, MCPSubscribeResponse, MCPContextDeltaMessage,
+    MCPConnectionConfig, MCPServerInfo, MCPAgentInfo,
+    validate_mcp_message, validate_mcp_message_json, MCP_VERSION
 )
 
 from .server import MCPServer, run_mcp_server
-from .client import MCPClient, MCPToolWrapper, MCPClientPool, create_mcp_client, wrap_tools_with_mcp
+from .scheduler import MCPToolScheduler, MCPServerBusyError
+from .result_cache import MCPResultCache, IdempotencyCache
+from .context_store import ContextStore, InMemoryContextStore, ScopeLimits
+from .persistence import StatePersistence
+from .sqlite_store import SQLiteContextStore, SQLiteIdempotencyCache
+from .event_bus import MCPEventBus, SQLiteEventBus
+from .outbound import OutboundQueue
+from .sync_bridge import EventLoopThread, get_sync_bridge
+from .workers import run_mcp_server_workers
+from .client import (
+    MCPClient, MCPToolWrapper, MCPClientPool, MCPClientStats, MCPRequestError,
+    create_mcp_client, wrap_tools_with_mcp
+)
 
 __all__ = [
     # Schemas
     'MCPMessage', 'MCPToolInvocationRequest', 'MCPToolInvocationResponse',
+    'MCPToolBatchRequest', 'MCPToolBatchResponse', 'MCPToolResultChunk',
     'MCPContextFetchRequest', 'MCPContextFetchResponse',
     'MCPStateUpdateRequest', 'MCPStateUpdateResponse',
     'MCPErrorResponse', 'MCPHeartbeatMessage',
-    'MCPConnectionConfig', 'MCPServerInfo',
-    'validate_mcp_message', 'MCP_VERSION',
+    'MCPSubscribeRequest', 'MCPSubscribeResponse', 'MCPContextDeltaMessage',
+    'MCPConnectionConfig', 'MCPServerInfo', 'MCPAgentInfo',
+    'validate_mcp_message', 'validate_mcp_message_json', 'MCP_VERSION',
     
     # Server
-    'MCPServer', 'run_mcp_server',
+    'MCPServer', 'run_mcp_server', 'MCPToolScheduler', 'MCPServerBusyError',
+    'MCPResultCache', 'IdempotencyCache', 'ContextStore', 'InMemoryContextStore', 'ScopeLimits',
+    'StatePersistence', 'SQLiteContextStore', 'SQLiteIdempotencyCache', 'MCPEventBus', 'SQLiteEventBus',
+    'OutboundQueue', 'run_mcp_server_workers',
     
     # Client
-    'MCPClient', 'MCPToolWrapper', 'MCPClientPool',
-    'create_mcp_client', 'wrap_tools_with_mcp'
+    'MCPClient', 'MCPToolWrapper', 'MCPClientPool', 'MCPClientStats', 'MCPRequestError',
+    'create_mcp_client', 'wrap_tools_with_mcp', 'EventLoopThread', 'get_sync_bridge'
 ]
 
 # Version information
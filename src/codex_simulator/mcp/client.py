@@ -4,41 +4,164 @@ Client adapter for routing tool calls and context requests through MCP server.
 """
 
 import asyncio
+import importlib.util
 import json
+import random
+import time
 import uuid
 import aiohttp
 import websockets
-from typing import Dict, Any, List, Optional, Union, Callable
+from websockets.exceptions import ConnectionClosed
+from typing import Dict, Any, AsyncIterator, Awaitable, List, Optional, Tuple, Union, Callable
+from dataclasses import dataclass, asdict
 from datetime import datetime
 import logging
 from contextlib import asynccontextmanager
 
 from .schemas import (
     MCPMessage, MCPToolInvocationRequest, MCPToolInvocationResponse,
+    MCPToolBatchRequest, MCPToolBatchResponse, MCPToolResultChunk,
     MCPContextFetchRequest, MCPContextFetchResponse,
     MCPStateUpdateRequest, MCPStateUpdateResponse,
     MCPErrorResponse, MCPHeartbeatMessage,
-    MCPConnectionConfig, validate_mcp_message
+    MCPSubscribeRequest, MCPSubscribeResponse, MCPContextDeltaMessage,
+    MCPConnectionConfig, MCPAgentInfo
+)
+from .load import ProcessLoadSampler, IN_FLIGHT, QUEUE_DEPTH
+from .sync_bridge import run_on_loop, run_sync
+from .local import LocalConnection, find_local_server, is_local_url
+from .compression import available_content_encodings, compress, negotiate_content_encoding
+from .codec import (
+    MCPCodec, JSON_CODEC, get_codec, preferred_encodings,
+    codec_for_subprotocols, codec_for_content_type, join_result_chunks
 )
 
 logger = logging.getLogger(__name__)
 
+try:
+    import httpx
+except ImportError:  # httpx is optional; it is only used for HTTP/2
+    httpx = None
+
+# Failures where the request may not have reached the server or its answer was lost
+_TRANSIENT_ERRORS: Tuple[type, ...] = (aiohttp.ClientConnectionError, asyncio.TimeoutError, ConnectionError)
+if httpx is not None:
+    _TRANSIENT_ERRORS += (httpx.TransportError,)
+
+# Extra seconds a synchronous caller waits beyond the request timeout
+SYNC_GRACE_PERIOD = 5.0
+
+# Characters per tool_result_chunk frame when streaming tool results
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+UNIX_URL_PREFIX = "unix://"
+
+def unix_socket_path(server_url: str) -> Optional[str]:
+    """Socket path of a unix:///path/to/mcp.sock server URL, or None for other URLs"""
+    if not server_url.startswith(UNIX_URL_PREFIX):
+        return None
+    return server_url[len(UNIX_URL_PREFIX):]
+
+class MCPRequestError(RuntimeError):
+    """Raised when the MCP server answers a request with an error response"""
+    
+    def __init__(
+        self,
+        error_code: str,
+        error_message: str,
+        details: Optional[Dict[str, Any]] = None,
+        status: Optional[int] = None
+    ):
+        super().__init__(f"{error_code}: {error_message}")
+        self.error_code = error_code
+        self.error_message = error_message
+        self.details = details or {}
+        # HTTP status when the error came from the HTTP transport
+        self.status = status
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to a fraction of requests.
+    
+    Each request deposits ratio tokens and each retry spends one, so a failing
+    server sees at most ratio extra load from retries instead of retry_attempts
+    times the load. The bucket starts full so isolated failures are still retried.
+    """
+    
+    def __init__(self, ratio: float = 0.2, capacity: float = 10.0):
+        self.ratio = ratio
+        self.capacity = capacity
+        self.tokens = capacity
+    
+    def deposit(self):
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+    
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
 class MCPClient:
     """MCP Client for communicating with MCP server"""
     
-    def __init__(self, config: MCPConnectionConfig, agent_id: str):
+    def __init__(
+        self,
+        config: MCPConnectionConfig,
+        agent_id: str,
+        load_provider: Optional[Callable[[], Dict[str, float]]] = None,
+        busy_threshold: int = 8
+    ):
+        """
+        Args:
+            load_provider: Returns extra heartbeat load metrics from the host agent,
+                e.g. {"queue_depth": pending_tasks}
+            busy_threshold: Outstanding requests at which the agent reports "busy"
+        """
         self.config = config
         self.agent_id = agent_id
+        self.load_provider = load_provider
+        self.busy_threshold = busy_threshold
+        self._load_sampler = ProcessLoadSampler()
         self.session: Optional[aiohttp.ClientSession] = None
+        # Set instead of using session for requests when HTTP/2 is enabled and available
+        self._http2_client = None
+        # Loop the connection was opened on; other loops (e.g. the sync bridge) get their own sessions
+        self._home_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        self._retry_budget = RetryBudget(config.retry_budget_ratio)
+        # unix:// servers are reached through their socket file; requests still need an HTTP URL
+        self._unix_socket = unix_socket_path(config.server_url)
+        self._base_url = "http://localhost" if self._unix_socket else config.server_url
+        # Request body encoding, learned from the Accept-Encoding the server sends back
+        self._request_encoding: Optional[str] = None
         self.websocket: Optional[websockets.WebSocketServerProtocol] = None
         self.is_connected = False
         self.heartbeat_task: Optional[asyncio.Task] = None
+        self._receiver_task: Optional[asyncio.Task] = None
         self._response_futures: Dict[str, asyncio.Future] = {}
+        # Frames of chunked tool results, per request, in arrival order
+        self._chunk_queues: Dict[str, asyncio.Queue] = {}
+        self._codec: MCPCodec = JSON_CODEC
+        # Locally mirrored context per scope, kept current by subscription pushes
+        self.context_cache: Dict[str, Dict[str, Any]] = {}
+        self.context_versions: Dict[str, int] = {}
+        self._context_callbacks: List[Callable[[MCPContextDeltaMessage], Any]] = []
+        # Last state pushed with sync_state, per scope, used to compute diffs
+        self._synced_state: Dict[str, Dict[str, Any]] = {}
+        # Store version the server acknowledged for the last sync_state, per scope
+        self._synced_versions: Dict[str, int] = {}
         
     async def connect(self, use_websocket: bool = True):
         """Connect to MCP server"""
         try:
-            if use_websocket:
+            self._home_loop = asyncio.get_running_loop()
+            local_server = self._find_local_server()
+            if local_server is not None:
+                # Same semantics as a WebSocket connection, without the socket
+                await self._connect_local(local_server)
+                use_websocket = True
+            elif use_websocket:
                 await self._connect_websocket()
             else:
                 await self._connect_http()
@@ -66,75 +189,307 @@ class MCPClient:
             except asyncio.CancelledError:
                 pass
         
-        # Close WebSocket
+        # Close WebSocket; the receive loop fails any pending requests as it exits
         if self.websocket:
             await self.websocket.close()
             self.websocket = None
         
+        if self._receiver_task:
+            self._receiver_task.cancel()
+            try:
+                await self._receiver_task
+            except asyncio.CancelledError:
+                pass
+            self._receiver_task = None
+        
         # Close HTTP session
         if self.session:
             await self.session.close()
             self.session = None
+        if self._http2_client is not None:
+            await self._http2_client.aclose()
+            self._http2_client = None
+        await self._close_loop_sessions()
         
         logger.info(f"MCP Client {self.agent_id} disconnected")
     
+    def _find_local_server(self):
+        """The in-process server to connect to, or None to use the network"""
+        if self.config.transport == "network":
+            return None
+        server = find_local_server(self.config.server_url)
+        if server is None and (self.config.transport == "local" or is_local_url(self.config.server_url)):
+            raise ConnectionError(
+                f"No MCP server in this process and event loop serves {self.config.server_url}"
+            )
+        return server
+    
+    async def _connect_local(self, server):
+        """Connect in-process; the connection stands in for the WebSocket"""
+        self.websocket = await server.connect_local(self.agent_id, validate=self.config.local_validation)
+        self._codec = self.websocket.codec
+        self._receiver_task = asyncio.create_task(self._websocket_message_handler())
+    
     async def _connect_websocket(self):
         """Connect via WebSocket"""
-        ws_url = self.config.server_url.replace("http://", "ws://").replace("https://", "wss://")
+        ws_url = self._base_url.replace("http://", "ws://").replace("https://", "wss://")
         ws_url = f"{ws_url}/ws/{self.agent_id}"
         
-        self.websocket = await websockets.connect(ws_url)
+        # Offer encodings as subprotocols; the server picks the first it supports
+        offered = [get_codec(name).subprotocol for name in preferred_encodings(self.config.encoding)]
+        compression = "deflate" if self.config.compression else None
+        if self._unix_socket:
+            self.websocket = await websockets.unix_connect(
+                self._unix_socket, uri=ws_url, subprotocols=offered, compression=compression
+            )
+        else:
+            self.websocket = await websockets.connect(ws_url, subprotocols=offered, compression=compression)
+        self._codec = codec_for_subprotocols([self.websocket.subprotocol or ""])
         
         # Start message handler
-        asyncio.create_task(self._websocket_message_handler())
+        self._receiver_task = asyncio.create_task(self._websocket_message_handler())
     
-    async def _connect_http(self):
-        """Connect via HTTP"""
-        timeout = aiohttp.ClientTimeout(total=self.config.timeout)
+    def _http_headers(self) -> Dict[str, str]:
+        """Headers sent with every HTTP request"""
         headers = {}
         
         if self.config.api_key:
             headers["Authorization"] = f"Bearer {self.config.api_key}"
         
-        self.session = aiohttp.ClientSession(
-            timeout=timeout,
-            headers=headers
+        # Responses are negotiated per request; bodies are sent compact only when asked for
+        encodings = preferred_encodings(self.config.encoding)
+        headers["Accept"] = ", ".join(get_codec(name).content_type for name in encodings)
+        # Otherwise the HTTP library advertises, and transparently decodes, what it supports
+        if not self.config.compression:
+            headers["Accept-Encoding"] = "identity"
+        return headers
+    
+    def _create_http_session(self) -> aiohttp.ClientSession:
+        """HTTP session bound to the running event loop"""
+        # Reuse keep-alive connections instead of reconnecting per call under load
+        if self._unix_socket:
+            connector = aiohttp.UnixConnector(
+                path=self._unix_socket,
+                limit=self.config.max_connections,
+                limit_per_host=self.config.max_connections_per_host,
+                keepalive_timeout=self.config.keepalive_timeout
+            )
+        else:
+            connector = aiohttp.TCPConnector(
+                limit=self.config.max_connections,
+                limit_per_host=self.config.max_connections_per_host,
+                keepalive_timeout=self.config.keepalive_timeout,
+                ttl_dns_cache=self.config.dns_cache_ttl
+            )
+        return aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=self.config.timeout),
+            headers=self._http_headers(),
+            connector=connector
         )
     
+    async def _connect_http(self):
+        """Connect via HTTP"""
+        headers = self._http_headers()
+        self._codec = get_codec(self.config.encoding) if self.config.encoding != "auto" else JSON_CODEC
+        self.session = self._create_http_session()
+        
+        # HTTP/2 needs TLS, which a Unix socket does without
+        if self.config.http2 and not self._unix_socket:
+            if httpx is not None and importlib.util.find_spec("h2") is not None:
+                # Negotiated through TLS ALPN; plain http:// servers keep using HTTP/1.1
+                self._http2_client = httpx.AsyncClient(
+                    http2=True,
+                    headers=headers,
+                    timeout=self.config.timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.config.max_connections,
+                        max_keepalive_connections=self.config.max_connections_per_host,
+                        keepalive_expiry=self.config.keepalive_timeout
+                    )
+                )
+            else:
+                logger.warning("HTTP/2 requested but httpx[http2] is not installed; using HTTP/1.1 keep-alive")
+    
+    def _on_home_loop(self) -> bool:
+        """Whether the caller runs on the loop that owns the WebSocket and main session"""
+        return self._home_loop is None or asyncio.get_running_loop() is self._home_loop
+    
+    def _http_session(self) -> aiohttp.ClientSession:
+        """HTTP session usable from the running loop"""
+        if self._on_home_loop():
+            if not self.session:
+                raise ConnectionError("HTTP session not initialized")
+            return self.session
+        
+        # Requests bridged from another loop cannot touch the home loop's connections
+        if not self.is_connected:
+            raise ConnectionError("MCP client is not connected")
+        loop = asyncio.get_running_loop()
+        session = self._loop_sessions.get(loop)
+        if session is None or session.closed:
+            session = self._loop_sessions[loop] = self._create_http_session()
+        return session
+    
+    async def _close_loop_sessions(self):
+        """Close sessions opened on other loops, each on its own loop"""
+        sessions, self._loop_sessions = self._loop_sessions, {}
+        current = asyncio.get_running_loop()
+        for loop, session in sessions.items():
+            if loop is current:
+                await session.close()
+            elif loop.is_running():
+                try:
+                    await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(session.close(), loop))
+                except Exception as e:
+                    logger.debug(f"Closing bridged HTTP session failed: {e}")
+    
+    def run_sync(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run one of this client's coroutines from synchronous code.
+        
+        The coroutine runs on the shared sync-bridge loop thread and talks to the
+        server over HTTP, so the caller's own event loop is neither re-entered nor
+        needed. An in-process server is only reachable from the loop the client
+        connected on, so with the local transport the coroutine runs there instead,
+        which must then be running in another thread. Waits at most timeout seconds,
+        by default the client timeout plus a grace period for retries.
+        """
+        timeout = timeout if timeout is not None else self.config.timeout + SYNC_GRACE_PERIOD
+        if isinstance(self.websocket, LocalConnection):
+            return run_on_loop(coro, self._home_loop, timeout)
+        return run_sync(coro, timeout)
+    
     async def _websocket_message_handler(self):
         """Handle incoming WebSocket messages"""
+        # websockets yields each complete frame as str (text) or bytes (binary)
         try:
-            async for message in self.websocket:
-                if message.type == websockets.MessageType.TEXT:
-                    try:
-                        data = json.loads(message.data)
-                        response = validate_mcp_message(data)
-                        
-                        # Handle response to pending request
-                        request_id = getattr(response, 'request_id', None)
-                        if request_id and request_id in self._response_futures:
-                            future = self._response_futures.pop(request_id)
-                            if not future.done():
-                                future.set_result(response)
-                        
-                    except Exception as e:
-                        logger.error(f"Error processing WebSocket message: {e}")
+            async for frame in self.websocket:
+                # One validating pass over the frame; JSON is validated straight from the text
+                try:
+                    message = self._codec.decode(frame)
+                except ValueError as e:
+                    logger.error(f"Malformed WebSocket message for agent {self.agent_id}: {e}")
+                    self._fail_request(frame, e)
+                    continue
+                
+                if isinstance(message, MCPContextDeltaMessage):
+                    self._apply_context_delta(message)
+                    continue
+                
+                request_id = getattr(message, "request_id", None)
+                queue = self._chunk_queues.get(request_id) if request_id else None
+                if queue is not None:
+                    # Never block the receive loop
+                    queue.put_nowait(message)
+                    continue
+                future = self._response_futures.pop(request_id, None) if request_id else None
+                if future is None or future.done():
+                    continue
+                
+                if isinstance(message, MCPErrorResponse):
+                    future.set_exception(MCPRequestError(
+                        message.error_code, message.error_message, message.details
+                    ))
+                else:
+                    future.set_result(message)
                         
-        except websockets.exceptions.ConnectionClosed:
+        except ConnectionClosed:
             logger.info(f"WebSocket connection closed for agent {self.agent_id}")
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"WebSocket message handler error: {e}")
+        finally:
+            self.is_connected = False
+            self._fail_pending_requests(
+                ConnectionError(f"WebSocket connection lost for agent {self.agent_id}")
+            )
+    
+    def _fail_request(self, frame: Any, error: Exception):
+        """Fail the pending request an undecodable frame answers, if its request_id can be read"""
+        try:
+            fields = self._codec.loads(frame)
+        except Exception:
+            return
+        request_id = fields.get("request_id") if isinstance(fields, dict) else None
+        future = self._response_futures.pop(request_id, None) if request_id else None
+        if future is not None and not future.done():
+            future.set_exception(error)
+        queue = self._chunk_queues.get(request_id) if request_id else None
+        if queue is not None:
+            queue.put_nowait(error)
+    
+    def _apply_context_delta(self, delta: MCPContextDeltaMessage):
+        """Fold a pushed context change into the local mirror and notify listeners"""
+        cache = self.context_cache.setdefault(delta.scope, {})
+        cache.update(delta.changes)
+        for key in delta.deleted_keys:
+            cache.pop(key, None)
+        self.context_versions[delta.scope] = max(self.context_versions.get(delta.scope, 0), delta.version)
+        
+        for callback in list(self._context_callbacks):
+            try:
+                result = callback(delta)
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result)
+            except Exception as e:
+                logger.error(f"Context callback error: {e}")
+    
+    def _fail_pending_requests(self, error: Exception):
+        """Fail every request still waiting for a response"""
+        futures = list(self._response_futures.values())
+        self._response_futures.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+        for queue in self._chunk_queues.values():
+            queue.put_nowait(error)
+    
+    def collect_load_metrics(self) -> Dict[str, float]:
+        """Current load of this agent: outstanding requests, queued work, RSS and CPU"""
+        metrics = {
+            IN_FLIGHT: float(len(self._response_futures) + len(self._chunk_queues)),
+            QUEUE_DEPTH: 0.0,
+            **self._load_sampler.sample()
+        }
+        if self.load_provider is not None:
+            try:
+                metrics.update({key: float(value) for key, value in self.load_provider().items()})
+            except Exception as e:
+                logger.error(f"Load provider error: {e}")
+        return metrics
+    
+    def _load_status(self, load_metrics: Dict[str, float]) -> str:
+        """Heartbeat status derived from the outstanding and queued work"""
+        backlog = load_metrics[IN_FLIGHT] + load_metrics[QUEUE_DEPTH]
+        if backlog >= self.busy_threshold:
+            return "busy"
+        return "active" if backlog else "idle"
+    
+    async def list_agents(self, limit: Optional[int] = None) -> List[MCPAgentInfo]:
+        """Agents connected to the server, least loaded first"""
+        session = self.session or self._create_http_session()
+        try:
+            params = {"limit": limit} if limit is not None else None
+            async with session.get(f"{self._base_url}/agents", params=params) as response:
+                response.raise_for_status()
+                return [MCPAgentInfo.model_validate(agent) for agent in await response.json()]
+        finally:
+            if session is not self.session:
+                await session.close()
     
     async def _heartbeat_loop(self):
         """Send periodic heartbeat messages"""
         try:
             while self.is_connected and self.websocket:
+                load_metrics = self.collect_load_metrics()
                 heartbeat = MCPHeartbeatMessage(
                     agent_id=self.agent_id,
-                    status="active"
+                    status=self._load_status(load_metrics),
+                    load_metrics=load_metrics
                 )
                 
-                await self.websocket.send(heartbeat.json())
+                await self.websocket.send(self._codec.encode(heartbeat))
                 await asyncio.sleep(self.config.heartbeat_interval)
                 
         except asyncio.CancelledError:
@@ -147,9 +502,15 @@ class MCPClient:
         tool_name: str,
         arguments: Dict[str, Any],
         context: Optional[Dict[str, Any]] = None,
-        timeout: Optional[int] = None
+        timeout: Optional[int] = None,
+        chunk_size: Optional[int] = None
     ) -> MCPToolInvocationResponse:
-        """Invoke a tool through MCP server"""
+        """
+        Invoke a tool through MCP server.
+        
+        With chunk_size, a large result is streamed over WebSocket in chunks and
+        reassembled here; use stream_tool to consume the chunks as they arrive.
+        """
         
         request = MCPToolInvocationRequest(
             request_id=str(uuid.uuid4()),
@@ -157,29 +518,195 @@ class MCPClient:
             tool_name=tool_name,
             arguments=arguments,
             context=context,
-            timeout=timeout or self.config.timeout
+            timeout=timeout or self.config.timeout,
+            chunk_size=chunk_size
         )
         
-        if self.websocket:
+        if not (self.websocket and self._on_home_loop()):
+            return await self._send_http_request("/invoke_tool", request)
+        if not chunk_size:
             return await self._send_websocket_request(request)
+        
+        chunks: List[str] = []
+        async for message in self._receive_tool_result(request):
+            if isinstance(message, MCPToolResultChunk):
+                chunks.append(message.data)
+            else:
+                response = message
+        if response.chunks is not None:
+            response.result = join_result_chunks(chunks, response.chunk_encoding)
+        return response
+    
+    async def stream_tool(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        context: Optional[Dict[str, Any]] = None,
+        timeout: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        Yield a tool's result as text, chunk by chunk, as it arrives.
+        
+        Results that are not strings arrive as JSON text. Without a WebSocket the
+        whole result is fetched over HTTP and yielded at once.
+        
+        Raises:
+            RuntimeError: If the tool fails
+        """
+        request = MCPToolInvocationRequest(
+            request_id=str(uuid.uuid4()),
+            agent_id=self.agent_id,
+            tool_name=tool_name,
+            arguments=arguments,
+            context=context,
+            timeout=timeout or self.config.timeout,
+            chunk_size=chunk_size
+        )
+        
+        if self.websocket and self._on_home_loop():
+            messages = self._receive_tool_result(request)
         else:
-            return await self._send_http_request("/invoke_tool", request)
+            messages = self._single_response(self._send_http_request("/invoke_tool", request))
+        
+        try:
+            async for message in messages:
+                if isinstance(message, MCPToolResultChunk):
+                    yield message.data
+                elif not message.success:
+                    raise RuntimeError(f"Tool execution failed: {message.error_message}")
+                elif message.chunks is None and message.result is not None:
+                    # Small results come back whole in the final response
+                    yield message.result if isinstance(message.result, str) else json.dumps(message.result)
+        finally:
+            # Stop listening for chunks right away when the caller stops early or the tool failed
+            await messages.aclose()
+    
+    @staticmethod
+    async def _single_response(response: Awaitable[MCPMessage]) -> AsyncIterator[MCPMessage]:
+        yield await response
+    
+    async def _receive_tool_result(
+        self, request: MCPToolInvocationRequest
+    ) -> AsyncIterator[Union[MCPToolResultChunk, MCPToolInvocationResponse]]:
+        """
+        Send a chunked tool invocation over WebSocket and yield its chunks, then the final response.
+        
+        The request timeout bounds the wait for each frame rather than the whole stream.
+        """
+        if not self.websocket or not self.is_connected:
+            raise ConnectionError("WebSocket not connected")
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        self._chunk_queues[request.request_id] = queue
+        timeout = request.timeout or self.config.timeout
+        try:
+            await self.websocket.send(self._codec.encode(request))
+            expected = 0
+            while True:
+                try:
+                    data = await asyncio.wait_for(queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"Request {request.request_id} timed out")
+                if isinstance(data, Exception):
+                    raise data
+                
+                message = data
+                if isinstance(message, MCPErrorResponse):
+                    raise MCPRequestError(message.error_code, message.error_message, message.details)
+                if isinstance(message, MCPToolResultChunk):
+                    if message.sequence != expected:
+                        raise ValueError(
+                            f"Chunk {message.sequence} of request {request.request_id} arrived out of order"
+                        )
+                    expected += 1
+                yield message
+                if not isinstance(message, MCPToolResultChunk):
+                    return
+        finally:
+            self._chunk_queues.pop(request.request_id, None)
+    
+    async def invoke_tools_batch(
+        self,
+        invocations: List[Tuple[str, Dict[str, Any]]],
+        timeout: Optional[int] = None,
+        priority: int = 5
+    ) -> List[MCPToolInvocationResponse]:
+        """
+        Invoke several tools in one round trip; they run concurrently on the server.
+        
+        Args:
+            invocations: (tool_name, arguments) pairs
+            timeout: Per-invocation timeout, also bounding the whole batch
+            
+        Returns:
+            One response per invocation, in the same order
+        """
+        timeout = timeout or self.config.timeout
+        items = [
+            MCPToolInvocationRequest(
+                request_id=str(uuid.uuid4()),
+                agent_id=self.agent_id,
+                tool_name=tool_name,
+                arguments=arguments,
+                priority=priority,
+                timeout=timeout
+            )
+            for tool_name, arguments in invocations
+        ]
+        use_websocket = bool(self.websocket) and self._on_home_loop()
+        request = MCPToolBatchRequest(
+            request_id=str(uuid.uuid4()),
+            agent_id=self.agent_id,
+            invocations=items,
+            stream=use_websocket,
+            timeout=timeout
+        )
+        
+        if not use_websocket:
+            response = await self._send_http_request("/invoke_tools_batch", request)
+            return response.responses
+        
+        # Item responses are streamed under their own request IDs ahead of the batch response
+        loop = asyncio.get_running_loop()
+        item_futures = {item.request_id: loop.create_future() for item in items}
+        self._response_futures.update(item_futures)
+        try:
+            await self._send_websocket_request(request)
+        finally:
+            for request_id in item_futures:
+                self._response_futures.pop(request_id, None)
+        
+        # Frames arrive in order, so every item has been answered by the time the batch completes
+        responses = []
+        for item in items:
+            future = item_futures[item.request_id]
+            if future.done() and not future.cancelled() and future.exception() is None:
+                responses.append(future.result())
+            else:
+                future.cancel()
+                responses.append(MCPToolInvocationResponse(
+                    request_id=item.request_id, success=False, error_message="No response received for invocation"
+                ))
+        return responses
     
     async def fetch_context(
         self,
         context_keys: List[str],
-        scope: str = "session"
+        scope: str = "session",
+        since_version: Optional[int] = None
     ) -> MCPContextFetchResponse:
-        """Fetch context data from MCP server"""
+        """Fetch context data from MCP server; with since_version, only keys changed after it"""
         
         request = MCPContextFetchRequest(
             request_id=str(uuid.uuid4()),
             agent_id=self.agent_id,
             context_keys=context_keys,
-            scope=scope
+            scope=scope,
+            since_version=since_version
         )
         
-        if self.websocket:
+        if self.websocket and self._on_home_loop():
             return await self._send_websocket_request(request)
         else:
             return await self._send_http_request("/fetch_context", request)
@@ -188,7 +715,9 @@ class MCPClient:
         self,
         state_updates: Dict[str, Any],
         scope: str = "session",
-        merge_strategy: str = "merge"
+        merge_strategy: str = "merge",
+        deleted_keys: Optional[List[str]] = None,
+        base_version: Optional[int] = None
     ) -> MCPStateUpdateResponse:
         """Update state through MCP server"""
         
@@ -197,29 +726,115 @@ class MCPClient:
             agent_id=self.agent_id,
             state_updates=state_updates,
             scope=scope,
-            merge_strategy=merge_strategy
+            merge_strategy=merge_strategy,
+            deleted_keys=deleted_keys or [],
+            base_version=base_version
         )
         
-        if self.websocket:
-            return await self._send_websocket_request(request)
+        if self.websocket and self._on_home_loop():
+            response = await self._send_websocket_request(request)
         else:
-            return await self._send_http_request("/update_state", request)
+            response = await self._send_http_request("/update_state", request)
+        
+        if isinstance(response, MCPStateUpdateResponse) and response.success and response.version:
+            self.context_versions[scope] = max(self.context_versions.get(scope, 0), response.version)
+        return response
+    
+    async def sync_state(self, state: Dict[str, Any], scope: str = "session") -> Optional[MCPStateUpdateResponse]:
+        """
+        Push only what changed in state since the last sync_state call for this scope.
+        
+        Changed keys are replaced and vanished keys deleted; nothing is sent if the
+        state is unchanged. Returns None in that case.
+        
+        Each push is based on the version acknowledged for the previous one. Keys
+        another writer changed since then are left alone and listed in the
+        response's conflicts; they stay pending, so syncing again, once the caller
+        has reconciled them, writes them.
+        """
+        previous = self._synced_state.get(scope, {})
+        changes = {key: value for key, value in state.items() if key not in previous or previous[key] != value}
+        deleted_keys = [key for key in previous if key not in state]
+        if not changes and not deleted_keys:
+            return None
+        
+        response = await self.update_state(
+            changes, scope=scope, merge_strategy="replace", deleted_keys=deleted_keys,
+            base_version=self._synced_versions.get(scope)
+        )
+        if response.success:
+            synced = dict(state)
+            for key in response.conflicts:
+                synced.pop(key, None)
+                if key in previous:
+                    synced[key] = previous[key]
+            if response.conflicts:
+                logger.warning(f"sync_state for {scope} skipped keys changed by another writer: {response.conflicts}")
+            self._synced_state[scope] = synced
+            if response.version is not None:
+                self._synced_versions[scope] = response.version
+        return response
+    
+    async def subscribe_context(
+        self,
+        prefixes: List[str],
+        scope: str = "session",
+        callback: Optional[Callable[[MCPContextDeltaMessage], Any]] = None
+    ) -> MCPSubscribeResponse:
+        """
+        Watch keys under the given prefixes; the server pushes changes over the WebSocket.
+        
+        The local mirror in context_cache is seeded with the current values and kept
+        up to date. callback, if given, is called (or awaited) with each delta.
+        """
+        if not self.websocket:
+            raise ConnectionError("Context subscriptions require a WebSocket connection")
+        if callback is not None:
+            self._context_callbacks.append(callback)
+        
+        response = await self._send_websocket_request(MCPSubscribeRequest(
+            request_id=str(uuid.uuid4()),
+            agent_id=self.agent_id,
+            scope=scope,
+            prefixes=prefixes,
+            since_version=self.context_versions.get(scope)
+        ))
+        cache = self.context_cache.setdefault(scope, {})
+        cache.update(response.context_data)
+        for key in response.deleted_keys:
+            cache.pop(key, None)
+        if response.version is not None:
+            self.context_versions[scope] = max(self.context_versions.get(scope, 0), response.version)
+        return response
+    
+    async def unsubscribe_context(self, prefixes: List[str], scope: str = "session") -> MCPSubscribeResponse:
+        """Stop watching the given prefixes"""
+        if not self.websocket:
+            raise ConnectionError("Context subscriptions require a WebSocket connection")
+        return await self._send_websocket_request(MCPSubscribeRequest(
+            request_id=str(uuid.uuid4()),
+            agent_id=self.agent_id,
+            scope=scope,
+            prefixes=prefixes,
+            action="unsubscribe"
+        ))
     
     async def _send_websocket_request(self, request: MCPMessage) -> MCPMessage:
         """Send request via WebSocket and wait for response"""
-        if not self.websocket:
+        if not self.websocket or not self.is_connected:
             raise ConnectionError("WebSocket not connected")
         
-        # Create future for response
-        future = asyncio.Future()
+        # Create future for response; the server may answer requests in any order
+        future = asyncio.get_running_loop().create_future()
         self._response_futures[request.request_id] = future
+        timeout = getattr(request, "timeout", None) or self.config.timeout
         
         try:
             # Send request
-            await self.websocket.send(request.json())
+            await self.websocket.send(self._codec.encode(request))
             
             # Wait for response with timeout
-            response = await asyncio.wait_for(future, timeout=self.config.timeout)
+            response = await asyncio.wait_for(future, timeout=timeout)
             return response
             
         except asyncio.TimeoutError:
@@ -230,25 +845,89 @@ class MCPClient:
             raise
     
     async def _send_http_request(self, endpoint: str, request: MCPMessage) -> MCPMessage:
-        """Send request via HTTP"""
-        if not self.session:
-            raise ConnectionError("HTTP session not initialized")
+        """
+        Send request via HTTP, retrying transient failures until the request's deadline.
         
-        url = f"{self.config.server_url}{endpoint}"
+        The request ID is sent as Idempotency-Key, so a retry of a call whose response
+        was lost returns the original result instead of running the tool again.
+        """
+        session = self._http_session()
+        url = f"{self._base_url}{endpoint}"
+        body = self._codec.encode(request)
+        headers = {"Content-Type": self._codec.content_type, "Idempotency-Key": request.request_id}
+        if self._request_encoding and len(body) >= self.config.compression_min_size:
+            body = compress(body, self._request_encoding)
+            headers["Content-Encoding"] = self._request_encoding
+        deadline = time.monotonic() + (getattr(request, "timeout", None) or self.config.timeout)
+        self._retry_budget.deposit()
         
-        for attempt in range(self.config.retry_attempts):
+        attempt = 0
+        while True:
             try:
-                async with self.session.post(url, json=request.dict()) as response:
-                    response.raise_for_status()
-                    data = await response.json()
-                    return validate_mcp_message(data)
-                    
+                status, content_type, data = await self._post(session, url, body, headers, deadline - time.monotonic())
+                if status == 503:
+                    # Rejected by admission control before any work was done
+                    error = codec_for_content_type(content_type).decode(data)
+                    raise MCPRequestError(error.error_code, error.error_message, error.details, status)
+                if status >= 400:
+                    raise MCPRequestError(
+                        f"HTTP_{status}", data.decode("utf-8", errors="replace")[:500], status=status
+                    )
+                return codec_for_content_type(content_type).decode(data)
+                
             except Exception as e:
-                if attempt == self.config.retry_attempts - 1:
+                delay = self._retry_delay(e, attempt)
+                attempt += 1
+                if (
+                    delay is None
+                    or attempt >= self.config.retry_attempts
+                    or time.monotonic() + delay >= deadline
+                    or not self._retry_budget.withdraw()
+                ):
                     raise
-                
-                # Wait before retry
-                await asyncio.sleep(2 ** attempt)
+                await asyncio.sleep(delay)
+    
+    async def _post(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        body: Any,
+        headers: Dict[str, str],
+        timeout: float
+    ) -> Tuple[int, str, bytes]:
+        """POST once and return (status, content type, body)"""
+        if timeout <= 0:
+            raise asyncio.TimeoutError()
+        if self._http2_client is not None and session is self.session:
+            response = await self._http2_client.post(url, content=body, headers=headers, timeout=timeout)
+            self._note_request_encodings(response.headers.get("accept-encoding"))
+            content_type = response.headers.get("content-type", "").split(";")[0].strip()
+            return response.status_code, content_type, response.content
+        async with session.post(
+            url, data=body, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            self._note_request_encodings(response.headers.get("Accept-Encoding"))
+            return response.status, response.content_type, await response.read()
+    
+    def _note_request_encodings(self, accept_encoding: Optional[str]):
+        """Pick the request body encoding from the encodings the server says it accepts"""
+        if self.config.compression and accept_encoding is not None:
+            self._request_encoding = negotiate_content_encoding(accept_encoding, available_content_encodings())
+    
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying after error, or None if it must not be retried"""
+        retry_after = None
+        if isinstance(error, MCPRequestError):
+            # Client errors will fail again; server errors are safe to retry under the idempotency key
+            if error.status is None or error.status < 500:
+                return None
+            retry_after = error.details.get("retry_after")
+        elif not isinstance(error, _TRANSIENT_ERRORS):
+            return None
+        
+        # Full jitter keeps clients that failed together from retrying together
+        jitter = random.uniform(0, min(self.config.max_retry_backoff, self.config.retry_backoff * 2 ** attempt))
+        return retry_after + jitter if retry_after is not None else jitter
 
 class MCPToolWrapper:
     """Wrapper to route tool calls through MCP client"""
@@ -277,56 +956,236 @@ class MCPToolWrapper:
             raise RuntimeError(f"Tool execution failed: {response.error_message}")
     
     def _run(self, *args, **kwargs) -> Any:
-        """Synchronous wrapper for CrewAI compatibility"""
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # If we're in an async context, create a new task
-            task = asyncio.create_task(self.__call__(*args, **kwargs))
-            return asyncio.run_coroutine_threadsafe(task, loop).result()
-        else:
-            return loop.run_until_complete(self.__call__(*args, **kwargs))
+        """Synchronous wrapper for CrewAI compatibility; safe to call from inside a running loop"""
+        return self.mcp_client.run_sync(self.__call__(*args, **kwargs))
+
+@dataclass
+class MCPClientStats:
+    """Load and health statistics for a pooled MCP client"""
+    in_flight: int = 0
+    ewma_latency: Optional[float] = None
+    consecutive_failures: int = 0
+    healthy: bool = True
+    total_requests: int = 0
+    total_failures: int = 0
+    total_cancelled: int = 0
+    last_failure: Optional[datetime] = None
+    reconnect_attempts: int = 0
+
+    def load_score(self, default_latency: float = 1.0) -> float:
+        """Estimated wait for a new request: queued requests times average latency"""
+        latency = self.ewma_latency if self.ewma_latency is not None else default_latency
+        return (self.in_flight + 1) * max(latency, 1e-3)
 
 class MCPClientPool:
-    """Pool of MCP clients for load balancing"""
+    """Pool of MCP clients with load-aware routing and health tracking"""
     
-    def __init__(self, configs: List[MCPConnectionConfig], agent_id_prefix: str = "agent"):
+    def __init__(
+        self,
+        configs: List[MCPConnectionConfig],
+        agent_id_prefix: str = "agent",
+        use_websocket: bool = True,
+        max_consecutive_failures: int = 3,
+        reconnect_interval: float = 1.0,
+        max_reconnect_interval: float = 30.0,
+        latency_alpha: float = 0.2
+    ):
         self.configs = configs
         self.agent_id_prefix = agent_id_prefix
+        self.use_websocket = use_websocket
+        self.max_consecutive_failures = max_consecutive_failures
+        self.reconnect_interval = reconnect_interval
+        self.max_reconnect_interval = max_reconnect_interval
+        self.latency_alpha = latency_alpha
         self.clients: List[MCPClient] = []
+        self.stats: List[MCPClientStats] = []
         self.current_index = 0
+        self._reconnect_tasks: Dict[int, asyncio.Task] = {}
     
     async def initialize(self):
         """Initialize all clients in the pool"""
         for i, config in enumerate(self.configs):
             agent_id = f"{self.agent_id_prefix}-{i}"
             client = MCPClient(config, agent_id)
-            await client.connect()
+            stats = MCPClientStats()
             self.clients.append(client)
+            self.stats.append(stats)
+            
+            try:
+                await client.connect(use_websocket=self.use_websocket)
+            except Exception as e:
+                # A server that is down at startup joins the pool once it comes back
+                logger.warning(f"Pool client {agent_id} failed to connect: {e}")
+                self._eject(i)
+        
+        if not any(stats.healthy for stats in self.stats):
+            logger.error("No MCP clients in pool could connect")
     
     async def cleanup(self):
         """Cleanup all clients"""
+        for task in self._reconnect_tasks.values():
+            task.cancel()
+        for task in self._reconnect_tasks.values():
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._reconnect_tasks.clear()
+        
         for client in self.clients:
-            await client.disconnect()
+            try:
+                await client.disconnect()
+            except Exception as e:
+                logger.error(f"Error disconnecting pool client {client.agent_id}: {e}")
         self.clients.clear()
+        self.stats.clear()
+    
+    def _select_index(self) -> int:
+        """Pick the healthy client with the lowest load score"""
+        count = len(self.clients)
+        best_index = None
+        best_score = None
+        
+        # Clients without latency samples yet are assumed to be average
+        known = [stats.ewma_latency for stats in self.stats if stats.ewma_latency is not None]
+        default_latency = sum(known) / len(known) if known else 1.0
+        
+        # Start from the rotating cursor so ties are spread round-robin
+        for offset in range(count):
+            index = (self.current_index + offset) % count
+            stats = self.stats[index]
+            if not stats.healthy:
+                continue
+            score = stats.load_score(default_latency)
+            if best_score is None or score < best_score:
+                best_index = index
+                best_score = score
+        
+        if best_index is None:
+            raise RuntimeError("No healthy clients available in pool")
+        
+        self.current_index = (best_index + 1) % count
+        return best_index
     
     def get_client(self) -> MCPClient:
-        """Get next available client (round-robin)"""
+        """Get the least-loaded healthy client"""
         if not self.clients:
             raise RuntimeError("No clients available in pool")
         
-        client = self.clients[self.current_index]
-        self.current_index = (self.current_index + 1) % len(self.clients)
-        return client
+        return self.clients[self._select_index()]
     
     @asynccontextmanager
     async def get_client_context(self):
-        """Get client with automatic cleanup"""
-        client = self.get_client()
+        """Get the least-loaded healthy client and track the request made with it"""
+        if not self.clients:
+            raise RuntimeError("No clients available in pool")
+        
+        index = self._select_index()
+        stats = self.stats[index]
+        stats.in_flight += 1
+        stats.total_requests += 1
+        start_time = time.perf_counter()
+        
         try:
-            yield client
+            yield self.clients[index]
+        except asyncio.CancelledError:
+            # Timeouts and abandoned callers say nothing about the server's health
+            stats.total_cancelled += 1
+            raise
+        except Exception:
+            self._record_failure(index)
+            raise
+        else:
+            self._record_success(index, time.perf_counter() - start_time)
         finally:
-            # Client cleanup handled by pool
-            pass
+            stats.in_flight -= 1
+    
+    async def invoke_tool(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        context: Optional[Dict[str, Any]] = None,
+        timeout: Optional[int] = None
+    ) -> MCPToolInvocationResponse:
+        """Invoke a tool on the least-loaded healthy client"""
+        async with self.get_client_context() as client:
+            return await client.invoke_tool(tool_name, arguments, context=context, timeout=timeout)
+    
+    def _record_success(self, index: int, latency: float):
+        """Fold a successful request's latency into the client's EWMA"""
+        stats = self.stats[index]
+        stats.consecutive_failures = 0
+        if stats.ewma_latency is None:
+            stats.ewma_latency = latency
+        else:
+            stats.ewma_latency += self.latency_alpha * (latency - stats.ewma_latency)
+    
+    def _record_failure(self, index: int):
+        """Count a failed request and eject the client once it keeps failing"""
+        stats = self.stats[index]
+        stats.consecutive_failures += 1
+        stats.total_failures += 1
+        stats.last_failure = datetime.now()
+        
+        if stats.healthy and stats.consecutive_failures >= self.max_consecutive_failures:
+            logger.warning(
+                f"Ejecting pool client {self.clients[index].agent_id} after "
+                f"{stats.consecutive_failures} consecutive failures"
+            )
+            self._eject(index)
+    
+    def _eject(self, index: int):
+        """Take a client out of rotation and start reconnecting it in the background"""
+        self.stats[index].healthy = False
+        task = self._reconnect_tasks.get(index)
+        if task is None or task.done():
+            self._reconnect_tasks[index] = asyncio.create_task(self._reconnect_loop(index))
+    
+    async def _reconnect_loop(self, index: int):
+        """Reconnect an ejected client with exponential backoff"""
+        client = self.clients[index]
+        stats = self.stats[index]
+        delay = self.reconnect_interval
+        
+        while not stats.healthy:
+            await asyncio.sleep(delay)
+            stats.reconnect_attempts += 1
+            try:
+                await client.disconnect()
+                await client.connect(use_websocket=self.use_websocket)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"Reconnect of pool client {client.agent_id} failed: {e}")
+                delay = min(delay * 2, self.max_reconnect_interval)
+                continue
+            
+            stats.healthy = True
+            stats.consecutive_failures = 0
+            stats.ewma_latency = None
+            logger.info(f"Pool client {client.agent_id} reconnected")
+        
+        self._reconnect_tasks.pop(index, None)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Return pool-wide and per-client statistics"""
+        clients = []
+        for client, stats in zip(self.clients, self.stats):
+            clients.append({
+                "agent_id": client.agent_id,
+                "server_url": client.config.server_url,
+                **asdict(stats)
+            })
+        
+        return {
+            "total_clients": len(self.clients),
+            "healthy_clients": sum(1 for stats in self.stats if stats.healthy),
+            "in_flight": sum(stats.in_flight for stats in self.stats),
+            "total_requests": sum(stats.total_requests for stats in self.stats),
+            "total_failures": sum(stats.total_failures for stats in self.stats),
+            "total_cancelled": sum(stats.total_cancelled for stats in self.stats),
+            "clients": clients
+        }
 
 # Convenience functions
 async def create_mcp_client(server_url: str, agent_id: str, **kwargs) -> MCPClient:
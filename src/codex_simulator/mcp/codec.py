@@ -0,0 +1,181 @@
+"""
+MCP Wire Codecs
+Encoders and decoders for MCP messages, with JSON and compact msgpack variants.
+"""
+
+import json
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type, TypeVar, Union
+
+from pydantic import BaseModel
+
+from .schemas import MCPMessage, validate_mcp_message, validate_mcp_message_json
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib decoder accepts str and bytes too
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; without it only JSON is negotiated
+    msgpack = None
+
+class MCPCodec(ABC):
+    """Base class for MCP wire encodings"""
+    name: str = ""
+    content_type: str = ""
+    binary: bool = False
+
+    @property
+    def subprotocol(self) -> str:
+        """WebSocket subprotocol used to negotiate this encoding"""
+        return f"mcp.{self.name}"
+
+    @abstractmethod
+    def encode(self, message: BaseModel) -> Union[str, bytes]:
+        """Serialize an MCP message for the wire"""
+
+    @abstractmethod
+    def loads(self, data: Union[str, bytes]) -> Any:
+        """Decode raw wire data into plain Python objects"""
+
+    def decode(self, data: Union[str, bytes], trusted: bool = False) -> MCPMessage:
+        """Decode raw wire data into a validated MCP message"""
+        return validate_mcp_message(self.loads(data), trusted=trusted)
+
+    def decode_as(self, data: Union[str, bytes], model: Type[ModelT]) -> ModelT:
+        """Decode raw wire data into a known model type"""
+        return model.model_validate(self.loads(data))
+
+class JSONCodec(MCPCodec):
+    """JSON encoding, the protocol default"""
+    name = "json"
+    content_type = "application/json"
+    binary = False
+
+    def encode(self, message: BaseModel) -> str:
+        return message.model_dump_json()
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+    def decode(self, data: Union[str, bytes], trusted: bool = False) -> MCPMessage:
+        if trusted:
+            return validate_mcp_message(self.loads(data), trusted=True)
+        # Validate straight from the JSON text without building an intermediate dict
+        return validate_mcp_message_json(data)
+
+    def decode_as(self, data: Union[str, bytes], model: Type[ModelT]) -> ModelT:
+        return model.model_validate_json(data)
+
+def _msgpack_default(obj: Any) -> Any:
+    """Convert values msgpack cannot pack natively"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    return str(obj)
+
+class MsgPackCodec(MCPCodec):
+    """Compact binary encoding; bytes in tool results stay binary on the wire"""
+    name = "msgpack"
+    content_type = "application/msgpack"
+    binary = True
+
+    def encode(self, message: BaseModel) -> bytes:
+        return msgpack.packb(message.model_dump(), default=_msgpack_default, use_bin_type=True)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        if isinstance(data, str):
+            data = data.encode("latin-1")
+        # Unpacking from a memoryview reads the received buffer in place; tool
+        # results may use non-string dict keys, which msgpack keeps as they are
+        return msgpack.unpackb(memoryview(data), raw=False, strict_map_key=False)
+
+JSON_CODEC = JSONCodec()
+
+_CODECS: Dict[str, MCPCodec] = {"json": JSON_CODEC}
+if msgpack is not None:
+    _CODECS["msgpack"] = MsgPackCodec()
+
+def available_encodings() -> List[str]:
+    """Encodings supported by this process, most compact first"""
+    return sorted(_CODECS, key=lambda name: not _CODECS[name].binary)
+
+def get_codec(name: str) -> MCPCodec:
+    """
+    Look up a codec by encoding name.
+
+    Raises:
+        ValueError: If the encoding is unknown or its library is not installed
+    """
+    codec = _CODECS.get(name)
+    if codec is None:
+        raise ValueError(f"Unsupported MCP encoding: {name}")
+    return codec
+
+def preferred_encodings(encoding: str = "auto") -> List[str]:
+    """Encodings a client should offer, in order of preference"""
+    if encoding == "auto":
+        return available_encodings()
+    get_codec(encoding)
+    return [encoding] if encoding == "json" else [encoding, "json"]
+
+def codec_for_subprotocols(offered: List[str]) -> MCPCodec:
+    """Pick the first offered WebSocket subprotocol this process supports"""
+    for subprotocol in offered:
+        name = subprotocol[len("mcp."):] if subprotocol.startswith("mcp.") else None
+        if name in _CODECS:
+            return _CODECS[name]
+    return JSON_CODEC
+
+def codec_for_content_type(content_type: Optional[str]) -> MCPCodec:
+    """Pick the codec for an HTTP Content-Type header, defaulting to JSON"""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    for codec in _CODECS.values():
+        if codec.content_type == media_type:
+            return codec
+    return JSON_CODEC
+
+def codec_for_accept(accept: Optional[str]) -> MCPCodec:
+    """Pick the first codec listed in an HTTP Accept header, defaulting to JSON"""
+    for media_range in (accept or "").split(","):
+        codec = codec_for_content_type(media_range)
+        if codec is not JSON_CODEC or media_range.split(";")[0].strip().lower() == JSON_CODEC.content_type:
+            return codec
+    return JSON_CODEC
+
+def result_chunks(result: Any, chunk_size: int) -> Optional[Tuple[str, Iterator[str]]]:
+    """
+    Split a tool result into text chunks for streaming.
+
+    Returns the chunk encoding and a lazy iterator over the slices, or None if the
+    result fits in one chunk or is binary, which is always sent whole.
+    """
+    if isinstance(result, (bytes, bytearray, memoryview)):
+        return None
+    if isinstance(result, str):
+        encoding, text = "text", result
+    else:
+        encoding, text = "json", json.dumps(result, default=_msgpack_default)
+    if len(text) <= chunk_size:
+        return None
+    return encoding, (text[start:start + chunk_size] for start in range(0, len(text), chunk_size))
+
+def join_result_chunks(chunks: List[str], encoding: Optional[str]) -> Any:
+    """Reassemble a streamed tool result from its chunks"""
+    text = "".join(chunks)
+    if encoding == "json":
+        return json.loads(text)
+    return text
@@ -0,0 +1,109 @@
+"""
+MCP Payload Compression
+Content-Encoding negotiation and gzip/zstd codecs for HTTP request and response bodies.
+"""
+
+import gzip
+import zlib
+from typing import List, Optional, Sequence, Union
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; gzip is always available
+    zstandard = None
+
+# Bodies smaller than this are sent as-is; compressing them costs more than it saves
+DEFAULT_MIN_COMPRESS_SIZE = 1024
+
+# Upper bound on a decompressed request body, so a small payload cannot expand without limit
+MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024
+
+# Fast levels: tool traffic is compressed once per message, on the request path
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+
+_DECOMPRESS_ERRORS = (zlib.error, zstandard.ZstdError) if zstandard is not None else (zlib.error,)
+
+class DecompressionError(ValueError):
+    """Raised for bodies that cannot be decoded or expand past the size limit"""
+
+def available_content_encodings() -> List[str]:
+    """Content encodings supported by this process, most preferred first"""
+    return ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+
+def compress(data: Union[str, bytes], encoding: str) -> bytes:
+    """
+    Compress a body with the given content encoding.
+
+    Raises:
+        ValueError: If the encoding is unknown or its library is not installed
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+def decompress(data: bytes, encoding: str, max_size: int = MAX_DECOMPRESSED_SIZE) -> bytes:
+    """
+    Decompress a body, refusing output larger than max_size.
+
+    Raises:
+        ValueError: If the encoding is unknown or its library is not installed
+        DecompressionError: If the body is corrupt or too large once decompressed
+    """
+    encoding = encoding.strip().lower()
+    if encoding in ("", "identity"):
+        return data
+    try:
+        if encoding == "gzip":
+            decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+            output = decompressor.decompress(data, max_size + 1)
+        elif encoding == "zstd" and zstandard is not None:
+            reader = zstandard.ZstdDecompressor().stream_reader(data)
+            parts, size = [], 0
+            while size <= max_size:
+                part = reader.read(max_size + 1 - size)
+                if not part:
+                    break
+                parts.append(part)
+                size += len(part)
+            output = b"".join(parts)
+        else:
+            raise ValueError(f"Unsupported content encoding: {encoding}")
+    except _DECOMPRESS_ERRORS as e:
+        raise DecompressionError(f"Invalid {encoding} body: {e}") from e
+    if len(output) > max_size:
+        raise DecompressionError(f"Decompressed body exceeds {max_size} bytes")
+    return output
+
+def negotiate_content_encoding(accept_encoding: Optional[str], offered: Sequence[str]) -> Optional[str]:
+    """
+    Pick the first offered encoding the peer accepts, or None to send uncompressed.
+
+    Follows Accept-Encoding q-values: "q=0" refuses an encoding, "*" matches any
+    encoding not listed explicitly.
+    """
+    if not accept_encoding or not offered:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().lower().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            weights[name.strip()] = quality
+    wildcard = weights.get("*", 0.0)
+    accepted = [encoding for encoding in offered if weights.get(encoding, wildcard) > 0]
+    if not accepted:
+        return None
+    # The highest q-value wins; ties keep our order of preference
+    return max(accepted, key=lambda encoding: weights.get(encoding, wildcard))
@@ -0,0 +1,404 @@
+"""
+MCP Context Store
+Bounded storage for shared agent, session and global context.
+"""
+
+import json
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+ContextScope = str
+MergeStrategy = str
+
+SCOPES: Tuple[ContextScope, ...] = ("global", "session", "agent")
+
+class _Deleted:
+    def __repr__(self) -> str:
+        return "DELETED"
+
+# Value changed_since reports for a key deleted after the given version
+DELETED = _Deleted()
+
+@dataclass
+class ScopeLimits:
+    """Bounds applied to one context scope"""
+    max_keys: int = 10_000
+    max_bytes: int = 64 * 1024 * 1024
+    max_value_bytes: int = 4 * 1024 * 1024
+    max_list_length: int = 1_000
+    ttl: Optional[float] = None
+
+def default_scope_limits() -> Dict[ContextScope, ScopeLimits]:
+    """Default limits: agent and session context expire, global context does not"""
+    return {
+        "global": ScopeLimits(),
+        "session": ScopeLimits(ttl=24 * 3600),
+        "agent": ScopeLimits(max_keys=50_000, ttl=3600)
+    }
+
+def value_size(value: Any) -> int:
+    """Approximate serialized size of a context value in bytes"""
+    return len(json.dumps(value, default=str, separators=(",", ":")).encode("utf-8"))
+
+def merge_value(current: Any, value: Any, merge_strategy: MergeStrategy, max_list_length: int) -> Any:
+    """
+    Combine an update with the stored value.
+
+    Always builds a new object so values already handed to readers are never mutated.
+    Appended lists keep only their newest max_list_length items.
+    """
+    if merge_strategy == "merge" and isinstance(value, dict) and isinstance(current, dict):
+        return {**current, **value}
+    if merge_strategy == "append" and isinstance(value, list):
+        combined = (current + value) if isinstance(current, list) else list(value)
+        return combined[-max_list_length:]
+    return value
+
+class ContextStore(ABC):
+    """
+    Interface for MCP context storage backends.
+
+    Agent-scoped keys live in a namespace per agent; other scopes use the empty namespace.
+    Every write stamps the entry with a new, store-wide increasing version, and every
+    delete leaves a tombstone with one, so readers catching up see removals too.
+    Stores keep a bounded number of tombstones per scope, at most its max_keys.
+    """
+
+    @abstractmethod
+    async def get_version(self) -> int:
+        """Version of the most recent write"""
+
+    @abstractmethod
+    async def get_many(self, scope: ContextScope, namespace: str, keys: Iterable[str]) -> Dict[str, Any]:
+        """Return the live values for the keys that exist"""
+
+    @abstractmethod
+    async def get_versioned(
+        self, scope: ContextScope, namespace: str, keys: Iterable[str]
+    ) -> Dict[str, Tuple[int, Any]]:
+        """Return (version, value) for the keys that exist"""
+
+    @abstractmethod
+    async def changed_since(
+        self,
+        scope: ContextScope,
+        namespace: str,
+        since_version: int,
+        prefixes: Optional[Iterable[str]] = None
+    ) -> Dict[str, Tuple[int, Any]]:
+        """
+        Return (version, value) for keys written after since_version, optionally under prefixes.
+
+        Keys deleted after since_version are returned as (version, DELETED).
+        """
+
+    @abstractmethod
+    async def apply_updates(
+        self,
+        scope: ContextScope,
+        namespace: str,
+        updates: Dict[str, Any],
+        merge_strategy: MergeStrategy = "merge"
+    ) -> List[str]:
+        """Apply updates and return the keys that were written"""
+
+    @abstractmethod
+    async def delete(self, scope: ContextScope, namespace: str, keys: Iterable[str]) -> int:
+        """Delete keys and return how many existed"""
+
+    @abstractmethod
+    def snapshot(self, scope: ContextScope) -> Dict[str, Any]:
+        """Copy of a scope's live entries, with agent keys as "agent_id.key" """
+
+    async def purge_expired(self) -> int:
+        """Remove expired entries eagerly; returns how many were removed"""
+        return 0
+
+    @abstractmethod
+    async def export_entries(self, scopes: Iterable[ContextScope]) -> List[Tuple[ContextScope, str, str, Any]]:
+        """Live (scope, namespace, key, value) entries, used for snapshots"""
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return size and eviction statistics"""
+        return {}
+
+    async def close(self):
+        """Release backend resources"""
+
+    def __getitem__(self, scope: ContextScope) -> Dict[str, Any]:
+        return self.snapshot(scope)
+
+@dataclass
+class _Entry:
+    value: Any
+    size: int
+    expires_at: Optional[float]
+    version: int
+
+@dataclass
+class _Shard:
+    """One lock-protected slice of the store, holding an LRU and deletion tombstones per scope"""
+    scopes: Dict[ContextScope, "OrderedDict[Tuple[str, str], _Entry]"]
+    sizes: Dict[ContextScope, int]
+    tombstones: Dict[ContextScope, "OrderedDict[Tuple[str, str], int]"]
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+class InMemoryContextStore(ContextStore):
+    """
+    Sharded in-memory context store with TTLs, LRU eviction and byte accounting.
+
+    Scope limits are split evenly across shards, so each shard evicts independently
+    and updates to different shards never contend for a lock.
+    """
+
+    def __init__(
+        self,
+        num_shards: int = 16,
+        limits: Optional[Dict[ContextScope, ScopeLimits]] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.num_shards = num_shards
+        self.limits = {**default_scope_limits(), **(limits or {})}
+        self.clock = clock
+        self._shards = [
+            _Shard(
+                scopes={scope: OrderedDict() for scope in self.limits},
+                sizes={scope: 0 for scope in self.limits},
+                tombstones={scope: OrderedDict() for scope in self.limits}
+            )
+            for _ in range(num_shards)
+        ]
+        self._evictions = 0
+        self._expirations = 0
+        self._version = 0
+        self._version_lock = threading.Lock()
+
+    async def get_version(self) -> int:
+        return self._version
+
+    def _next_version(self) -> int:
+        with self._version_lock:
+            self._version += 1
+            return self._version
+
+    def _shard_index(self, scope: ContextScope, namespace: str, key: str) -> int:
+        return hash((scope, namespace, key)) % self.num_shards
+
+    def _shard_for(self, scope: ContextScope, namespace: str, key: str) -> _Shard:
+        return self._shards[self._shard_index(scope, namespace, key)]
+
+    @contextmanager
+    def _locked(self, scope: ContextScope, namespace: str, keys: Iterable[str]) -> Iterator[None]:
+        """Hold the locks of every shard the keys live in, taken in a fixed order"""
+        indexes = sorted({self._shard_index(scope, namespace, key) for key in keys})
+        with ExitStack() as stack:
+            for index in indexes:
+                stack.enter_context(self._shards[index].lock)
+            yield
+
+    def _check_scope(self, scope: ContextScope):
+        if scope not in self.limits:
+            raise ValueError(f"Unknown context scope: {scope}")
+
+    async def get_many(self, scope: ContextScope, namespace: str, keys: Iterable[str]) -> Dict[str, Any]:
+        versioned = await self.get_versioned(scope, namespace, keys)
+        return {key: value for key, (_, value) in versioned.items()}
+
+    async def get_versioned(
+        self, scope: ContextScope, namespace: str, keys: Iterable[str]
+    ) -> Dict[str, Tuple[int, Any]]:
+        self._check_scope(scope)
+        now = self.clock()
+        found: Dict[str, Tuple[int, Any]] = {}
+        for key in keys:
+            shard = self._shard_for(scope, namespace, key)
+            with shard.lock:
+                entries = shard.scopes[scope]
+                entry = entries.get((namespace, key))
+                if entry is None:
+                    continue
+                if entry.expires_at is not None and entry.expires_at <= now:
+                    self._remove(shard, scope, (namespace, key))
+                    self._expirations += 1
+                    continue
+                entries.move_to_end((namespace, key))
+                found[key] = (entry.version, entry.value)
+        return found
+
+    async def changed_since(
+        self,
+        scope: ContextScope,
+        namespace: str,
+        since_version: int,
+        prefixes: Optional[Iterable[str]] = None
+    ) -> Dict[str, Tuple[int, Any]]:
+        self._check_scope(scope)
+        prefixes = tuple(prefixes) if prefixes is not None else ("",)
+        now = self.clock()
+        changed: Dict[str, Tuple[int, Any]] = {}
+        for shard in self._shards:
+            with shard.lock:
+                for (entry_namespace, key), entry in shard.scopes[scope].items():
+                    if (
+                        entry_namespace == namespace
+                        and entry.version > since_version
+                        and (entry.expires_at is None or entry.expires_at > now)
+                        and key.startswith(prefixes)
+                    ):
+                        changed[key] = (entry.version, entry.value)
+                for (entry_namespace, key), version in shard.tombstones[scope].items():
+                    if entry_namespace == namespace and version > since_version and key.startswith(prefixes):
+                        changed[key] = (version, DELETED)
+        return changed
+
+    async def apply_updates(
+        self,
+        scope: ContextScope,
+        namespace: str,
+        updates: Dict[str, Any],
+        merge_strategy: MergeStrategy = "merge"
+    ) -> List[str]:
+        self._check_scope(scope)
+        limits = self.limits[scope]
+
+        # Merge and size-check every value before writing any, so a rejected batch changes nothing
+        with self._locked(scope, namespace, updates):
+            now = self.clock()
+            merged: Dict[str, Tuple[Any, int]] = {}
+            for key, value in updates.items():
+                current = self._shard_for(scope, namespace, key).scopes[scope].get((namespace, key))
+                if current is not None and current.expires_at is not None and current.expires_at <= now:
+                    current = None
+
+                new_value = merge_value(
+                    current.value if current else None, value, merge_strategy, limits.max_list_length
+                )
+                size = value_size(new_value)
+                if size > limits.max_value_bytes:
+                    raise ValueError(
+                        f"Context value '{key}' is {size} bytes; the {scope} limit is {limits.max_value_bytes}"
+                    )
+                merged[key] = (new_value, size)
+
+            for key, (new_value, size) in merged.items():
+                shard = self._shard_for(scope, namespace, key)
+                self._remove(shard, scope, (namespace, key))
+                shard.tombstones[scope].pop((namespace, key), None)
+                shard.scopes[scope][(namespace, key)] = _Entry(
+                    value=new_value,
+                    size=size,
+                    expires_at=now + limits.ttl if limits.ttl is not None else None,
+                    version=self._next_version()
+                )
+                shard.sizes[scope] += size
+                self._enforce_limits(shard, scope, now)
+
+        return list(updates)
+
+    async def delete(self, scope: ContextScope, namespace: str, keys: Iterable[str]) -> int:
+        self._check_scope(scope)
+        keys = list(keys)
+        max_tombstones = max(1, self.limits[scope].max_keys // self.num_shards)
+        with self._locked(scope, namespace, keys):
+            removed = [
+                key for key in keys if self._remove(self._shard_for(scope, namespace, key), scope, (namespace, key))
+            ]
+            if removed:
+                version = self._next_version()
+                for key in removed:
+                    tombstones = self._shard_for(scope, namespace, key).tombstones[scope]
+                    tombstones[(namespace, key)] = version
+                    while len(tombstones) > max_tombstones:
+                        tombstones.popitem(last=False)
+        return len(removed)
+
+    def _remove(self, shard: _Shard, scope: ContextScope, entry_key: Tuple[str, str]) -> bool:
+        entry = shard.scopes[scope].pop(entry_key, None)
+        if entry is None:
+            return False
+        shard.sizes[scope] -= entry.size
+        return True
+
+    def _enforce_limits(self, shard: _Shard, scope: ContextScope, now: float):
+        """Drop expired entries, then least recently used ones, until the shard fits"""
+        limits = self.limits[scope]
+        max_keys = max(1, limits.max_keys // self.num_shards)
+        max_bytes = max(1, limits.max_bytes // self.num_shards)
+        entries = shard.scopes[scope]
+
+        if len(entries) <= max_keys and shard.sizes[scope] <= max_bytes:
+            return
+
+        if limits.ttl is not None:
+            expired = [k for k, entry in entries.items() if entry.expires_at <= now]
+            for entry_key in expired:
+                self._remove(shard, scope, entry_key)
+            self._expirations += len(expired)
+
+        # Keep the entry just written even if it alone exceeds the shard budget
+        while len(entries) > 1 and (len(entries) > max_keys or shard.sizes[scope] > max_bytes):
+            entry_key = next(iter(entries))
+            self._remove(shard, scope, entry_key)
+            self._evictions += 1
+
+    async def purge_expired(self) -> int:
+        """Remove every expired entry; returns how many were removed"""
+        now = self.clock()
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                for scope, entries in shard.scopes.items():
+                    expired = [
+                        k for k, entry in entries.items()
+                        if entry.expires_at is not None and entry.expires_at <= now
+                    ]
+                    for entry_key in expired:
+                        self._remove(shard, scope, entry_key)
+                    removed += len(expired)
+        self._expirations += removed
+        return removed
+
+    def snapshot(self, scope: ContextScope) -> Dict[str, Any]:
+        self._check_scope(scope)
+        now = self.clock()
+        result: Dict[str, Any] = {}
+        for shard in self._shards:
+            with shard.lock:
+                for (namespace, key), entry in shard.scopes[scope].items():
+                    if entry.expires_at is None or entry.expires_at > now:
+                        result[f"{namespace}.{key}" if namespace else key] = entry.value
+        return result
+
+    async def export_entries(self, scopes: Iterable[ContextScope]) -> List[Tuple[ContextScope, str, str, Any]]:
+        now = self.clock()
+        exported = []
+        for scope in scopes:
+            self._check_scope(scope)
+            for shard in self._shards:
+                with shard.lock:
+                    exported.extend(
+                        (scope, namespace, key, entry.value)
+                        for (namespace, key), entry in shard.scopes[scope].items()
+                        if entry.expires_at is None or entry.expires_at > now
+                    )
+        return exported
+
+    def get_stats(self) -> Dict[str, Any]:
+        scopes = {}
+        for scope in self.limits:
+            scopes[scope] = {
+                "keys": sum(len(shard.scopes[scope]) for shard in self._shards),
+                "bytes": sum(shard.sizes[scope] for shard in self._shards)
+            }
+        return {
+            "backend": "memory",
+            "shards": self.num_shards,
+            "scopes": scopes,
+            "evictions": self._evictions,
+            "expirations": self._expirations
+        }
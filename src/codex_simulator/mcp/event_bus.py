@@ -0,0 +1,122 @@
+"""
+MCP Event Bus
+Delivers broadcasts and context changes between MCP server processes.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .sqlite_store import connect_shared_sqlite
+
+logger = logging.getLogger(__name__)
+
+EventHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+class MCPEventBus(ABC):
+    """Interface for fanning server events out to the other worker processes"""
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:8]
+
+    @abstractmethod
+    async def publish(self, kind: str, payload: Dict[str, Any]):
+        """Send an event to every other worker; the publisher does not receive it"""
+
+    @abstractmethod
+    async def start(self, handler: EventHandler):
+        """Begin delivering events from other workers to handler"""
+
+    async def close(self):
+        """Stop delivering events and release resources"""
+
+class SQLiteEventBus(MCPEventBus):
+    """
+    Event bus over a table in a shared SQLite file.
+
+    Each worker appends events and polls for rows newer than the last one it saw,
+    so delivery latency is bounded by poll_interval. Rows older than retention are
+    pruned. This is a single-host stand-in for a real message broker.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.02, retention: float = 60.0):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._conn = connect_shared_sqlite(path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                origin TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            """
+        )
+        self._last_id = 0
+        self._poller: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def publish(self, kind: str, payload: Dict[str, Any]):
+        row = (self.worker_id, kind, json.dumps(payload, default=str), time.time())
+        async with self._lock:
+            await asyncio.to_thread(
+                self._conn.execute,
+                "INSERT INTO events (origin, kind, payload, created) VALUES (?, ?, ?, ?)",
+                row
+            )
+
+    async def start(self, handler: EventHandler):
+        # Only events published from now on are delivered
+        self._last_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        self._poller = asyncio.create_task(self._poll_loop(handler))
+
+    def _fetch(self) -> List[Tuple[int, str, str, str]]:
+        return self._conn.execute(
+            "SELECT id, origin, kind, payload FROM events WHERE id > ? ORDER BY id",
+            (self._last_id,)
+        ).fetchall()
+
+    def _prune(self):
+        self._conn.execute("DELETE FROM events WHERE created < ?", (time.time() - self.retention,))
+
+    async def _poll_loop(self, handler: EventHandler):
+        last_prune = time.monotonic()
+        while True:
+            try:
+                async with self._lock:
+                    rows = await asyncio.to_thread(self._fetch)
+                    if time.monotonic() - last_prune > self.retention:
+                        await asyncio.to_thread(self._prune)
+                        last_prune = time.monotonic()
+                for event_id, origin, kind, payload in rows:
+                    self._last_id = event_id
+                    if origin == self.worker_id:
+                        continue
+                    try:
+                        await handler(kind, json.loads(payload))
+                    except Exception as e:
+                        logger.error(f"Event handler failed for {kind}: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Event bus poll failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def close(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+        async with self._lock:
+            self._conn.close()
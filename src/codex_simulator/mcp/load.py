@@ -0,0 +1,77 @@
+"""
+MCP Load Metrics
+Process load sampling for heartbeats and the load score used to rank agents.
+"""
+
+import os
+import sys
+import time
+from typing import Dict, Optional
+
+try:
+    import psutil
+except ImportError:  # psutil is optional; /proc and getrusage cover the basics
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Unix only
+    resource = None
+
+# Heartbeat load_metrics keys
+IN_FLIGHT = "in_flight"
+QUEUE_DEPTH = "queue_depth"
+RSS_BYTES = "rss_bytes"
+CPU_PERCENT = "cpu_percent"
+
+def _rss_bytes() -> Optional[float]:
+    """Current resident set size of this process, or None where it can't be read"""
+    if psutil is not None:
+        return float(psutil.Process().memory_info().rss)
+    try:
+        with open("/proc/self/statm") as statm:
+            return float(int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    # Peak rather than current RSS; kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return float(peak if sys.platform == "darwin" else peak * 1024)
+
+class ProcessLoadSampler:
+    """
+    Samples RSS and CPU usage of the current process.
+
+    RSS is left out where it can't be read, e.g. on Windows without psutil.
+    CPU is the share of one core used since the previous sample, computed from
+    process CPU time, so the first sample covers the time since construction.
+    """
+
+    def __init__(self):
+        self._last_wall = time.monotonic()
+        self._last_cpu = time.process_time()
+
+    def sample(self) -> Dict[str, float]:
+        now_wall = time.monotonic()
+        now_cpu = time.process_time()
+        elapsed = now_wall - self._last_wall
+        cpu_percent = 100.0 * (now_cpu - self._last_cpu) / elapsed if elapsed > 0 else 0.0
+        self._last_wall, self._last_cpu = now_wall, now_cpu
+        metrics = {CPU_PERCENT: round(cpu_percent, 2)}
+        rss = _rss_bytes()
+        if rss is not None:
+            metrics[RSS_BYTES] = rss
+        return metrics
+
+def load_score(load_metrics: Optional[Dict[str, float]]) -> float:
+    """
+    Rank key for placing work: lower means less busy.
+
+    Outstanding and queued requests dominate; CPU breaks ties between agents with
+    the same backlog. Agents that report nothing rank after idle reporting agents.
+    """
+    if not load_metrics:
+        return 1.0
+    backlog = load_metrics.get(IN_FLIGHT, 0.0) + load_metrics.get(QUEUE_DEPTH, 0.0)
+    return backlog + min(load_metrics.get(CPU_PERCENT, 0.0), 100.0) / 100.0
@@ -0,0 +1,176 @@
+"""
+MCP In-Process Transport
+Connects an MCPClient to an MCPServer in the same process and event loop, passing
+message models through asyncio queues instead of sockets and wire encodings.
+"""
+
+import asyncio
+import weakref
+from typing import TYPE_CHECKING, Any, AsyncIterator, Optional
+from urllib.parse import urlsplit
+
+from pydantic import BaseModel
+
+from .codec import MCPCodec
+from .schemas import MCPMessage, validate_mcp_message
+from .outbound import ConnectionClosedError
+
+if TYPE_CHECKING:
+    from .server import MCPServer
+
+LOCAL_SCHEME = "local"
+
+# Host names that all reach a server listening on the loopback interface
+_LOOPBACK_HOSTS = {"localhost", "127.0.0.1", "::1", "0.0.0.0", "::"}
+
+class LocalCodec(MCPCodec):
+    """
+    Encoding for in-process connections, which skips serialization entirely.
+
+    With validate, frames are the JSON form of each message as plain Python data,
+    which the receiver validates just as it would a decoded wire frame. Without
+    it the sender's model instance is handed over as is.
+    """
+    content_type = ""
+    binary = False
+
+    def __init__(self, validate: bool = True):
+        self.validate = validate
+        self.name = "local" if validate else "local.trusted"
+
+    @property
+    def subprotocol(self) -> str:
+        return ""
+
+    def encode(self, message: BaseModel) -> Any:
+        if not self.validate:
+            return message
+        return message.model_dump(mode="json")
+
+    def loads(self, data: Any) -> Any:
+        return data
+
+    def decode(self, data: Any, trusted: bool = False) -> MCPMessage:
+        if isinstance(data, BaseModel):
+            return data
+        return validate_mcp_message(data, trusted=trusted)
+
+LOCAL_CODEC = LocalCodec(validate=True)
+LOCAL_TRUSTED_CODEC = LocalCodec(validate=False)
+
+# Marks the end of a queue's stream when either side closes
+_CLOSED = object()
+
+class LocalConnection:
+    """
+    Both ends of an in-process MCP connection.
+
+    The client uses it like a websockets connection: send() queues a request and
+    iterating yields the server's frames. The server reads requests with
+    receive() and writes frames with send_frame(). Queues are unbounded, like a
+    socket buffer; the server's outbound queue still applies its slow-consumer
+    policy to broadcasts.
+    """
+
+    def __init__(self, agent_id: str, codec: LocalCodec):
+        self.agent_id = agent_id
+        self.codec = codec
+        self.subprotocol = None
+        self.close_code: Optional[int] = None
+        self.close_reason = ""
+        self._requests: asyncio.Queue = asyncio.Queue()
+        self._frames: asyncio.Queue = asyncio.Queue()
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    # Client end
+
+    async def send(self, frame: Any):
+        """Queue an already encoded request for the server"""
+        if self._closed:
+            raise ConnectionClosedError(f"Local connection {self.agent_id} is closed")
+        self._requests.put_nowait(frame)
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        while True:
+            frame = await self._frames.get()
+            if frame is _CLOSED:
+                return
+            yield frame
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        """Close both directions; either side may call this"""
+        if self._closed:
+            return
+        self._closed = True
+        self.close_code, self.close_reason = code, reason
+        self._requests.put_nowait(_CLOSED)
+        self._frames.put_nowait(_CLOSED)
+
+    # Server end
+
+    async def receive(self) -> Any:
+        """
+        Wait for the next request from the client.
+
+        Raises:
+            ConnectionClosedError: Once the connection is closed
+        """
+        frame = await self._requests.get()
+        if frame is _CLOSED:
+            raise ConnectionClosedError(f"Local connection {self.agent_id} is closed")
+        return frame
+
+    async def send_frame(self, frame: Any):
+        """Deliver an already encoded frame to the client"""
+        if self._closed:
+            raise ConnectionClosedError(f"Local connection {self.agent_id} is closed")
+        self._frames.put_nowait(frame)
+
+# url -> server; servers drop out when garbage collected
+_local_servers: "weakref.WeakValueDictionary[str, MCPServer]" = weakref.WeakValueDictionary()
+
+def _normalize_url(url: str) -> str:
+    """Key for the server registry: scheme, loopback-agnostic host and port"""
+    parts = urlsplit(url.rstrip("/"))
+    if parts.scheme == LOCAL_SCHEME:
+        return f"{LOCAL_SCHEME}://{parts.netloc}"
+    if parts.scheme == "unix":
+        return f"unix://{parts.netloc}{parts.path}"
+    host = parts.hostname or ""
+    if host in _LOOPBACK_HOSTS:
+        host = "localhost"
+    port = parts.port or (443 if parts.scheme in ("https", "wss") else 80)
+    return f"{host}:{port}"
+
+def register_local_server(url: str, server: "MCPServer"):
+    """Make server reachable in-process under url (local://name, or the URL it listens on)"""
+    _local_servers[_normalize_url(url)] = server
+
+def unregister_local_server(url: str, server: "MCPServer"):
+    """Remove a registration made by register_local_server, if it still points at server"""
+    key = _normalize_url(url)
+    if _local_servers.get(key) is server:
+        del _local_servers[key]
+
+def find_local_server(url: str) -> Optional["MCPServer"]:
+    """
+    The server in this process serving url, if a client on the running loop can use it.
+
+    A server bound to another event loop, such as one running in its own thread,
+    is not returned; clients reach it over the network as usual.
+    """
+    server = _local_servers.get(_normalize_url(url))
+    if server is None:
+        return None
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    return server if server.loop in (None, loop) else None
+
+def is_local_url(url: str) -> bool:
+    return urlsplit(url).scheme == LOCAL_SCHEME
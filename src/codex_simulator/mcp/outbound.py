@@ -0,0 +1,185 @@
+"""
+MCP Outbound Queues
+Per-connection send queues so one slow WebSocket client cannot stall the others.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Literal, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SlowConsumerPolicy = Literal["drop_oldest", "drop_newest", "disconnect"]
+
+# Sends an already encoded frame on the connection
+FrameSender = Callable[[Any], Awaitable[None]]
+# Closes the connection with a WebSocket close code and reason
+ConnectionCloser = Callable[[int, str], Awaitable[None]]
+
+# RFC 6455 "policy violation", used when a consumer falls too far behind
+SLOW_CONSUMER_CLOSE_CODE = 1008
+
+class ConnectionClosedError(ConnectionError):
+    """Raised for frames that can no longer be sent because the connection is closed"""
+
+class OutboundQueue:
+    """
+    Bounded queue of encoded frames drained by a single writer task.
+
+    Responses are sent with send(), which waits for the frame to be written and
+    applies backpressure to the handler that produced it. Broadcasts use offer(),
+    which never waits: when the queue is full the slow-consumer policy decides
+    whether to drop the oldest queued broadcast, drop the new one, or disconnect
+    the client. Responses are never dropped.
+    """
+
+    def __init__(
+        self,
+        send_frame: FrameSender,
+        close_connection: ConnectionCloser,
+        max_size: int = 256,
+        policy: SlowConsumerPolicy = "drop_oldest",
+        close_timeout: float = 5.0,
+        name: str = ""
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.send_frame = send_frame
+        self.close_connection = close_connection
+        self.max_size = max_size
+        self.policy = policy
+        self.close_timeout = close_timeout
+        self.name = name
+
+        # (frame, future) pairs; broadcasts carry no future
+        self._frames: Deque[Tuple[Any, Optional[asyncio.Future]]] = deque()
+        self._ready = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._writer: Optional[asyncio.Task] = None
+        self._closed = False
+        self._stats = {"sent": 0, "dropped": 0, "disconnects": 0, "max_depth": 0}
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def start(self):
+        """Start the writer task"""
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+
+    def _push(self, frame: Any, future: Optional[asyncio.Future]):
+        self._frames.append((frame, future))
+        self._stats["max_depth"] = max(self._stats["max_depth"], len(self._frames))
+        self._ready.set()
+
+    async def send(self, frame: Any):
+        """Queue a frame and wait until it has been written"""
+        if self._closed:
+            raise ConnectionClosedError(f"Connection {self.name} is closed")
+        async with self._space:
+            await self._space.wait_for(lambda: self._closed or len(self._frames) < self.max_size)
+        if self._closed:
+            raise ConnectionClosedError(f"Connection {self.name} is closed")
+        future = asyncio.get_running_loop().create_future()
+        self._push(frame, future)
+        await future
+
+    def offer(self, frame: Any) -> bool:
+        """
+        Queue a frame without waiting.
+
+        Returns False if the frame was dropped or the connection is closed.
+        """
+        if self._closed:
+            return False
+        if len(self._frames) < self.max_size:
+            self._push(frame, None)
+            return True
+
+        if self.policy == "disconnect":
+            logger.warning(f"Disconnecting slow consumer {self.name}: {len(self._frames)} frames queued")
+            self._stats["disconnects"] += 1
+            # Refuse further frames right away; close() finishes the teardown
+            self._closed = True
+            asyncio.create_task(self.close(SLOW_CONSUMER_CLOSE_CODE, "slow consumer"))
+            return False
+
+        if self.policy == "drop_oldest":
+            for index, (_, future) in enumerate(self._frames):
+                if future is None:
+                    del self._frames[index]
+                    self._stats["dropped"] += 1
+                    self._push(frame, None)
+                    return True
+
+        # drop_newest, or a queue holding only responses
+        self._stats["dropped"] += 1
+        return False
+
+    async def _write_loop(self):
+        while True:
+            await self._ready.wait()
+            while self._frames:
+                frame, future = self._frames.popleft()
+                async with self._space:
+                    self._space.notify()
+                if future is not None and future.done():
+                    continue
+                try:
+                    await self.send_frame(frame)
+                except asyncio.CancelledError:
+                    if future is not None and not future.done():
+                        future.set_exception(ConnectionClosedError(f"Connection {self.name} is closed"))
+                    raise
+                except Exception as e:
+                    if future is not None and not future.done():
+                        future.set_exception(e)
+                    logger.error(f"Failed to send to {self.name}: {e}")
+                    await self._fail_pending(ConnectionClosedError(f"Connection {self.name} failed: {e}"))
+                    return
+                self._stats["sent"] += 1
+                if future is not None and not future.done():
+                    future.set_result(None)
+            self._ready.clear()
+
+    async def _fail_pending(self, error: Exception):
+        """Mark the queue closed and fail every frame still waiting to be sent"""
+        self._closed = True
+        while self._frames:
+            _, future = self._frames.popleft()
+            if future is not None and not future.done():
+                future.set_exception(error)
+        async with self._space:
+            self._space.notify_all()
+
+    async def close(self, code: Optional[int] = None, reason: str = ""):
+        """
+        Stop the writer and discard queued frames.
+
+        With a close code the connection itself is closed too, which ends the
+        client's receive loop.
+        """
+        if self._closed and self._writer is None:
+            return
+        await self._fail_pending(ConnectionClosedError(f"Connection {self.name} is closed"))
+        writer, self._writer = self._writer, None
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+            try:
+                await writer
+            except (asyncio.CancelledError, Exception):
+                pass
+        if code is not None:
+            try:
+                await asyncio.wait_for(self.close_connection(code, reason), timeout=self.close_timeout)
+            except Exception as e:
+                logger.debug(f"Closing {self.name} failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return queue counters"""
+        return {**self._stats, "depth": len(self._frames), "closed": self._closed}
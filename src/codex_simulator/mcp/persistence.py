@@ -0,0 +1,265 @@
+"""
+MCP State Persistence
+Write-ahead log and snapshots so shared context survives server restarts.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, IO, Iterable, List, Literal, Optional, Tuple
+
+from .context_store import ContextStore
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder produces the same format
+    orjson = None
+
+SyncMode = Literal["batch", "always", "off"]
+
+SNAPSHOT_FILE = "snapshot.json"
+WAL_PREFIX = "wal-"
+WAL_SUFFIX = ".log"
+
+def _dumps(record: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record, default=str)
+    return json.dumps(record, default=str, separators=(",", ":")).encode("utf-8")
+
+def _loads(line: bytes) -> Dict[str, Any]:
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+class StatePersistence:
+    """
+    Durable record of context updates.
+
+    Updates are appended to an in-memory buffer and written to the WAL by a background
+    flusher, which group-commits everything buffered with a single fsync. After
+    snapshot_every records the store is snapshotted and older WAL segments are deleted.
+
+    Sync modes:
+        batch: acknowledge immediately, fsync every flush_interval (default)
+        always: wait for the fsync covering the update before acknowledging
+        off: write without fsync, leaving durability to the OS
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        scopes: Iterable[str] = ("global", "session"),
+        sync_mode: SyncMode = "batch",
+        flush_interval: float = 0.05,
+        max_batch_records: int = 1000,
+        snapshot_every: int = 10_000
+    ):
+        self.directory = Path(directory)
+        self.scopes = tuple(scopes)
+        self.sync_mode = sync_mode
+        self.flush_interval = flush_interval
+        self.max_batch_records = max_batch_records
+        self.snapshot_every = snapshot_every
+
+        self._store: Optional[ContextStore] = None
+        self._seq = 0
+        self._buffer: List[bytes] = []
+        self._buffer_waiters: List[asyncio.Future] = []
+        self._wal: Optional[IO[bytes]] = None
+        self._records_since_snapshot = 0
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._stats = {"records": 0, "flushes": 0, "snapshots": 0, "replayed": 0}
+
+    async def recover(self, store: ContextStore) -> int:
+        """
+        Load the latest snapshot and replay newer WAL records into the store.
+
+        Returns the number of WAL records replayed.
+        """
+        self._store = store
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        snapshot_seq = 0
+        snapshot_path = self.directory / SNAPSHOT_FILE
+        if snapshot_path.exists():
+            snapshot = _loads(await asyncio.to_thread(snapshot_path.read_bytes))
+            snapshot_seq = snapshot["seq"]
+            for scope, namespace, key, value in snapshot["entries"]:
+                await store.apply_updates(scope, namespace, {key: value}, "replace")
+
+        replayed = 0
+        self._seq = snapshot_seq
+        for record in await asyncio.to_thread(self._read_wal_records):
+            # Replaying only newer records keeps non-idempotent appends exact
+            if record["seq"] <= snapshot_seq:
+                continue
+            await store.apply_updates(record["scope"], record["ns"], record["updates"], record["strategy"])
+            if record.get("deleted"):
+                await store.delete(record["scope"], record["ns"], record["deleted"])
+            self._seq = record["seq"]
+            replayed += 1
+
+        self._stats["replayed"] = replayed
+        self._records_since_snapshot = replayed
+        logger.info(f"Recovered MCP state at sequence {self._seq} ({replayed} WAL records replayed)")
+        return replayed
+
+    def _wal_segments(self) -> List[Path]:
+        return sorted(self.directory.glob(f"{WAL_PREFIX}*{WAL_SUFFIX}"))
+
+    def _read_wal_records(self) -> List[Dict[str, Any]]:
+        records = []
+        for segment in self._wal_segments():
+            with open(segment, "rb") as wal:
+                for line in wal:
+                    try:
+                        records.append(_loads(line))
+                    except ValueError:
+                        # A torn final write from a crash; nothing after it was acknowledged durable
+                        logger.warning(f"Ignoring truncated WAL record in {segment.name}")
+                        break
+        return records
+
+    def start(self):
+        """Open a fresh WAL segment and start the background flusher"""
+        if self._store is None:
+            raise RuntimeError("recover() must be called before start()")
+        self._open_segment()
+        self._flush_requested = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    def _open_segment(self):
+        if self._wal is not None:
+            self._wal.close()
+        segment = self.directory / f"{WAL_PREFIX}{self._seq + 1:016d}{WAL_SUFFIX}"
+        self._wal = open(segment, "ab")
+
+    async def record(
+        self,
+        scope: str,
+        namespace: str,
+        updates: Dict[str, Any],
+        merge_strategy: str,
+        deleted_keys: Optional[List[str]] = None
+    ):
+        """Log an applied update; in "always" mode, wait until it is on disk"""
+        if scope not in self.scopes or self._wal is None:
+            return
+
+        self._seq += 1
+        record = {
+            "seq": self._seq,
+            "scope": scope,
+            "ns": namespace,
+            "updates": updates,
+            "strategy": merge_strategy
+        }
+        if deleted_keys:
+            record["deleted"] = deleted_keys
+        self._buffer.append(_dumps(record) + b"\n")
+        self._records_since_snapshot += 1
+        self._stats["records"] += 1
+
+        if self.sync_mode == "always":
+            waiter = asyncio.get_running_loop().create_future()
+            self._buffer_waiters.append(waiter)
+            self._flush_requested.set()
+            await waiter
+        elif len(self._buffer) >= self.max_batch_records:
+            self._flush_requested.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+                if self._records_since_snapshot >= self.snapshot_every:
+                    await self.snapshot()
+            except Exception as e:
+                logger.error(f"State persistence flush failed: {e}")
+
+    async def flush(self):
+        """Write buffered records to the WAL with one fsync"""
+        if not self._buffer or self._wal is None:
+            return
+        batch, self._buffer = self._buffer, []
+        waiters, self._buffer_waiters = self._buffer_waiters, []
+        wal = self._wal
+        try:
+            await asyncio.to_thread(self._write_batch, wal, batch)
+        except Exception as e:
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            raise
+        self._stats["flushes"] += 1
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _write_batch(self, wal: IO[bytes], batch: List[bytes]):
+        wal.write(b"".join(batch))
+        wal.flush()
+        if self.sync_mode != "off":
+            os.fsync(wal.fileno())
+
+    async def snapshot(self):
+        """Write a compact snapshot of the store and drop WAL segments it covers"""
+        if self._store is None:
+            return
+        # Capture state and sequence together; later updates go to a new segment. The
+        # in-memory store exports without yielding; SQLite stores are durable without a WAL
+        seq = self._seq
+        entries = await self._store.export_entries(self.scopes)
+        await self.flush()
+        old_segments = self._wal_segments()
+        self._open_segment()
+        self._records_since_snapshot = 0
+
+        await asyncio.to_thread(self._write_snapshot, seq, entries)
+        for segment in old_segments:
+            segment.unlink(missing_ok=True)
+        self._stats["snapshots"] += 1
+
+    def _write_snapshot(self, seq: int, entries: List[Tuple[str, str, str, Any]]):
+        path = self.directory / SNAPSHOT_FILE
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "wb") as snapshot:
+            snapshot.write(_dumps({"seq": seq, "entries": entries}))
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        # Atomic rename: readers see either the old or the new snapshot, never a partial one
+        os.replace(temp_path, path)
+
+    async def close(self):
+        """Flush outstanding records, snapshot and close the WAL"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        if self._wal is not None:
+            await self.flush()
+            await self.snapshot()
+            self._wal.close()
+            self._wal = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return persistence counters"""
+        return {
+            **self._stats,
+            "seq": self._seq,
+            "buffered": len(self._buffer),
+            "sync_mode": self.sync_mode
+        }
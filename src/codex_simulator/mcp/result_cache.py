@@ -0,0 +1,279 @@
+"""
+MCP Result Cache
+TTL caching and request coalescing for idempotent tool invocations.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Dependency key that invalidates every cached result
+INVALIDATE_ALL = "*"
+
+DependencyFunc = Callable[[Dict[str, Any]], Iterable[str]]
+
+@dataclass
+class ToolCachePolicy:
+    """Caching behaviour declared for a tool at registration"""
+    idempotent: bool = False
+    ttl: float = 30.0
+    depends_on: Optional[DependencyFunc] = None
+    invalidates: Optional[DependencyFunc] = None
+
+@dataclass
+class _CacheEntry:
+    value: Any
+    expires_at: float
+    dependencies: Tuple[str, ...]
+
+@dataclass
+class _Flight:
+    """One in-progress execution shared by every identical caller"""
+    task: asyncio.Task
+    dependencies: Tuple[str, ...]
+    waiters: int = 0
+    stale: bool = False
+
+def _dependency_matches(dependency: str, changed: str) -> bool:
+    """Whether a change to `changed` affects a result depending on `dependency`"""
+    if changed == INVALIDATE_ALL or dependency == changed:
+        return True
+    # Path-like keys: a change inside a directory, or to a directory, affects both sides
+    return (
+        changed.startswith(dependency.rstrip("/") + "/")
+        or dependency.startswith(changed.rstrip("/") + "/")
+    )
+
+class MCPResultCache:
+    """Caches idempotent tool results and coalesces concurrent identical calls"""
+
+    def __init__(self, max_entries: int = 1024, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.policies: Dict[str, ToolCachePolicy] = {}
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, _Flight] = {}
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._invalidated = 0
+
+    def configure_tool(
+        self,
+        name: str,
+        idempotent: bool = False,
+        ttl: float = 30.0,
+        depends_on: Optional[DependencyFunc] = None,
+        invalidates: Optional[DependencyFunc] = None
+    ):
+        """Record a tool's caching policy"""
+        self.remove_tool(name)
+        if idempotent or invalidates is not None:
+            self.policies[name] = ToolCachePolicy(idempotent, ttl, depends_on, invalidates)
+
+    def remove_tool(self, name: str):
+        """Forget a tool's policy and its cached results"""
+        self.policies.pop(name, None)
+        prefix = f"{name}:"
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+
+    def is_cacheable(self, name: str) -> bool:
+        policy = self.policies.get(name)
+        return policy is not None and policy.idempotent
+
+    def make_key(self, tool_name: str, arguments: Dict[str, Any]) -> Optional[str]:
+        """Canonical cache key, or None if the arguments cannot be serialized"""
+        try:
+            return f"{tool_name}:{json.dumps(arguments, sort_keys=True, separators=(',', ':'))}"
+        except (TypeError, ValueError):
+            return None
+
+    async def get_or_run(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        run: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Return a cached result, join an identical in-flight call, or start a new one.
+
+        The shared execution is cancelled only when every caller waiting on it gives up.
+        """
+        key = self.make_key(tool_name, arguments)
+        if key is None:
+            return await run()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > self.clock():
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry.value
+            del self._entries[key]
+
+        flight = self._inflight.get(key)
+        if flight is None:
+            self._misses += 1
+            flight = _Flight(
+                task=asyncio.ensure_future(run()),
+                dependencies=self._dependencies(tool_name, arguments)
+            )
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda task: self._complete(tool_name, key, flight))
+        else:
+            self._coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    def _dependencies(self, tool_name: str, arguments: Dict[str, Any]) -> Tuple[str, ...]:
+        policy = self.policies.get(tool_name)
+        if policy is None or policy.depends_on is None:
+            return ()
+        try:
+            return tuple(policy.depends_on(arguments))
+        except Exception as e:
+            logger.warning(f"Could not compute cache dependencies for '{tool_name}': {e}")
+            return ()
+
+    def _complete(self, tool_name: str, key: str, flight: _Flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+        task = flight.task
+        policy = self.policies.get(tool_name)
+        # Failures are never cached, nor results that were invalidated while running
+        if task.cancelled() or task.exception() is not None or flight.stale or policy is None:
+            return
+
+        self._entries[key] = _CacheEntry(
+            value=task.result(),
+            expires_at=self.clock() + policy.ttl,
+            dependencies=flight.dependencies
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidation_keys(self, tool_name: str, arguments: Dict[str, Any]) -> List[str]:
+        """Keys a tool declared it changes for these arguments"""
+        policy = self.policies.get(tool_name)
+        if policy is None or policy.invalidates is None:
+            return []
+        try:
+            return list(policy.invalidates(arguments))
+        except Exception as e:
+            logger.warning(f"Could not compute invalidations for '{tool_name}': {e}")
+            return [INVALIDATE_ALL]
+
+    def invalidate_for(self, tool_name: str, arguments: Dict[str, Any]) -> int:
+        """Apply the invalidations a tool declared for these arguments"""
+        return self.invalidate(self.invalidation_keys(tool_name, arguments))
+
+    def invalidate(self, changed: Iterable[str]) -> int:
+        """Drop cached results depending on any of the changed keys; returns how many"""
+        changed = list(changed)
+        if not changed:
+            return 0
+
+        def affected(dependencies: Iterable[str]) -> bool:
+            return any(
+                _dependency_matches(dependency, key)
+                for dependency in dependencies for key in changed
+            )
+
+        stale: List[str] = [
+            key for key, entry in self._entries.items()
+            if INVALIDATE_ALL in changed or affected(entry.dependencies)
+        ]
+        for key in stale:
+            del self._entries[key]
+        for flight in self._inflight.values():
+            if INVALIDATE_ALL in changed or affected(flight.dependencies):
+                flight.stale = True
+
+        self._invalidated += len(stale)
+        return len(stale)
+
+    def clear(self):
+        """Drop every cached result"""
+        self._entries.clear()
+        for flight in self._inflight.values():
+            flight.stale = True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return cache effectiveness statistics"""
+        return {
+            "entries": len(self._entries),
+            "in_flight": len(self._inflight),
+            "hits": self._hits,
+            "misses": self._misses,
+            "coalesced": self._coalesced,
+            "invalidated": self._invalidated
+        }
+
+class IdempotencyCache:
+    """
+    Remembers responses by client-supplied idempotency key so a retried request runs once.
+
+    Responses are kept in this process; workers sharing a port use SQLiteIdempotencyCache
+    instead. A retry that arrives while the original is still running waits for it. Unlike
+    MCPResultCache, the original execution is not cancelled when its caller goes away:
+    a client that timed out is expected to retry and collect the result.
+    """
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 10_000, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._responses: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._stats = {"executed": 0, "replayed": 0, "joined": 0}
+
+    async def run(self, key: str, run: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the stored response for key, join its in-flight execution, or start it"""
+        stored = self._responses.get(key)
+        if stored is not None:
+            if stored[0] > self.clock():
+                self._stats["replayed"] += 1
+                return stored[1]
+            del self._responses[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self._stats["executed"] += 1
+            task = asyncio.ensure_future(run())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._complete(key, done))
+        else:
+            self._stats["joined"] += 1
+        return await asyncio.shield(task)
+
+    def _complete(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Failed executions are not remembered, so a retry runs the request again
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._responses[key] = (self.clock() + self.ttl, task.result())
+        while len(self._responses) > self.max_entries:
+            self._responses.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return idempotency counters"""
+        return {**self._stats, "stored": len(self._responses), "in_flight": len(self._inflight)}
+
+    async def close(self):
+        """Release backend resources"""
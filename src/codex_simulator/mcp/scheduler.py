@@ -0,0 +1,366 @@
+"""
+MCP Tool Scheduler
+Priority scheduling, concurrency limits and admission control for tool execution.
+"""
+
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, List, Literal, Optional
+
+from ..utils.cancellation import CancellationToken
+
+logger = logging.getLogger(__name__)
+
+ToolKind = Literal["async", "io", "cpu"]
+
+class MCPServerBusyError(RuntimeError):
+    """Raised when the scheduler queue is full and a request is rejected"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+@dataclass
+class ToolExecutionConfig:
+    """How a registered tool is executed"""
+    kind: ToolKind = "io"
+    max_concurrency: Optional[int] = None
+    accepts_cancel_token: bool = False
+
+@dataclass(order=True)
+class _ScheduledJob:
+    """A queued tool invocation, ordered by priority then arrival"""
+    priority: int
+    sequence: int
+    tool_name: str = field(compare=False)
+    func: Callable = field(compare=False)
+    arguments: Dict[str, Any] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+def _process_worker_main(conn: Connection):
+    """Worker process loop: run (func, arguments) jobs and send back (ok, value)"""
+    while True:
+        try:
+            func, arguments = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            reply = (True, func(**arguments))
+        except BaseException as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # Results or exceptions that cannot be pickled are reported as text
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+class _ProcessWorker:
+    """A long-lived worker process owned by one job at a time"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_process_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        # The pipe is left to the reader thread, which sees EOF and drops it
+        self.process.kill()
+
+class _KillableProcessPool:
+    """
+    Process pool whose workers can be killed individually.
+
+    ProcessPoolExecutor cannot stop a running task, so a timed-out job there keeps its
+    worker busy until it finishes. Here cancelling a job kills its worker and a fresh
+    one is started for the next job.
+
+    Replies are awaited on threads of the pool's own, one per worker, so CPU jobs
+    never hold threads of the loop's default executor.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._context = multiprocessing.get_context()
+        self._idle: List[_ProcessWorker] = []
+        self._live: List[_ProcessWorker] = []
+        self._workers = 0
+        self._available = asyncio.Condition()
+        self._receivers = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mcp-cpu-recv")
+
+    async def run(self, func: Callable, arguments: Dict[str, Any]) -> Any:
+        worker = await self._acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            worker.conn.send((func, arguments))
+            ok, value = await loop.run_in_executor(self._receivers, worker.conn.recv)
+        except BaseException:
+            # Cancelled or broken: the worker may be mid-task, so it is not reused.
+            # Its receiver thread sees EOF once it dies and is then free again.
+            worker.kill()
+            loop.run_in_executor(self._receivers, worker.process.join)
+            self._live.remove(worker)
+            await self._release(None)
+            raise
+        await self._release(worker)
+        if not ok:
+            raise value
+        return value
+
+    async def _acquire(self) -> _ProcessWorker:
+        async with self._available:
+            while not self._idle and self._workers >= self.max_workers:
+                await self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._workers += 1
+        try:
+            worker = _ProcessWorker(self._context)
+            self._live.append(worker)
+            return worker
+        except BaseException:
+            await self._release(None)
+            raise
+
+    async def _release(self, worker: Optional[_ProcessWorker]):
+        async with self._available:
+            if worker is None:
+                self._workers -= 1
+            else:
+                self._idle.append(worker)
+            self._available.notify()
+
+    def shutdown(self):
+        for worker in self._live:
+            worker.kill()
+        self._live.clear()
+        self._idle.clear()
+        self._receivers.shutdown(wait=False)
+
+class MCPToolScheduler:
+    """Runs tool invocations by priority under global and per-tool concurrency limits"""
+
+    def __init__(
+        self,
+        max_concurrent: int = 10,
+        max_queue_size: int = 100,
+        io_workers: Optional[int] = None,
+        cpu_workers: Optional[int] = None,
+        retry_after: float = 1.0
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue_size = max_queue_size
+        self.io_workers = io_workers or max_concurrent
+        self.cpu_workers = cpu_workers or os.cpu_count() or 1
+        self.retry_after = retry_after
+        self.tool_configs: Dict[str, ToolExecutionConfig] = {}
+        self._queue: List[_ScheduledJob] = []
+        self._sequence = itertools.count()
+        self._running = 0
+        self._running_per_tool: Dict[str, int] = {}
+        self._rejected = 0
+        self._completed = 0
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[_KillableProcessPool] = None
+
+    def configure_tool(
+        self,
+        name: str,
+        func: Callable,
+        kind: Optional[ToolKind] = None,
+        max_concurrency: Optional[int] = None
+    ):
+        """Record how a tool should be executed"""
+        if kind is None:
+            kind = "async" if asyncio.iscoroutinefunction(func) else "io"
+
+        if kind == "cpu":
+            # Process pool work has to cross a process boundary
+            try:
+                pickle.dumps(func)
+            except Exception as e:
+                logger.warning(f"Tool '{name}' cannot be pickled ({e}); running it in the thread pool")
+                kind = "io"
+
+        self.tool_configs[name] = ToolExecutionConfig(
+            kind=kind,
+            max_concurrency=max_concurrency,
+            accepts_cancel_token=kind != "cpu" and _accepts_cancel_token(func)
+        )
+
+    def remove_tool(self, name: str):
+        """Forget a tool's execution settings"""
+        self.tool_configs.pop(name, None)
+
+    async def submit(self, tool_name: str, func: Callable, arguments: Dict[str, Any], priority: int = 5) -> Any:
+        """
+        Queue a tool invocation and wait for its result.
+
+        Raises:
+            MCPServerBusyError: If the queue is full
+        """
+        can_start = self._running < self.max_concurrent and self._has_capacity(tool_name)
+        if len(self._queue) >= self.max_queue_size and not can_start:
+            self._rejected += 1
+            raise MCPServerBusyError(
+                f"Server busy: {len(self._queue)} requests queued", retry_after=self.retry_after
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._queue,
+            _ScheduledJob(priority, next(self._sequence), tool_name, func, arguments, future)
+        )
+        self._dispatch()
+
+        try:
+            return await future
+        finally:
+            # A caller that gave up while queued must not leave the job behind
+            if not future.done():
+                future.cancel()
+
+    def _has_capacity(self, tool_name: str) -> bool:
+        config = self.tool_configs.get(tool_name)
+        if config is None or config.max_concurrency is None:
+            return True
+        return self._running_per_tool.get(tool_name, 0) < config.max_concurrency
+
+    def _dispatch(self):
+        """Start queued jobs while global and per-tool limits allow"""
+        deferred: List[_ScheduledJob] = []
+
+        while self._queue and self._running < self.max_concurrent:
+            job = heapq.heappop(self._queue)
+            if job.future.done():
+                continue
+            if not self._has_capacity(job.tool_name):
+                deferred.append(job)
+                continue
+            self._start(job)
+
+        for job in deferred:
+            heapq.heappush(self._queue, job)
+
+    def _start(self, job: _ScheduledJob):
+        self._running += 1
+        self._running_per_tool[job.tool_name] = self._running_per_tool.get(job.tool_name, 0) + 1
+        config = self.tool_configs.get(job.tool_name) or ToolExecutionConfig()
+        loop = asyncio.get_running_loop()
+
+        arguments = job.arguments
+        token: Optional[CancellationToken] = None
+        if config.accepts_cancel_token:
+            token = CancellationToken()
+            arguments = {**arguments, "cancel_token": token}
+
+        if config.kind in ("async", "cpu"):
+            if config.kind == "async":
+                # Calling inside the task lands bad arguments on it, so the slot is still released
+                execution = asyncio.ensure_future(_call_async(job.func, arguments))
+            else:
+                # Cancelling this task kills the worker process running the job
+                execution = asyncio.ensure_future(self._get_process_pool().run(job.func, arguments))
+            execution.add_done_callback(lambda _: self._finish(job))
+        else:
+            concurrent_future: Future = self._get_thread_pool().submit(partial(job.func, **arguments))
+
+            def _finish_threadsafe(_):
+                try:
+                    loop.call_soon_threadsafe(self._finish, job)
+                except RuntimeError:
+                    pass  # The event loop is already closed
+
+            # The slot is held until the worker is really done, even if the caller gave up
+            concurrent_future.add_done_callback(_finish_threadsafe)
+            execution = asyncio.wrap_future(concurrent_future, loop=loop)
+
+        def _relay(done: asyncio.Future):
+            if job.future.done():
+                return
+            if done.cancelled():
+                job.future.cancel()
+            elif done.exception() is not None:
+                job.future.set_exception(done.exception())
+            else:
+                job.future.set_result(done.result())
+
+        def _cancel(f: asyncio.Future):
+            if not f.cancelled():
+                return
+            # Threads cannot be interrupted; tools taking a token stop themselves
+            if token is not None:
+                token.cancel()
+            execution.cancel()
+
+        execution.add_done_callback(_relay)
+        job.future.add_done_callback(_cancel)
+
+    def _finish(self, job: _ScheduledJob):
+        self._running -= 1
+        self._completed += 1
+        remaining = self._running_per_tool.get(job.tool_name, 1) - 1
+        if remaining:
+            self._running_per_tool[job.tool_name] = remaining
+        else:
+            self._running_per_tool.pop(job.tool_name, None)
+        self._dispatch()
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.io_workers, thread_name_prefix="mcp-io"
+            )
+        return self._thread_pool
+
+    def _get_process_pool(self) -> _KillableProcessPool:
+        if self._process_pool is None:
+            self._process_pool = _KillableProcessPool(max_workers=self.cpu_workers)
+        return self._process_pool
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return queue and concurrency statistics"""
+        return {
+            "queued": len(self._queue),
+            "running": self._running,
+            "running_per_tool": dict(self._running_per_tool),
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "max_concurrent": self.max_concurrent,
+            "max_queue_size": self.max_queue_size
+        }
+
+    def shutdown(self):
+        """Fail queued work and stop the worker pools"""
+        while self._queue:
+            job = heapq.heappop(self._queue)
+            if not job.future.done():
+                job.future.cancel()
+
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+            self._process_pool = None
+
+async def _call_async(func: Callable, arguments: Dict[str, Any]) -> Any:
+    """Call an async tool so errors raised by the call itself end up on the awaiting task"""
+    return await func(**arguments)
+
+def _accepts_cancel_token(func: Callable) -> bool:
+    """Whether a tool declares a cancel_token parameter"""
+    try:
+        return "cancel_token" in inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        return False
@@ -3,8 +3,9 @@ MCP Communication Schemas and Contracts
 Defines the JSON/RPC schemas for tool invocation, context sharing, and state management.
 """
 
-from typing import Dict, Any, List, Optional, Union, Literal
-from pydantic import BaseModel, Field
+import json
+from typing import Dict, Any, List, Optional, Union, Literal, Annotated
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 from datetime import datetime
 from enum import Enum
 
@@ -15,11 +16,23 @@ SCHEMA_VERSION = "1.0.0"
 class MCPMessageType(str, Enum):
     """Types of MCP messages"""
     INVOKE_TOOL = "invoke_tool"
+    INVOKE_TOOLS_BATCH = "invoke_tools_batch"
     FETCH_CONTEXT = "fetch_context"
     UPDATE_STATE = "update_state"
     RESPONSE = "response"
     ERROR = "error"
     HEARTBEAT = "heartbeat"
+    SUBSCRIBE = "subscribe"
+    CONTEXT_DELTA = "context_delta"
+    TOOL_RESULT_CHUNK = "tool_result_chunk"
+
+class MCPResponseType(str, Enum):
+    """Kinds of response messages, carried explicitly so decoders need not guess"""
+    TOOL_INVOCATION = "tool_invocation"
+    TOOL_BATCH = "tool_batch"
+    CONTEXT_FETCH = "context_fetch"
+    STATE_UPDATE = "state_update"
+    SUBSCRIPTION = "subscription"
 
 class MCPToolInvocationRequest(BaseModel):
     """Schema for tool invocation requests"""
@@ -32,10 +45,15 @@ class MCPToolInvocationRequest(BaseModel):
     context: Optional[Dict[str, Any]] = Field(default=None, description="Additional context")
     priority: int = Field(default=5, ge=1, le=10, description="Priority level (1=highest, 10=lowest)")
     timeout: Optional[int] = Field(default=30, description="Timeout in seconds")
+    chunk_size: Optional[int] = Field(
+        default=None, ge=1,
+        description="Over WebSocket, stream results longer than this many characters as tool_result_chunk frames"
+    )
 
 class MCPToolInvocationResponse(BaseModel):
     """Schema for tool invocation responses"""
     message_type: Literal[MCPMessageType.RESPONSE] = MCPMessageType.RESPONSE
+    response_type: Literal[MCPResponseType.TOOL_INVOCATION] = MCPResponseType.TOOL_INVOCATION
     request_id: str = Field(..., description="ID of the original request")
     timestamp: datetime = Field(default_factory=datetime.now)
     success: bool = Field(..., description="Whether the tool execution was successful")
@@ -43,6 +61,49 @@ class MCPToolInvocationResponse(BaseModel):
     error_message: Optional[str] = Field(default=None, description="Error message if failed")
     execution_time: Optional[float] = Field(default=None, description="Execution time in seconds")
     metadata: Dict[str, Any] = Field(default_factory=dict, description="Additional metadata")
+    chunks: Optional[int] = Field(
+        default=None, description="Number of tool_result_chunk frames that carried the result; result is then None"
+    )
+    chunk_encoding: Optional[Literal["text", "json"]] = Field(
+        default=None, description="How the joined chunks decode: as the text itself, or as JSON"
+    )
+
+class MCPToolResultChunk(BaseModel):
+    """Schema for one piece of a streamed tool result, sent ahead of the final response"""
+    message_type: Literal[MCPMessageType.TOOL_RESULT_CHUNK] = MCPMessageType.TOOL_RESULT_CHUNK
+    request_id: str = Field(..., description="ID of the original request")
+    timestamp: datetime = Field(default_factory=datetime.now)
+    sequence: int = Field(..., ge=0, description="Position of this chunk, starting at 0")
+    data: str = Field(..., description="Slice of the result text")
+
+class MCPToolBatchRequest(BaseModel):
+    """Schema for several tool invocations sent and executed together"""
+    message_type: Literal[MCPMessageType.INVOKE_TOOLS_BATCH] = MCPMessageType.INVOKE_TOOLS_BATCH
+    request_id: str = Field(..., description="Unique identifier for this batch")
+    timestamp: datetime = Field(default_factory=datetime.now)
+    agent_id: str = Field(..., description="ID of the requesting agent")
+    invocations: List[MCPToolInvocationRequest] = Field(
+        ..., min_length=1, description="Invocations to run concurrently, each with its own request_id"
+    )
+    stream: bool = Field(
+        default=True,
+        description="Over WebSocket, send each invocation's response as soon as it completes"
+    )
+    timeout: Optional[int] = Field(default=30, description="Seconds the client waits for the whole batch")
+
+class MCPToolBatchResponse(BaseModel):
+    """Schema for the completion of a tool invocation batch"""
+    message_type: Literal[MCPMessageType.RESPONSE] = MCPMessageType.RESPONSE
+    response_type: Literal[MCPResponseType.TOOL_BATCH] = MCPResponseType.TOOL_BATCH
+    request_id: str = Field(..., description="ID of the original batch")
+    timestamp: datetime = Field(default_factory=datetime.now)
+    success: bool = Field(..., description="Whether every invocation succeeded")
+    responses: List[MCPToolInvocationResponse] = Field(
+        default_factory=list, description="Responses in request order; empty if they were streamed"
+    )
+    succeeded: int = Field(default=0, description="Number of successful invocations")
+    failed: int = Field(default=0, description="Number of failed invocations")
+    execution_time: Optional[float] = Field(default=None, description="Wall time for the whole batch in seconds")
 
 class MCPContextFetchRequest(BaseModel):
     """Schema for context fetch requests"""
@@ -52,15 +113,21 @@ class MCPContextFetchRequest(BaseModel):
     agent_id: str = Field(..., description="ID of the requesting agent")
     context_keys: List[str] = Field(..., description="List of context keys to fetch")
     scope: Literal["agent", "session", "global"] = Field(default="session", description="Context scope")
+    since_version: Optional[int] = Field(
+        default=None, description="Only return requested keys changed after this version"
+    )
 
 class MCPContextFetchResponse(BaseModel):
     """Schema for context fetch responses"""
     message_type: Literal[MCPMessageType.RESPONSE] = MCPMessageType.RESPONSE
+    response_type: Literal[MCPResponseType.CONTEXT_FETCH] = MCPResponseType.CONTEXT_FETCH
     request_id: str = Field(..., description="ID of the original request")
     timestamp: datetime = Field(default_factory=datetime.now)
     success: bool = Field(..., description="Whether the context fetch was successful")
     context_data: Dict[str, Any] = Field(default_factory=dict, description="Retrieved context data")
     missing_keys: List[str] = Field(default_factory=list, description="Keys that were not found")
+    versions: Dict[str, int] = Field(default_factory=dict, description="Version of each returned key")
+    version: Optional[int] = Field(default=None, description="Store version at the time of the fetch")
 
 class MCPStateUpdateRequest(BaseModel):
     """Schema for state update requests"""
@@ -71,15 +138,60 @@ class MCPStateUpdateRequest(BaseModel):
     state_updates: Dict[str, Any] = Field(..., description="State updates to apply")
     scope: Literal["agent", "session", "global"] = Field(default="session", description="Update scope")
     merge_strategy: Literal["replace", "merge", "append"] = Field(default="merge", description="How to apply updates")
+    deleted_keys: List[str] = Field(default_factory=list, description="Keys to remove")
+    base_version: Optional[int] = Field(
+        default=None, description="Version the updates were diffed against; keys changed since are rejected"
+    )
 
 class MCPStateUpdateResponse(BaseModel):
     """Schema for state update responses"""
     message_type: Literal[MCPMessageType.RESPONSE] = MCPMessageType.RESPONSE
+    response_type: Literal[MCPResponseType.STATE_UPDATE] = MCPResponseType.STATE_UPDATE
     request_id: str = Field(..., description="ID of the original request")
     timestamp: datetime = Field(default_factory=datetime.now)
     success: bool = Field(..., description="Whether the state update was successful")
     updated_keys: List[str] = Field(default_factory=list, description="Keys that were updated")
     error_message: Optional[str] = Field(default=None, description="Error message if failed")
+    conflicts: List[str] = Field(default_factory=list, description="Keys changed by others since base_version")
+    versions: Dict[str, int] = Field(default_factory=dict, description="New version of each updated key")
+    version: Optional[int] = Field(default=None, description="Store version after the update")
+
+class MCPSubscribeRequest(BaseModel):
+    """Schema for subscribing to context changes under key prefixes"""
+    message_type: Literal[MCPMessageType.SUBSCRIBE] = MCPMessageType.SUBSCRIBE
+    request_id: str = Field(..., description="Unique identifier for this request")
+    timestamp: datetime = Field(default_factory=datetime.now)
+    agent_id: str = Field(..., description="ID of the subscribing agent")
+    scope: Literal["agent", "session", "global"] = Field(default="session", description="Context scope")
+    prefixes: List[str] = Field(default_factory=lambda: [""], description="Key prefixes to watch; '' matches all")
+    action: Literal["subscribe", "unsubscribe"] = Field(default="subscribe", description="Add or remove prefixes")
+    since_version: Optional[int] = Field(
+        default=None, description="Include matching keys changed after this version in the response"
+    )
+
+class MCPSubscribeResponse(BaseModel):
+    """Schema for subscription responses, carrying the initial state of watched keys"""
+    message_type: Literal[MCPMessageType.RESPONSE] = MCPMessageType.RESPONSE
+    response_type: Literal[MCPResponseType.SUBSCRIPTION] = MCPResponseType.SUBSCRIPTION
+    request_id: str = Field(..., description="ID of the original request")
+    timestamp: datetime = Field(default_factory=datetime.now)
+    success: bool = Field(..., description="Whether the subscription change was applied")
+    prefixes: List[str] = Field(default_factory=list, description="Prefixes now watched in this scope")
+    context_data: Dict[str, Any] = Field(default_factory=dict, description="Current values of watched keys")
+    versions: Dict[str, int] = Field(default_factory=dict, description="Version of each returned key")
+    deleted_keys: List[str] = Field(default_factory=list, description="Watched keys deleted since since_version")
+    version: Optional[int] = Field(default=None, description="Store version at the time of subscribing")
+
+class MCPContextDeltaMessage(BaseModel):
+    """Schema for pushed context changes, sent only to matching subscribers"""
+    message_type: Literal[MCPMessageType.CONTEXT_DELTA] = MCPMessageType.CONTEXT_DELTA
+    timestamp: datetime = Field(default_factory=datetime.now)
+    source_agent_id: str = Field(..., description="Agent whose update caused the change")
+    scope: Literal["agent", "session", "global"] = Field(..., description="Context scope")
+    changes: Dict[str, Any] = Field(default_factory=dict, description="New values of changed keys")
+    deleted_keys: List[str] = Field(default_factory=list, description="Keys that were removed")
+    versions: Dict[str, int] = Field(default_factory=dict, description="Version of each changed key")
+    version: int = Field(..., description="Store version after the change")
 
 class MCPErrorResponse(BaseModel):
     """Schema for error responses"""
@@ -98,16 +210,33 @@ class MCPHeartbeatMessage(BaseModel):
     status: Literal["active", "idle", "busy"] = Field(..., description="Agent status")
     load_metrics: Optional[Dict[str, float]] = Field(default=None, description="Optional load metrics")
 
-# Union type for all MCP messages
-MCPMessage = Union[
-    MCPToolInvocationRequest,
-    MCPToolInvocationResponse,
-    MCPContextFetchRequest,
-    MCPContextFetchResponse,
-    MCPStateUpdateRequest,
-    MCPStateUpdateResponse,
-    MCPErrorResponse,
-    MCPHeartbeatMessage
+# Response kinds share message_type, so they are told apart by response_type
+MCPResponse = Annotated[
+    Union[
+        MCPToolInvocationResponse,
+        MCPToolBatchResponse,
+        MCPContextFetchResponse,
+        MCPStateUpdateResponse,
+        MCPSubscribeResponse
+    ],
+    Field(discriminator="response_type")
+]
+
+# Union type for all MCP messages, discriminated on message_type
+MCPMessage = Annotated[
+    Union[
+        MCPToolInvocationRequest,
+        MCPToolBatchRequest,
+        MCPContextFetchRequest,
+        MCPStateUpdateRequest,
+        MCPSubscribeRequest,
+        MCPResponse,
+        MCPToolResultChunk,
+        MCPContextDeltaMessage,
+        MCPErrorResponse,
+        MCPHeartbeatMessage
+    ],
+    Field(discriminator="message_type")
 ]
 
 class MCPConnectionConfig(BaseModel):
@@ -118,6 +247,28 @@ class MCPConnectionConfig(BaseModel):
     timeout: int = Field(default=30, description="Default timeout in seconds")
     retry_attempts: int = Field(default=3, description="Number of retry attempts")
     heartbeat_interval: int = Field(default=30, description="Heartbeat interval in seconds")
+    max_connections: int = Field(default=100, description="HTTP connection pool size")
+    max_connections_per_host: int = Field(default=32, description="HTTP connections kept per host")
+    keepalive_timeout: float = Field(default=30.0, description="Seconds an idle HTTP connection is kept open")
+    dns_cache_ttl: int = Field(default=300, description="Seconds resolved host names are cached")
+    http2: bool = Field(default=False, description="Use HTTP/2 where the server offers it; needs httpx[http2]")
+    retry_backoff: float = Field(default=0.1, description="Base delay before the first HTTP retry")
+    max_retry_backoff: float = Field(default=5.0, description="Cap on the jittered HTTP retry delay")
+    retry_budget_ratio: float = Field(default=0.2, description="Retries allowed per request, averaged over time")
+    compression: bool = Field(
+        default=True, description="Compress HTTP bodies the server accepts and WebSocket frames (permessage-deflate)"
+    )
+    compression_min_size: int = Field(default=1024, description="Smallest HTTP request body worth compressing")
+    transport: Literal["auto", "network", "local"] = Field(
+        default="auto",
+        description="'auto' connects in-process when a server in this process and event loop serves server_url"
+    )
+    local_validation: bool = Field(
+        default=True, description="Copy in-process messages through their JSON form, as on the wire"
+    )
+    encoding: Literal["auto", "json", "msgpack"] = Field(
+        default="auto", description="Wire encoding; 'auto' prefers msgpack when both ends support it"
+    )
 
 class MCPServerInfo(BaseModel):
     """Server information and capabilities"""
@@ -128,12 +279,61 @@ class MCPServerInfo(BaseModel):
     supported_tools: List[str] = Field(default_factory=list, description="List of available tools")
     max_concurrent_requests: int = Field(default=10, description="Maximum concurrent requests")
 
-def validate_mcp_message(message_data: Dict[str, Any]) -> MCPMessage:
+class MCPAgentInfo(BaseModel):
+    """Liveness and load of a connected agent, as reported by its heartbeats"""
+    agent_id: str = Field(..., description="Agent identifier")
+    status: str = Field(..., description="Last reported status")
+    connected_at: datetime = Field(..., description="When the agent connected")
+    last_heartbeat: datetime = Field(..., description="Timestamp of the last heartbeat")
+    seconds_since_seen: float = Field(..., description="Seconds since any message from the agent")
+    load_metrics: Dict[str, float] = Field(default_factory=dict, description="Last reported load metrics")
+    load_score: float = Field(..., description="Rank key for placing work; lower is less busy")
+
+_RESPONSE_MODELS = {
+    MCPResponseType.TOOL_INVOCATION: MCPToolInvocationResponse,
+    MCPResponseType.TOOL_BATCH: MCPToolBatchResponse,
+    MCPResponseType.CONTEXT_FETCH: MCPContextFetchResponse,
+    MCPResponseType.STATE_UPDATE: MCPStateUpdateResponse,
+    MCPResponseType.SUBSCRIPTION: MCPSubscribeResponse,
+}
+
+_MESSAGE_MODELS = {
+    MCPMessageType.INVOKE_TOOL: MCPToolInvocationRequest,
+    MCPMessageType.INVOKE_TOOLS_BATCH: MCPToolBatchRequest,
+    MCPMessageType.FETCH_CONTEXT: MCPContextFetchRequest,
+    MCPMessageType.UPDATE_STATE: MCPStateUpdateRequest,
+    MCPMessageType.SUBSCRIBE: MCPSubscribeRequest,
+    MCPMessageType.CONTEXT_DELTA: MCPContextDeltaMessage,
+    MCPMessageType.TOOL_RESULT_CHUNK: MCPToolResultChunk,
+    MCPMessageType.ERROR: MCPErrorResponse,
+    MCPMessageType.HEARTBEAT: MCPHeartbeatMessage,
+}
+
+# Built once; validating through the adapter dispatches on the discriminators in one pass
+MCP_MESSAGE_ADAPTER = TypeAdapter(MCPMessage)
+
+def _infer_response_type(message_data: Dict[str, Any]) -> MCPResponseType:
+    """Guess the response kind for peers that predate response_type"""
+    if "responses" in message_data:
+        return MCPResponseType.TOOL_BATCH
+    elif "result" in message_data or "execution_time" in message_data:
+        return MCPResponseType.TOOL_INVOCATION
+    elif "prefixes" in message_data:
+        return MCPResponseType.SUBSCRIPTION
+    elif "context_data" in message_data:
+        return MCPResponseType.CONTEXT_FETCH
+    elif "updated_keys" in message_data:
+        return MCPResponseType.STATE_UPDATE
+    raise ValueError(f"Cannot determine response type for message: {message_data}")
+
+def validate_mcp_message(message_data: Dict[str, Any], trusted: bool = False) -> MCPMessage:
     """
     Validate and parse an MCP message from raw data.
     
     Args:
         message_data: Raw message data dictionary
+        trusted: Skip validation and build the model directly; only for data
+            produced in-process from MCP models
         
     Returns:
         Parsed and validated MCP message
@@ -143,25 +343,30 @@ def validate_mcp_message(message_data: Dict[str, Any]) -> MCPMessage:
     """
     message_type = message_data.get("message_type")
     
-    if message_type == MCPMessageType.INVOKE_TOOL:
-        return MCPToolInvocationRequest(**message_data)
-    elif message_type == MCPMessageType.FETCH_CONTEXT:
-        return MCPContextFetchRequest(**message_data)
-    elif message_type == MCPMessageType.UPDATE_STATE:
-        return MCPStateUpdateRequest(**message_data)
-    elif message_type == MCPMessageType.RESPONSE:
-        # Need to determine response type based on original request
-        if "result" in message_data or "execution_time" in message_data:
-            return MCPToolInvocationResponse(**message_data)
-        elif "context_data" in message_data:
-            return MCPContextFetchResponse(**message_data)
-        elif "updated_keys" in message_data:
-            return MCPStateUpdateResponse(**message_data)
-        else:
-            raise ValueError(f"Cannot determine response type for message: {message_data}")
-    elif message_type == MCPMessageType.ERROR:
-        return MCPErrorResponse(**message_data)
-    elif message_type == MCPMessageType.HEARTBEAT:
-        return MCPHeartbeatMessage(**message_data)
+    if message_type == MCPMessageType.RESPONSE:
+        response_type = message_data.get("response_type")
+        if response_type not in _RESPONSE_MODELS:
+            response_type = _infer_response_type(message_data)
+            message_data = {**message_data, "response_type": response_type}
+        model = _RESPONSE_MODELS[response_type]
+    elif message_type in _MESSAGE_MODELS:
+        model = _MESSAGE_MODELS[message_type]
     else:
         raise ValueError(f"Unsupported message type: {message_type}")
+    
+    if trusted:
+        return model.model_construct(**message_data)
+    return MCP_MESSAGE_ADAPTER.validate_python(message_data)
+
+def validate_mcp_message_json(data: Union[str, bytes]) -> MCPMessage:
+    """
+    Validate and parse an MCP message straight from JSON text.
+    
+    Raises:
+        ValueError: If message is invalid or unsupported type
+    """
+    try:
+        return MCP_MESSAGE_ADAPTER.validate_json(data)
+    except ValidationError:
+        # Fall back to the dict path for legacy responses and clearer errors
+        return validate_mcp_message(json.loads(data))
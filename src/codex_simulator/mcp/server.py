@@ -5,42 +5,169 @@ Async HTTP and WebSocket server for Model Context Protocol communication.
 
 import asyncio
 import json
+import os
+import socket
+import stat
+import time
 import uuid
-from typing import Dict, Any, List, Optional, Set, Callable
+from functools import partial
+from typing import Dict, Any, Awaitable, List, Optional, Set, Callable, Tuple, Type
 from datetime import datetime
 import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
 import uvicorn
 
 from .schemas import (
     MCPMessage, MCPToolInvocationRequest, MCPToolInvocationResponse,
+    MCPToolBatchRequest, MCPToolBatchResponse, MCPToolResultChunk,
     MCPContextFetchRequest, MCPContextFetchResponse,
     MCPStateUpdateRequest, MCPStateUpdateResponse,
-    MCPErrorResponse, MCPHeartbeatMessage, MCPServerInfo,
+    MCPErrorResponse, MCPHeartbeatMessage, MCPServerInfo, MCPAgentInfo,
+    MCPSubscribeRequest, MCPSubscribeResponse, MCPContextDeltaMessage,
     MCPConnectionConfig, validate_mcp_message, MCP_VERSION
 )
+from .scheduler import MCPToolScheduler, MCPServerBusyError, ToolKind
+from .result_cache import MCPResultCache, IdempotencyCache, DependencyFunc
+from .context_store import DELETED, ContextStore, InMemoryContextStore
+from .persistence import StatePersistence
+from .event_bus import MCPEventBus
+from .outbound import OutboundQueue, SlowConsumerPolicy, ConnectionClosedError
+from .local import (
+    LocalConnection, LOCAL_CODEC, LOCAL_TRUSTED_CODEC, register_local_server, unregister_local_server
+)
+from .load import load_score
+from .compression import (
+    DEFAULT_MIN_COMPRESS_SIZE, available_content_encodings, compress, decompress,
+    negotiate_content_encoding
+)
+from .codec import (
+    MCPCodec, available_encodings, codec_for_subprotocols,
+    codec_for_content_type, codec_for_accept, result_chunks
+)
 
 logger = logging.getLogger(__name__)
 
+# Private-range WebSocket close code for agents that stopped sending heartbeats
+AGENT_TIMEOUT_CLOSE_CODE = 4408
+
+def bind_unix_socket(path: str, mode: int = 0o660) -> socket.socket:
+    """
+    Bind a Unix domain listening socket suitable for handing to uvicorn.
+    
+    A stale socket file left by a server that died is replaced; one that still
+    accepts connections is not. Access is controlled by the file mode.
+    
+    Raises:
+        OSError: If another server is listening on path, or path is not a socket
+    """
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise OSError(f"{path} exists and is not a socket")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(path)
+            except OSError:
+                os.unlink(path)
+            else:
+                raise OSError(f"Another server is listening on {path}")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(path)
+        os.chmod(path, mode)
+        sock.listen(2048)
+    except OSError:
+        sock.close()
+        raise
+    sock.set_inheritable(True)
+    return sock
+
 class MCPServer:
     """MCP Server implementation with HTTP and WebSocket support"""
     
-    def __init__(self, host: str = "localhost", port: int = 8000):
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 8000,
+        multiplex: bool = True,
+        max_requests_per_connection: int = 10,
+        max_concurrent_requests: int = 10,
+        max_queued_requests: int = 100,
+        max_cached_results: int = 1024,
+        context_store: Optional[ContextStore] = None,
+        context_purge_interval: float = 60.0,
+        persistence: Optional[StatePersistence] = None,
+        event_bus: Optional[MCPEventBus] = None,
+        idempotency: Optional[IdempotencyCache] = None,
+        max_outbound_queue: int = 256,
+        slow_consumer_policy: SlowConsumerPolicy = "drop_oldest",
+        agent_timeout: float = 90.0,
+        max_batch_size: int = 100,
+        http_compression: Optional[List[str]] = None,
+        compression_min_size: int = DEFAULT_MIN_COMPRESS_SIZE,
+        websocket_compression: bool = True,
+        uds: Optional[str] = None,
+        uds_mode: int = 0o660
+    ):
         self.host = host
         self.port = port
-        self.active_connections: Dict[str, WebSocket] = {}
+        # Unix domain socket served alongside host:port, for agents on the same machine
+        self.uds = uds
+        self.uds_mode = uds_mode
+        self.multiplex = multiplex
+        self.max_requests_per_connection = max_requests_per_connection
+        # WebSocket, or LocalConnection for agents in this process
+        self.active_connections: Dict[str, Any] = {}
+        self.connection_codecs: Dict[str, MCPCodec] = {}
+        # Each connection is written by its own task, fed through a bounded queue
+        self.outbound_queues: Dict[str, OutboundQueue] = {}
+        self.max_outbound_queue = max_outbound_queue
+        self.slow_consumer_policy = slow_consumer_policy
         self.agent_registry: Dict[str, Dict[str, Any]] = {}
-        self.context_store: Dict[str, Dict[str, Any]] = {
-            "global": {},
-            "session": {},
-            "agent": {}
-        }
+        # Agents silent for this long (three default heartbeat intervals) are reaped
+        self.agent_timeout = agent_timeout
+        # agent_id -> scope -> watched key prefixes
+        self.subscriptions: Dict[str, Dict[str, Set[str]]] = {}
+        self.context_store: ContextStore = context_store or InMemoryContextStore()
+        self.context_purge_interval = context_purge_interval
+        self.persistence = persistence
+        # One writer at a time per (scope, namespace), so the WAL logs updates in the order applied
+        self._state_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        # Set when several worker processes serve one port and must see each other's events
+        self.event_bus = event_bus
         self.tool_registry: Dict[str, Callable] = {}
+        self.max_batch_size = max_batch_size
+        # Content encodings offered to HTTP clients, most preferred first; [] disables compression
+        self.http_compression = (
+            available_content_encodings() if http_compression is None else list(http_compression)
+        )
+        unsupported = set(self.http_compression) - set(available_content_encodings())
+        if unsupported:
+            raise ValueError(f"Unsupported content encodings: {sorted(unsupported)}")
+        self.compression_min_size = compression_min_size
+        # permessage-deflate, negotiated with each WebSocket client that offers it
+        self.websocket_compression = websocket_compression
+        self.scheduler = MCPToolScheduler(
+            max_concurrent=max_concurrent_requests,
+            max_queue_size=max_queued_requests
+        )
+        self.result_cache = MCPResultCache(max_entries=max_cached_results)
+        # Responses to HTTP requests carrying an Idempotency-Key, so client retries run once;
+        # workers sharing a port must share this too, or a retry can run again on another worker
+        self.idempotency = idempotency or IdempotencyCache()
         self.server_id = f"mcp-server-{uuid.uuid4().hex[:8]}"
+        # Loop the server runs on; in-process clients must share it
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._local_tasks: Set[asyncio.Task] = set()
+        self._lifespan = None
+        self._local_aliases: List[str] = []
+        # Clients in this process can always connect to local://<server_id> without a socket
+        self.local_url = f"local://{self.server_id}"
+        register_local_server(self.local_url, self)
         
         # Create FastAPI app
         self.app = self._create_app()
@@ -52,10 +179,27 @@ class MCPServer:
         async def lifespan(app: FastAPI):
             # Startup
             logger.info(f"MCP Server {self.server_id} starting up...")
+            self.loop = asyncio.get_running_loop()
+            if self.persistence is not None:
+                await self.persistence.recover(self.context_store)
+                self.persistence.start()
+            if self.event_bus is not None:
+                await self.event_bus.start(self._handle_bus_event)
+            purge_task = asyncio.create_task(self._purge_expired_context())
+            reaper_task = asyncio.create_task(self._reap_stale_agents())
             yield
             # Shutdown
             logger.info(f"MCP Server {self.server_id} shutting down...")
+            purge_task.cancel()
+            reaper_task.cancel()
             await self._cleanup_connections()
+            self.scheduler.shutdown()
+            if self.persistence is not None:
+                await self.persistence.close()
+            if self.event_bus is not None:
+                await self.event_bus.close()
+            await self.idempotency.close()
+            await self.context_store.close()
         
         app = FastAPI(
             title="MCP Server",
@@ -87,40 +231,78 @@ class MCPServer:
         
         @app.get("/info", response_model=MCPServerInfo)
         async def server_info():
+            capabilities = [
+                "tool_invocation", "batch_invocation", "chunked_results", "context_management", "state_updates"
+            ]
+            if self.multiplex:
+                capabilities.append("multiplexing")
+            capabilities.extend(f"encoding.{name}" for name in available_encodings())
+            capabilities.extend(f"compression.{name}" for name in self.http_compression)
             return MCPServerInfo(
                 server_id=self.server_id,
                 version=MCP_VERSION,
-                capabilities=["tool_invocation", "context_management", "state_updates"],
+                capabilities=capabilities,
                 supported_tools=list(self.tool_registry.keys()),
-                max_concurrent_requests=10
+                max_concurrent_requests=self.scheduler.max_concurrent
             )
         
+        @app.get("/agents", response_model=List[MCPAgentInfo])
+        async def list_agents(limit: Optional[int] = None):
+            """Connected agents, least loaded first"""
+            return self.rank_agents(limit)
+        
         @app.post("/invoke_tool")
-        async def invoke_tool_http(request: MCPToolInvocationRequest):
+        async def invoke_tool_http(http_request: Request):
             """HTTP endpoint for tool invocation"""
+            request = await self._decode_http_request(http_request, MCPToolInvocationRequest)
             try:
-                response = await self._handle_tool_invocation(request)
-                return response.dict()
+                response = await self._run_idempotent(
+                    http_request, "invoke_tool", lambda: self._handle_tool_invocation(request)
+                )
+                return self._encode_http_response(http_request, response)
+            except MCPServerBusyError as e:
+                response = self._busy_response(request.request_id, e)
+                return self._encode_http_response(
+                    http_request, response, status_code=503,
+                    headers={"Retry-After": str(max(1, round(e.retry_after)))}
+                )
             except Exception as e:
                 logger.error(f"Tool invocation error: {e}")
                 raise HTTPException(status_code=500, detail=str(e))
         
+        @app.post("/invoke_tools_batch")
+        async def invoke_tools_batch_http(http_request: Request):
+            """HTTP endpoint for batched tool invocation; all responses come back together"""
+            request = await self._decode_http_request(http_request, MCPToolBatchRequest)
+            try:
+                response = await self._run_idempotent(
+                    http_request, "invoke_tools_batch", lambda: self._handle_tool_batch(request)
+                )
+                return self._encode_http_response(http_request, response)
+            except Exception as e:
+                logger.error(f"Batch invocation error: {e}")
+                raise HTTPException(status_code=500, detail=str(e))
+        
         @app.post("/fetch_context")
-        async def fetch_context_http(request: MCPContextFetchRequest):
+        async def fetch_context_http(http_request: Request):
             """HTTP endpoint for context fetching"""
+            request = await self._decode_http_request(http_request, MCPContextFetchRequest)
             try:
                 response = await self._handle_context_fetch(request)
-                return response.dict()
+                return self._encode_http_response(http_request, response)
             except Exception as e:
                 logger.error(f"Context fetch error: {e}")
                 raise HTTPException(status_code=500, detail=str(e))
         
         @app.post("/update_state")
-        async def update_state_http(request: MCPStateUpdateRequest):
+        async def update_state_http(http_request: Request):
             """HTTP endpoint for state updates"""
+            request = await self._decode_http_request(http_request, MCPStateUpdateRequest)
             try:
-                response = await self._handle_state_update(request)
-                return response.dict()
+                response = await self._run_idempotent(
+                    http_request, "update_state", lambda: self._handle_state_update(request)
+                )
+                return self._encode_http_response(http_request, response)
             except Exception as e:
                 logger.error(f"State update error: {e}")
                 raise HTTPException(status_code=500, detail=str(e))
@@ -130,70 +312,295 @@ class MCPServer:
             """WebSocket endpoint for real-time communication"""
             await self._handle_websocket_connection(websocket, agent_id)
     
+    async def _decode_http_request(self, http_request: Request, model: Type[BaseModel]) -> BaseModel:
+        """Decode an HTTP request body using its Content-Encoding and the codec named by its Content-Type"""
+        codec = codec_for_content_type(http_request.headers.get("content-type"))
+        body = await http_request.body()
+        content_encoding = http_request.headers.get("content-encoding")
+        if content_encoding:
+            if content_encoding.strip().lower() not in ("identity", *available_content_encodings()):
+                raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {content_encoding}")
+            try:
+                body = decompress(body, content_encoding)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        try:
+            return codec.decode_as(body, model)
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    
+    async def _run_idempotent(
+        self,
+        http_request: Request,
+        endpoint: str,
+        handler: Callable[[], Awaitable[BaseModel]]
+    ) -> BaseModel:
+        """Run a handler once per Idempotency-Key; retries get the original response"""
+        key = http_request.headers.get("idempotency-key")
+        if not key:
+            return await handler()
+        return await self.idempotency.run(f"{endpoint}:{key}", handler)
+    
+    def _encode_http_response(
+        self,
+        http_request: Request,
+        response: MCPMessage,
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None
+    ) -> Response:
+        """
+        Encode a response using the first codec the client accepts.
+        
+        Bodies of at least compression_min_size are compressed with the best
+        encoding both sides support. Every response lists the encodings accepted
+        for request bodies in Accept-Encoding, so clients know what they may send.
+        """
+        codec = codec_for_accept(http_request.headers.get("accept"))
+        content = codec.encode(response)
+        headers = dict(headers or {})
+        if self.http_compression:
+            headers["Accept-Encoding"] = ", ".join(self.http_compression)
+            headers["Vary"] = "Accept-Encoding"
+            if len(content) >= self.compression_min_size:
+                encoding = negotiate_content_encoding(
+                    http_request.headers.get("accept-encoding"), self.http_compression
+                )
+                if encoding is not None:
+                    content = compress(content, encoding)
+                    headers["Content-Encoding"] = encoding
+        return Response(
+            content=content,
+            media_type=codec.content_type,
+            status_code=status_code,
+            headers=headers
+        )
+    
+    def _busy_response(self, request_id: str, error: MCPServerBusyError) -> MCPErrorResponse:
+        """Error response telling the client when to retry a rejected request"""
+        return MCPErrorResponse(
+            request_id=request_id,
+            error_code="SERVER_BUSY",
+            error_message=str(error),
+            details={"retry_after": error.retry_after}
+        )
+    
     async def _handle_websocket_connection(self, websocket: WebSocket, agent_id: str):
         """Handle WebSocket connection lifecycle"""
-        await websocket.accept()
-        self.active_connections[agent_id] = websocket
+        # Encoding is negotiated through the WebSocket subprotocol offered by the client
+        offered = websocket.scope.get("subprotocols") or []
+        codec = codec_for_subprotocols(offered)
+        await websocket.accept(subprotocol=codec.subprotocol if codec.subprotocol in offered else None)
+        
+        # Responses and broadcasts are written by one task, so frames never interleave
+        outbound = OutboundQueue(
+            partial(self._send_encoded, websocket, codec),
+            lambda code, reason: websocket.close(code=code, reason=reason),
+            max_size=self.max_outbound_queue,
+            policy=self.slow_consumer_policy,
+            name=agent_id
+        )
+        self._register_connection(agent_id, websocket, codec, outbound, "WebSocket")
+        await self._serve_connection(
+            agent_id, codec, outbound, partial(self._receive_websocket_frame, websocket), "WebSocket"
+        )
+    
+    async def _receive_websocket_frame(self, websocket: WebSocket) -> Any:
+        """Wait for the next text or binary frame from a WebSocket client"""
+        frame = await websocket.receive()
+        if frame["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(frame.get("code", 1000))
+        return frame["bytes"] if frame.get("bytes") is not None else frame.get("text")
+    
+    async def connect_local(self, agent_id: str, validate: bool = True) -> LocalConnection:
+        """
+        Open an in-process connection for an agent in this process and event loop.
+        
+        Requests are processed exactly as WebSocket requests are, but messages are
+        passed as model instances; validate copies them through their JSON form
+        as the wire would, and can be turned off to hand instances over as is.
+        """
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        codec = LOCAL_CODEC if validate else LOCAL_TRUSTED_CODEC
+        connection = LocalConnection(agent_id, codec)
+        outbound = OutboundQueue(
+            connection.send_frame,
+            connection.close,
+            max_size=self.max_outbound_queue,
+            policy=self.slow_consumer_policy,
+            name=agent_id
+        )
+        # Registered before returning, so the agent is visible as soon as it is connected
+        self._register_connection(agent_id, connection, codec, outbound, "in-process")
+        task = asyncio.create_task(
+            self._serve_connection(agent_id, codec, outbound, connection.receive, "in-process")
+        )
+        self._local_tasks.add(task)
+        task.add_done_callback(self._local_tasks.discard)
+        return connection
+    
+    def _register_connection(
+        self,
+        agent_id: str,
+        connection: Any,
+        codec: MCPCodec,
+        outbound: OutboundQueue,
+        transport: str
+    ):
+        """Start the connection's writer and record the agent as connected"""
+        outbound.start()
+        self.active_connections[agent_id] = connection
+        self.connection_codecs[agent_id] = codec
+        self.outbound_queues[agent_id] = outbound
+        self.agent_registry[agent_id] = {
+            "connected_at": datetime.now(),
+            "status": "active",
+            "last_heartbeat": datetime.now(),
+            "last_seen": time.monotonic(),
+            "load_metrics": {}
+        }
+        logger.info(f"Agent {agent_id} connected via {transport}")
+    
+    async def _serve_connection(
+        self,
+        agent_id: str,
+        codec: MCPCodec,
+        outbound: OutboundQueue,
+        receive: Callable[[], Awaitable[Any]],
+        transport: str
+    ):
+        """Process a registered agent's requests until its connection closes, then clean up"""
+        slots = asyncio.Semaphore(self.max_requests_per_connection)
+        pending: Set[asyncio.Task] = set()
         
         try:
-            # Register agent
-            self.agent_registry[agent_id] = {
-                "connected_at": datetime.now(),
-                "status": "active",
-                "last_heartbeat": datetime.now()
-            }
-            
-            logger.info(f"Agent {agent_id} connected via WebSocket")
-            
             while True:
                 # Receive message
-                data = await websocket.receive_text()
-                message_data = json.loads(data)
+                data = await receive()
+                # Any traffic proves the agent is alive, not only heartbeats
+                if agent_id in self.agent_registry:
+                    self.agent_registry[agent_id]["last_seen"] = time.monotonic()
                 
-                # Validate and process message
-                try:
-                    message = validate_mcp_message(message_data)
-                    response = await self._process_message(message, agent_id)
-                    
-                    if response:
-                        await websocket.send_text(response.json())
-                        
-                except Exception as e:
-                    error_response = MCPErrorResponse(
-                        request_id=message_data.get("request_id", "unknown"),
-                        error_code="PROCESSING_ERROR",
-                        error_message=str(e)
-                    )
-                    await websocket.send_text(error_response.json())
+                if not self.multiplex:
+                    await self._dispatch_websocket_message(agent_id, codec, data, outbound)
+                    continue
+                
+                # Stop reading once the connection has its limit of requests in flight
+                await slots.acquire()
+                task = asyncio.create_task(
+                    self._dispatch_websocket_message(agent_id, codec, data, outbound)
+                )
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                task.add_done_callback(lambda _: slots.release())
                     
-        except WebSocketDisconnect:
+        except (WebSocketDisconnect, ConnectionClosedError):
             logger.info(f"Agent {agent_id} disconnected")
         except Exception as e:
-            logger.error(f"WebSocket error for agent {agent_id}: {e}")
+            logger.error(f"{transport} error for agent {agent_id}: {e}")
         finally:
+            # Nobody is left to receive responses for in-flight requests
+            for task in list(pending):
+                task.cancel()
+            
             # Cleanup
             if agent_id in self.active_connections:
                 del self.active_connections[agent_id]
+            self.connection_codecs.pop(agent_id, None)
+            self.outbound_queues.pop(agent_id, None)
+            await outbound.close()
+            self.subscriptions.pop(agent_id, None)
             if agent_id in self.agent_registry:
                 del self.agent_registry[agent_id]
     
-    async def _process_message(self, message: MCPMessage, agent_id: str) -> Optional[MCPMessage]:
-        """Process incoming MCP message and return response"""
+    async def _dispatch_websocket_message(
+        self,
+        agent_id: str,
+        codec: MCPCodec,
+        data: Any,
+        outbound: OutboundQueue
+    ):
+        """Process a single WebSocket message and send its response"""
+        message: Optional[MCPMessage] = None
+        
+        # Validate and process message; in-process connections may hand over built models
+        try:
+            message = codec.decode(data)
+            response = await self._process_message(
+                message, agent_id, stream=lambda item: outbound.send(codec.encode(item))
+            )
+        except MCPServerBusyError as e:
+            response = self._busy_response(self._request_id_of(codec, data, message), e)
+        except Exception as e:
+            response = MCPErrorResponse(
+                request_id=self._request_id_of(codec, data, message),
+                error_code="PROCESSING_ERROR",
+                error_message=str(e)
+            )
+        
+        if response:
+            try:
+                await outbound.send(codec.encode(response))
+            except Exception as e:
+                logger.error(f"Failed to send response to agent {agent_id}: {e}")
+    
+    @staticmethod
+    def _request_id_of(codec: MCPCodec, data: Any, message: Optional[MCPMessage]) -> str:
+        """Request ID to answer a failed frame with; only frames that failed to validate are parsed again"""
+        if message is not None:
+            return getattr(message, "request_id", "unknown")
+        try:
+            fields = codec.loads(data)
+        except Exception:
+            return "unknown"
+        return str(fields.get("request_id", "unknown")) if isinstance(fields, dict) else "unknown"
+    
+    async def _send_encoded(self, websocket: WebSocket, codec: MCPCodec, payload: Any):
+        """Send an already encoded message as a text or binary frame"""
+        if codec.binary:
+            await websocket.send_bytes(payload)
+        else:
+            await websocket.send_text(payload)
+    
+    async def _process_message(
+        self,
+        message: MCPMessage,
+        agent_id: str,
+        stream: Optional[Callable[[MCPMessage], Awaitable[None]]] = None
+    ) -> Optional[MCPMessage]:
+        """
+        Process incoming MCP message and return response.
+        
+        stream, when given, sends intermediate messages ahead of the final response.
+        """
         
         if isinstance(message, MCPToolInvocationRequest):
-            return await self._handle_tool_invocation(message)
+            return await self._handle_tool_invocation(message, stream)
+        elif isinstance(message, MCPToolBatchRequest):
+            return await self._handle_tool_batch(message, stream if message.stream else None)
         elif isinstance(message, MCPContextFetchRequest):
             return await self._handle_context_fetch(message)
         elif isinstance(message, MCPStateUpdateRequest):
             return await self._handle_state_update(message)
+        elif isinstance(message, MCPSubscribeRequest):
+            return await self._handle_subscribe(message, agent_id)
         elif isinstance(message, MCPHeartbeatMessage):
             return await self._handle_heartbeat(message, agent_id)
         else:
             logger.warning(f"Unhandled message type: {type(message)}")
             return None
     
-    async def _handle_tool_invocation(self, request: MCPToolInvocationRequest) -> MCPToolInvocationResponse:
-        """Handle tool invocation request"""
+    async def _handle_tool_invocation(
+        self,
+        request: MCPToolInvocationRequest,
+        stream: Optional[Callable[[MCPMessage], Awaitable[None]]] = None
+    ) -> MCPToolInvocationResponse:
+        """
+        Handle tool invocation request.
+        
+        With stream and a chunk_size on the request, large results are sent as
+        tool_result_chunk frames and left out of the returned response.
+        """
         start_time = datetime.now()
         
         try:
@@ -203,24 +610,24 @@ class MCPServer:
             
             tool_func = self.tool_registry[tool_name]
             
-            # Execute tool with timeout
+            def submit():
+                return self.scheduler.submit(
+                    tool_name, tool_func, request.arguments, priority=request.priority
+                )
+            
+            # Identical calls to idempotent tools share one execution and its cached result
+            if self.result_cache.is_cacheable(tool_name):
+                execution = self.result_cache.get_or_run(tool_name, request.arguments, submit)
+            else:
+                execution = submit()
+            
+            # Execute tool through the scheduler; the timeout covers queueing and execution
             try:
-                if asyncio.iscoroutinefunction(tool_func):
-                    result = await asyncio.wait_for(
-                        tool_func(**request.arguments),
-                        timeout=request.timeout
-                    )
-                else:
-                    result = await asyncio.wait_for(
-                        asyncio.get_event_loop().run_in_executor(
-                            None, lambda: tool_func(**request.arguments)
-                        ),
-                        timeout=request.timeout
-                    )
+                result = await asyncio.wait_for(execution, timeout=request.timeout)
                 
                 execution_time = (datetime.now() - start_time).total_seconds()
                 
-                return MCPToolInvocationResponse(
+                response = MCPToolInvocationResponse(
                     request_id=request.request_id,
                     success=True,
                     result=result,
@@ -230,10 +637,22 @@ class MCPServer:
                         "agent_id": request.agent_id
                     }
                 )
+                if stream is not None and request.chunk_size:
+                    await self._stream_tool_result(response, request.chunk_size, stream)
+                return response
                 
             except asyncio.TimeoutError:
                 raise ValueError(f"Tool execution timed out after {request.timeout} seconds")
+            finally:
+                # Writes may have partly happened even when the call failed
+                changed = self.result_cache.invalidation_keys(tool_name, request.arguments)
+                if changed:
+                    self.result_cache.invalidate(changed)
+                    await self._publish_event("invalidate", {"keys": changed})
             
+        except MCPServerBusyError:
+            # Admission control is reported to the caller, not as a tool failure
+            raise
         except Exception as e:
             execution_time = (datetime.now() - start_time).total_seconds()
             logger.error(f"Tool invocation failed: {e}")
@@ -245,32 +664,90 @@ class MCPServer:
                 execution_time=execution_time
             )
     
+    async def _stream_tool_result(
+        self,
+        response: MCPToolInvocationResponse,
+        chunk_size: int,
+        stream: Callable[[MCPMessage], Awaitable[None]]
+    ):
+        """Send a large result as sequence-numbered chunks and strip it from the response"""
+        chunked = result_chunks(response.result, chunk_size)
+        if chunked is None:
+            return
+        encoding, chunks = chunked
+        count = 0
+        # Each slice is written before the next is cut, so only one chunk frame is held at a time
+        for sequence, data in enumerate(chunks):
+            await stream(MCPToolResultChunk(request_id=response.request_id, sequence=sequence, data=data))
+            count += 1
+        response.result = None
+        response.chunks = count
+        response.chunk_encoding = encoding
+    
+    async def _handle_tool_batch(
+        self,
+        request: MCPToolBatchRequest,
+        stream: Optional[Callable[[MCPMessage], Awaitable[None]]] = None
+    ) -> MCPToolBatchResponse:
+        """
+        Run a batch of invocations concurrently under the scheduler's limits.
+        
+        With stream, each invocation's response is sent as soon as it completes and
+        the final batch response only carries the counts.
+        """
+        if len(request.invocations) > self.max_batch_size:
+            raise ValueError(
+                f"Batch of {len(request.invocations)} invocations exceeds the limit of {self.max_batch_size}"
+            )
+        start_time = datetime.now()
+        
+        async def run(invocation: MCPToolInvocationRequest) -> MCPToolInvocationResponse:
+            try:
+                response = await self._handle_tool_invocation(invocation)
+            except MCPServerBusyError as e:
+                # A full queue fails the items it rejected, not the whole batch
+                response = MCPToolInvocationResponse(
+                    request_id=invocation.request_id,
+                    success=False,
+                    error_message=str(e),
+                    metadata={"error_code": "SERVER_BUSY", "retry_after": e.retry_after}
+                )
+            if stream is not None:
+                await stream(response)
+            return response
+        
+        responses = await asyncio.gather(*(run(invocation) for invocation in request.invocations))
+        succeeded = sum(1 for response in responses if response.success)
+        return MCPToolBatchResponse(
+            request_id=request.request_id,
+            success=succeeded == len(responses),
+            responses=[] if stream is not None else list(responses),
+            succeeded=succeeded,
+            failed=len(responses) - succeeded,
+            execution_time=(datetime.now() - start_time).total_seconds()
+        )
+    
     async def _handle_context_fetch(self, request: MCPContextFetchRequest) -> MCPContextFetchResponse:
         """Handle context fetch request"""
         try:
-            context_data = {}
-            missing_keys = []
-            
-            scope_store = self.context_store.get(request.scope, {})
-            
-            for key in request.context_keys:
-                if request.scope == "agent":
-                    full_key = f"{request.agent_id}.{key}"
-                    if full_key in scope_store:
-                        context_data[key] = scope_store[full_key]
-                    else:
-                        missing_keys.append(key)
-                else:
-                    if key in scope_store:
-                        context_data[key] = scope_store[key]
-                    else:
-                        missing_keys.append(key)
+            namespace = request.agent_id if request.scope == "agent" else ""
+            versioned = await self.context_store.get_versioned(
+                request.scope, namespace, request.context_keys
+            )
+            missing_keys = [key for key in request.context_keys if key not in versioned]
+            if request.since_version is not None:
+                # Delta fetch: keys the client already holds at this version are left out
+                versioned = {
+                    key: entry for key, entry in versioned.items() if entry[0] > request.since_version
+                }
             
             return MCPContextFetchResponse(
                 request_id=request.request_id,
                 success=True,
-                context_data=context_data,
-                missing_keys=missing_keys
+                context_data={key: value for key, (_, value) in versioned.items()},
+                missing_keys=missing_keys,
+                versions={key: version for key, (version, _) in versioned.items()},
+                version=await self.context_store.get_version()
             )
             
         except Exception as e:
@@ -285,36 +762,47 @@ class MCPServer:
     async def _handle_state_update(self, request: MCPStateUpdateRequest) -> MCPStateUpdateResponse:
         """Handle state update request"""
         try:
-            updated_keys = []
-            scope_store = self.context_store.setdefault(request.scope, {})
+            namespace = request.agent_id if request.scope == "agent" else ""
+            updates = request.state_updates
+            deleted_keys = list(request.deleted_keys)
+            conflicts: List[str] = []
             
-            for key, value in request.state_updates.items():
-                if request.scope == "agent":
-                    full_key = f"{request.agent_id}.{key}"
-                else:
-                    full_key = key
+            async with self._state_locks.setdefault((request.scope, namespace), asyncio.Lock()):
+                if request.base_version is not None:
+                    # Optimistic concurrency: skip keys someone else changed after the client's version
+                    touched = list(updates) + deleted_keys
+                    current = await self.context_store.get_versioned(request.scope, namespace, touched)
+                    conflicts = [
+                        key for key in touched if key in current and current[key][0] > request.base_version
+                    ]
+                    if conflicts:
+                        updates = {key: value for key, value in updates.items() if key not in conflicts}
+                        deleted_keys = [key for key in deleted_keys if key not in conflicts]
                 
-                if request.merge_strategy == "replace":
-                    scope_store[full_key] = value
-                elif request.merge_strategy == "merge" and isinstance(value, dict):
-                    if full_key in scope_store and isinstance(scope_store[full_key], dict):
-                        scope_store[full_key].update(value)
-                    else:
-                        scope_store[full_key] = value
-                elif request.merge_strategy == "append" and isinstance(value, list):
-                    if full_key in scope_store and isinstance(scope_store[full_key], list):
-                        scope_store[full_key].extend(value)
-                    else:
-                        scope_store[full_key] = value
-                else:
-                    scope_store[full_key] = value
-                
-                updated_keys.append(key)
+                updated_keys = await self.context_store.apply_updates(
+                    request.scope, namespace, updates, request.merge_strategy
+                )
+                if deleted_keys:
+                    await self.context_store.delete(request.scope, namespace, deleted_keys)
+                if self.persistence is not None:
+                    await self.persistence.record(
+                        request.scope, namespace, updates, request.merge_strategy, deleted_keys
+                    )
+            
+            versioned = await self.context_store.get_versioned(request.scope, namespace, updated_keys)
+            version = await self.context_store.get_version()
+            if updated_keys or deleted_keys:
+                await self._publish_context_delta(
+                    request.agent_id, request.scope, namespace, versioned, deleted_keys, version
+                )
             
             return MCPStateUpdateResponse(
                 request_id=request.request_id,
                 success=True,
-                updated_keys=updated_keys
+                updated_keys=updated_keys,
+                conflicts=conflicts,
+                versions={key: entry_version for key, (entry_version, _) in versioned.items()},
+                version=version
             )
             
         except Exception as e:
@@ -325,67 +813,365 @@ class MCPServer:
                 error_message=str(e)
             )
     
+    async def _handle_subscribe(self, request: MCPSubscribeRequest, agent_id: str) -> MCPSubscribeResponse:
+        """Add or remove watched key prefixes for a WebSocket-connected agent"""
+        if agent_id not in self.active_connections:
+            raise ValueError("Context subscriptions require a WebSocket connection")
+        
+        scopes = self.subscriptions.setdefault(agent_id, {})
+        prefixes = scopes.setdefault(request.scope, set())
+        if request.action == "subscribe":
+            prefixes.update(request.prefixes)
+        else:
+            prefixes.difference_update(request.prefixes)
+        if not prefixes:
+            del scopes[request.scope]
+        
+        context_data: Dict[str, Any] = {}
+        versions: Dict[str, int] = {}
+        deleted_keys: List[str] = []
+        if request.action == "subscribe":
+            namespace = agent_id if request.scope == "agent" else ""
+            changed = await self.context_store.changed_since(
+                request.scope, namespace, request.since_version or 0, request.prefixes
+            )
+            deleted_keys = [key for key, (_, value) in changed.items() if value is DELETED]
+            context_data = {key: value for key, (_, value) in changed.items() if value is not DELETED}
+            versions = {key: version for key, (version, value) in changed.items() if value is not DELETED}
+        
+        return MCPSubscribeResponse(
+            request_id=request.request_id,
+            success=True,
+            prefixes=sorted(prefixes),
+            context_data=context_data,
+            versions=versions,
+            deleted_keys=deleted_keys,
+            version=await self.context_store.get_version()
+        )
+    
+    async def _publish_context_delta(
+        self,
+        source_agent_id: str,
+        scope: str,
+        namespace: str,
+        versioned: Dict[str, Any],
+        deleted_keys: List[str],
+        version: int
+    ):
+        """Push changed keys to subscribers here and on other workers"""
+        await self._deliver_context_delta(source_agent_id, scope, namespace, versioned, deleted_keys, version)
+        await self._publish_event("context_delta", {
+            "source_agent_id": source_agent_id,
+            "scope": scope,
+            "namespace": namespace,
+            "versioned": versioned,
+            "deleted_keys": deleted_keys,
+            "version": version
+        })
+    
+    async def _deliver_context_delta(
+        self,
+        source_agent_id: str,
+        scope: str,
+        namespace: str,
+        versioned: Dict[str, Any],
+        deleted_keys: List[str],
+        version: int
+    ):
+        """Push changed keys to local subscribers watching them, one message per distinct key set"""
+        groups: Dict[frozenset, Set[str]] = {}
+        for agent_id, scopes in self.subscriptions.items():
+            if agent_id == source_agent_id or scope not in scopes:
+                continue
+            # Agent-scoped context is only visible to its owner
+            if scope == "agent" and agent_id != namespace:
+                continue
+            prefixes = tuple(scopes[scope])
+            keys = frozenset(key for key in list(versioned) + deleted_keys if key.startswith(prefixes))
+            if keys:
+                groups.setdefault(keys, set()).add(agent_id)
+        
+        for keys, agent_ids in groups.items():
+            delta = MCPContextDeltaMessage(
+                source_agent_id=source_agent_id,
+                scope=scope,
+                changes={key: versioned[key][1] for key in keys if key in versioned},
+                deleted_keys=[key for key in deleted_keys if key in keys],
+                versions={key: versioned[key][0] for key in keys if key in versioned},
+                version=version
+            )
+            await self._deliver(delta, agent_ids=agent_ids)
+    
     async def _handle_heartbeat(self, message: MCPHeartbeatMessage, agent_id: str) -> None:
         """Handle heartbeat message"""
         if agent_id in self.agent_registry:
             self.agent_registry[agent_id].update({
                 "status": message.status,
                 "last_heartbeat": message.timestamp,
-                "load_metrics": message.load_metrics
+                "last_seen": time.monotonic(),
+                "load_metrics": message.load_metrics or {}
             })
     
-    def register_tool(self, name: str, func: Callable):
-        """Register a tool function"""
+    def rank_agents(self, limit: Optional[int] = None) -> List[MCPAgentInfo]:
+        """This worker's connected agents ordered by reported load, least busy first"""
+        now = time.monotonic()
+        agents = [
+            MCPAgentInfo(
+                agent_id=agent_id,
+                status=entry["status"],
+                connected_at=entry["connected_at"],
+                last_heartbeat=entry["last_heartbeat"],
+                seconds_since_seen=round(now - entry["last_seen"], 3),
+                load_metrics=entry["load_metrics"],
+                load_score=load_score(entry["load_metrics"])
+            )
+            for agent_id, entry in list(self.agent_registry.items())
+        ]
+        agents.sort(key=lambda agent: (agent.load_score, agent.seconds_since_seen))
+        return agents[:limit] if limit is not None else agents
+    
+    def least_loaded_agent(self, exclude_agents: Optional[Set[str]] = None) -> Optional[str]:
+        """ID of the least busy connected agent, or None if there is none"""
+        exclude_agents = exclude_agents or set()
+        for agent in self.rank_agents():
+            if agent.agent_id not in exclude_agents and agent.status != "busy":
+                return agent.agent_id
+        return None
+    
+    async def _reap_stale_agents(self):
+        """Periodically disconnect agents that missed their heartbeats"""
+        while True:
+            await asyncio.sleep(self.agent_timeout / 3)
+            try:
+                deadline = time.monotonic() - self.agent_timeout
+                stale = [
+                    agent_id for agent_id, entry in list(self.agent_registry.items())
+                    if entry["last_seen"] < deadline
+                ]
+                for agent_id in stale:
+                    await self._expire_agent(agent_id)
+            except Exception as e:
+                logger.error(f"Agent reaper failed: {e}")
+    
+    async def _expire_agent(self, agent_id: str):
+        """Drop a silent agent and close its connection"""
+        logger.warning(f"Agent {agent_id} missed heartbeats for {self.agent_timeout}s; disconnecting")
+        self.agent_registry.pop(agent_id, None)
+        self.subscriptions.pop(agent_id, None)
+        outbound = self.outbound_queues.get(agent_id)
+        if outbound is not None:
+            # Closing the socket ends the connection handler, which finishes the cleanup
+            await outbound.close(AGENT_TIMEOUT_CLOSE_CODE, "heartbeat timeout")
+    
+    def register_tool(
+        self,
+        name: str,
+        func: Callable,
+        kind: Optional[ToolKind] = None,
+        max_concurrency: Optional[int] = None,
+        idempotent: bool = False,
+        cache_ttl: float = 30.0,
+        depends_on: Optional[DependencyFunc] = None,
+        invalidates: Optional[DependencyFunc] = None
+    ):
+        """
+        Register a tool function.
+        
+        Args:
+            name: Tool name used in invocation requests
+            func: Sync or async callable implementing the tool
+            kind: "async", "io" (thread pool) or "cpu" (process pool); inferred if omitted
+            max_concurrency: Maximum simultaneous executions of this tool
+            idempotent: Cache results and coalesce identical concurrent calls
+            cache_ttl: Seconds an idempotent result stays cached
+            depends_on: Maps arguments to the keys (e.g. paths) a cached result depends on
+            invalidates: Maps arguments to the keys this tool changes; "*" means everything
+        """
         self.tool_registry[name] = func
+        self.scheduler.configure_tool(name, func, kind=kind, max_concurrency=max_concurrency)
+        self.result_cache.configure_tool(
+            name, idempotent=idempotent, ttl=cache_ttl,
+            depends_on=depends_on, invalidates=invalidates
+        )
         logger.info(f"Registered tool: {name}")
     
     def unregister_tool(self, name: str):
         """Unregister a tool function"""
         if name in self.tool_registry:
             del self.tool_registry[name]
+            self.scheduler.remove_tool(name)
+            self.result_cache.remove_tool(name)
             logger.info(f"Unregistered tool: {name}")
     
-    async def broadcast_message(self, message: MCPMessage, exclude_agents: Optional[Set[str]] = None):
-        """Broadcast message to all connected agents"""
+    async def broadcast_message(
+        self,
+        message: MCPMessage,
+        exclude_agents: Optional[Set[str]] = None,
+        agent_ids: Optional[Set[str]] = None
+    ):
+        """Broadcast message to connected agents on every worker, or only to agent_ids when given"""
+        await self._deliver(message, exclude_agents, agent_ids)
+        await self._publish_event("broadcast", {
+            "message": message.model_dump(mode="json"),
+            "exclude_agents": sorted(exclude_agents or ()),
+            "agent_ids": sorted(agent_ids) if agent_ids is not None else None
+        })
+    
+    async def _publish_event(self, kind: str, payload: Dict[str, Any]):
+        """Forward an event to the other workers, if any"""
+        if self.event_bus is None:
+            return
+        try:
+            await self.event_bus.publish(kind, payload)
+        except Exception as e:
+            logger.error(f"Failed to publish {kind} event: {e}")
+    
+    async def _handle_bus_event(self, kind: str, payload: Dict[str, Any]):
+        """Apply an event published by another worker to this worker's connections"""
+        if kind == "broadcast":
+            agent_ids = payload.get("agent_ids")
+            await self._deliver(
+                validate_mcp_message(payload["message"]),
+                set(payload.get("exclude_agents") or ()),
+                set(agent_ids) if agent_ids is not None else None
+            )
+        elif kind == "context_delta":
+            payload["versioned"] = {key: tuple(entry) for key, entry in payload["versioned"].items()}
+            await self._deliver_context_delta(**payload)
+        elif kind == "invalidate":
+            self.result_cache.invalidate(payload["keys"])
+        else:
+            logger.warning(f"Unknown event kind from another worker: {kind}")
+    
+    async def _deliver(
+        self,
+        message: MCPMessage,
+        exclude_agents: Optional[Set[str]] = None,
+        agent_ids: Optional[Set[str]] = None
+    ):
+        """
+        Queue a message for this worker's connected agents.
+        
+        The message is encoded once per negotiated encoding and handed to each
+        connection's outbound queue without waiting, so a slow client only delays
+        itself; what happens when its queue is full is set by slow_consumer_policy.
+        """
         exclude_agents = exclude_agents or set()
+        encoded: Dict[str, Any] = {}
+        dropped = 0
         
-        for agent_id, websocket in self.active_connections.items():
-            if agent_id not in exclude_agents:
-                try:
-                    await websocket.send_text(message.json())
-                except Exception as e:
-                    logger.error(f"Failed to send message to agent {agent_id}: {e}")
+        for agent_id, outbound in list(self.outbound_queues.items()):
+            if agent_ids is not None and agent_id not in agent_ids:
+                continue
+            if agent_id in exclude_agents:
+                continue
+            codec = self.connection_codecs[agent_id]
+            if codec.name not in encoded:
+                encoded[codec.name] = codec.encode(message)
+            if not outbound.offer(encoded[codec.name]):
+                dropped += 1
+        
+        if dropped:
+            logger.debug(f"Broadcast {message.message_type} not queued for {dropped} slow agent(s)")
+    
+    async def _purge_expired_context(self):
+        """Periodically drop expired context so idle keys do not hold memory"""
+        while True:
+            await asyncio.sleep(self.context_purge_interval)
+            try:
+                removed = await self.context_store.purge_expired()
+                if removed:
+                    logger.debug(f"Purged {removed} expired context entries")
+            except Exception as e:
+                logger.error(f"Context purge failed: {e}")
     
     async def _cleanup_connections(self):
         """Cleanup all active connections"""
-        for agent_id, websocket in self.active_connections.items():
+        for outbound in list(self.outbound_queues.values()):
+            await outbound.close()
+        for agent_id, websocket in list(self.active_connections.items()):
             try:
                 await websocket.close()
             except Exception as e:
                 logger.error(f"Error closing connection for agent {agent_id}: {e}")
+        if self._local_tasks:
+            await asyncio.gather(*self._local_tasks, return_exceptions=True)
         
+        self.outbound_queues.clear()
         self.active_connections.clear()
         self.agent_registry.clear()
     
-    async def start(self):
-        """Start the MCP server"""
+    async def start(self, sockets: Optional[List[Any]] = None, log_level: str = "info"):
+        """
+        Start the MCP server, optionally on already bound listening sockets.
+        
+        With uds set, the server also listens on that Unix domain socket and
+        removes the socket file when it stops. Levels above "info" also silence
+        the per-request access log.
+        """
         config = uvicorn.Config(
             self.app,
             host=self.host,
             port=self.port,
-            log_level="info"
+            log_level=log_level,
+            ws_per_message_deflate=self.websocket_compression
         )
         server = uvicorn.Server(config)
-        await server.serve()
+        unix_socket = None
+        if self.uds is not None:
+            unix_socket = bind_unix_socket(self.uds, self.uds_mode)
+            if sockets is None:
+                # bind_socket() leaves proto 0, which stops asyncio enabling TCP_NODELAY
+                tcp_socket = config.bind_socket()
+                sockets = [socket.socket(tcp_socket.family, tcp_socket.type, socket.IPPROTO_TCP,
+                                         fileno=tcp_socket.detach())]
+            sockets = [*sockets, unix_socket]
+        try:
+            await server.serve(sockets=sockets)
+        finally:
+            if unix_socket is not None:
+                unix_socket.close()
+                try:
+                    os.unlink(self.uds)
+                except FileNotFoundError:
+                    pass
+    
+    async def startup(self, url: Optional[str] = None):
+        """
+        Run the server's startup for in-process use, without listening on a port.
+        
+        With url, clients in this process configured with that server URL, e.g.
+        the default http://localhost:8000, connect in-process instead.
+        """
+        if self._lifespan is None:
+            self._lifespan = self.app.router.lifespan_context(self.app)
+            await self._lifespan.__aenter__()
+        if url is not None:
+            register_local_server(url, self)
+            self._local_aliases.append(url)
+    
+    async def shutdown(self):
+        """Run the shutdown matching startup(), closing in-process connections"""
+        for url in self._local_aliases:
+            unregister_local_server(url, self)
+        self._local_aliases.clear()
+        if self._lifespan is not None:
+            lifespan, self._lifespan = self._lifespan, None
+            await lifespan.__aexit__(None, None, None)
 
 # Convenience function to create and run server
 async def run_mcp_server(host: str = "localhost", port: int = 8000, **kwargs):
     """Run MCP server with default configuration"""
-    server = MCPServer(host, port)
+    state_dir = kwargs.get("state_dir")
+    persistence = StatePersistence(state_dir) if state_dir else None
+    server = MCPServer(host, port, persistence=persistence, uds=kwargs.get("uds"))
     
     # Register any additional tools passed in kwargs
+    cpu_bound_tools = set(kwargs.get("cpu_bound_tools", ()))
+    tool_options = kwargs.get("tool_options", {})
     for tool_name, tool_func in kwargs.get("tools", {}).items():
-        server.register_tool(tool_name, tool_func)
+        kind = "cpu" if tool_name in cpu_bound_tools else None
+        server.register_tool(tool_name, tool_func, kind=kind, **tool_options.get(tool_name, {}))
     
     await server.start()
 
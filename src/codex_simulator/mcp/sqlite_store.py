@@ -0,0 +1,457 @@
+"""
+SQLite Context Store
+Context storage shared by several MCP server processes through one SQLite file.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from .context_store import (
+    DELETED, ContextScope, ContextStore, MergeStrategy, ScopeLimits,
+    default_scope_limits, merge_value
+)
+from .result_cache import IdempotencyCache
+from .schemas import validate_mcp_message_json
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS context (
+    scope TEXT NOT NULL,
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (scope, ns, key)
+);
+CREATE INDEX IF NOT EXISTS context_scope_version ON context (scope, version);
+CREATE TABLE IF NOT EXISTS tombstones (
+    scope TEXT NOT NULL,
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (scope, ns, key)
+);
+CREATE INDEX IF NOT EXISTS tombstones_scope_version ON tombstones (scope, version);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (name, value) VALUES ('version', 0);
+"""
+
+def connect_shared_sqlite(path: str, timeout: float = 5.0) -> sqlite3.Connection:
+    """Open a connection tuned for several processes sharing one database file"""
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+    # WAL lets readers in other processes proceed while one process writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class SQLiteContextStore(ContextStore):
+    """
+    Context store backed by a SQLite file, for multi-process servers on one host.
+
+    Versions come from a counter in the database, so they increase across all
+    processes. Eviction removes the least recently written entries; reads do not
+    update recency, which would turn every fetch into a write. Values are stored
+    as JSON, so non-JSON types come back as strings.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        limits: Optional[Dict[ContextScope, ScopeLimits]] = None,
+        clock: Callable[[], float] = time.time,
+        timeout: float = 5.0
+    ):
+        self.path = path
+        self.limits = {**default_scope_limits(), **(limits or {})}
+        self.clock = clock
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._evictions = 0
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """Connection for the calling thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect_shared_sqlite(self.path, self.timeout)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _check_scope(self, scope: ContextScope):
+        if scope not in self.limits:
+            raise ValueError(f"Unknown context scope: {scope}")
+
+    async def get_version(self) -> int:
+        return await asyncio.to_thread(self._select_version)
+
+    def _select_version(self) -> int:
+        return self._conn().execute("SELECT value FROM meta WHERE name = 'version'").fetchone()[0]
+
+    async def get_many(self, scope: ContextScope, namespace: str, keys: Iterable[str]) -> Dict[str, Any]:
+        versioned = await self.get_versioned(scope, namespace, keys)
+        return {key: value for key, (_, value) in versioned.items()}
+
+    async def get_versioned(
+        self, scope: ContextScope, namespace: str, keys: Iterable[str]
+    ) -> Dict[str, Tuple[int, Any]]:
+        self._check_scope(scope)
+        keys = list(keys)
+        if not keys:
+            return {}
+        return await asyncio.to_thread(self._select, scope, namespace, keys)
+
+    def _select(self, scope: ContextScope, namespace: str, keys: List[str]) -> Dict[str, Tuple[int, Any]]:
+        placeholders = ",".join("?" for _ in keys)
+        rows = self._conn().execute(
+            f"SELECT key, version, value FROM context WHERE scope = ? AND ns = ? AND key IN ({placeholders}) "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (scope, namespace, *keys, self.clock())
+        ).fetchall()
+        return {key: (version, json.loads(value)) for key, version, value in rows}
+
+    async def changed_since(
+        self,
+        scope: ContextScope,
+        namespace: str,
+        since_version: int,
+        prefixes: Optional[Iterable[str]] = None
+    ) -> Dict[str, Tuple[int, Any]]:
+        self._check_scope(scope)
+        prefixes = tuple(prefixes) if prefixes is not None else ("",)
+        rows = await asyncio.to_thread(
+            lambda: self._conn().execute(
+                "SELECT key, version, value FROM context WHERE scope = ? AND ns = ? AND version > ? "
+                "AND (expires_at IS NULL OR expires_at > ?) "
+                "UNION ALL SELECT key, version, NULL FROM tombstones WHERE scope = ? AND ns = ? AND version > ?",
+                (scope, namespace, since_version, self.clock(), scope, namespace, since_version)
+            ).fetchall()
+        )
+        return {
+            key: (version, json.loads(value) if value is not None else DELETED)
+            for key, version, value in rows if key.startswith(prefixes)
+        }
+
+    async def apply_updates(
+        self,
+        scope: ContextScope,
+        namespace: str,
+        updates: Dict[str, Any],
+        merge_strategy: MergeStrategy = "merge"
+    ) -> List[str]:
+        self._check_scope(scope)
+        if not updates:
+            return []
+        return await asyncio.to_thread(self._write, scope, namespace, updates, merge_strategy)
+
+    def _next_version(self, conn: sqlite3.Connection) -> int:
+        conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'version'")
+        return conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()[0]
+
+    def _write(
+        self,
+        scope: ContextScope,
+        namespace: str,
+        updates: Dict[str, Any],
+        merge_strategy: MergeStrategy
+    ) -> List[str]:
+        limits = self.limits[scope]
+        conn = self._conn()
+        now = self.clock()
+        expires_at = now + limits.ttl if limits.ttl is not None else None
+
+        # IMMEDIATE takes the write lock up front so read-merge-write is atomic across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "DELETE FROM tombstones WHERE scope = ? AND ns = ? AND key = ?",
+                [(scope, namespace, key) for key in updates]
+            )
+            for key, value in updates.items():
+                current = None
+                if merge_strategy in ("merge", "append"):
+                    row = conn.execute(
+                        "SELECT value FROM context WHERE scope = ? AND ns = ? AND key = ? "
+                        "AND (expires_at IS NULL OR expires_at > ?)",
+                        (scope, namespace, key, now)
+                    ).fetchone()
+                    current = json.loads(row[0]) if row else None
+
+                encoded = json.dumps(
+                    merge_value(current, value, merge_strategy, limits.max_list_length),
+                    default=str, separators=(",", ":")
+                )
+                size = len(encoded.encode("utf-8"))
+                if size > limits.max_value_bytes:
+                    raise ValueError(
+                        f"Context value '{key}' is {size} bytes; the {scope} limit is {limits.max_value_bytes}"
+                    )
+                conn.execute(
+                    "INSERT OR REPLACE INTO context (scope, ns, key, value, size, version, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (scope, namespace, key, encoded, size, self._next_version(conn), expires_at)
+                )
+            self._enforce_limits(conn, scope, limits, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return list(updates)
+
+    def _enforce_limits(self, conn: sqlite3.Connection, scope: ContextScope, limits: ScopeLimits, now: float):
+        conn.execute("DELETE FROM context WHERE scope = ? AND expires_at <= ?", (scope, now))
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM context WHERE scope = ?", (scope,)
+        ).fetchone()
+
+        if count > limits.max_keys:
+            excess = count - limits.max_keys
+            conn.execute(
+                "DELETE FROM context WHERE rowid IN "
+                "(SELECT rowid FROM context WHERE scope = ? ORDER BY version LIMIT ?)",
+                (scope, excess)
+            )
+            self._evictions += excess
+            count, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM context WHERE scope = ?", (scope,)
+            ).fetchone()
+
+        # Keep the newest entry even if it alone exceeds the byte budget
+        while total > limits.max_bytes and count > 1:
+            row = conn.execute(
+                "SELECT rowid, size FROM context WHERE scope = ? ORDER BY version LIMIT 1", (scope,)
+            ).fetchone()
+            conn.execute("DELETE FROM context WHERE rowid = ?", (row[0],))
+            total -= row[1]
+            count -= 1
+            self._evictions += 1
+
+    async def delete(self, scope: ContextScope, namespace: str, keys: Iterable[str]) -> int:
+        self._check_scope(scope)
+        keys = list(keys)
+        if not keys:
+            return 0
+        return await asyncio.to_thread(self._delete, scope, namespace, keys)
+
+    def _delete(self, scope: ContextScope, namespace: str, keys: List[str]) -> int:
+        conn = self._conn()
+        placeholders = ",".join("?" for _ in keys)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = [row[0] for row in conn.execute(
+                f"SELECT key FROM context WHERE scope = ? AND ns = ? AND key IN ({placeholders})",
+                (scope, namespace, *keys)
+            ).fetchall()]
+            conn.execute(
+                f"DELETE FROM context WHERE scope = ? AND ns = ? AND key IN ({placeholders})",
+                (scope, namespace, *keys)
+            )
+            if deleted:
+                version = self._next_version(conn)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO tombstones (scope, ns, key, version) VALUES (?, ?, ?, ?)",
+                    [(scope, namespace, key, version) for key in deleted]
+                )
+                # Keep only the newest max_keys tombstones of the scope
+                conn.execute(
+                    "DELETE FROM tombstones WHERE scope = ? AND rowid NOT IN "
+                    "(SELECT rowid FROM tombstones WHERE scope = ? ORDER BY version DESC LIMIT ?)",
+                    (scope, scope, self.limits[scope].max_keys)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(deleted)
+
+    async def purge_expired(self) -> int:
+        return await asyncio.to_thread(self._purge_expired)
+
+    def _purge_expired(self) -> int:
+        return self._conn().execute(
+            "DELETE FROM context WHERE expires_at <= ?", (self.clock(),)
+        ).rowcount
+
+    async def export_entries(self, scopes: Iterable[ContextScope]) -> List[Tuple[ContextScope, str, str, Any]]:
+        return await asyncio.to_thread(self._export, list(scopes))
+
+    def _export(self, scopes: List[ContextScope]) -> List[Tuple[ContextScope, str, str, Any]]:
+        exported = []
+        for scope in scopes:
+            self._check_scope(scope)
+            rows = self._conn().execute(
+                "SELECT ns, key, value FROM context WHERE scope = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (scope, self.clock())
+            ).fetchall()
+            exported.extend((scope, namespace, key, json.loads(value)) for namespace, key, value in rows)
+        return exported
+
+    def snapshot(self, scope: ContextScope) -> Dict[str, Any]:
+        return {
+            f"{namespace}.{key}" if namespace else key: value
+            for _, namespace, key, value in self._export([scope])
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        scopes = {scope: {"keys": 0, "bytes": 0} for scope in self.limits}
+        for scope, count, total in self._conn().execute(
+            "SELECT scope, COUNT(*), COALESCE(SUM(size), 0) FROM context GROUP BY scope"
+        ):
+            scopes[scope] = {"keys": count, "bytes": total}
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "scopes": scopes,
+            "evictions": self._evictions
+        }
+
+    async def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+_IDEMPOTENCY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    response TEXT,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idempotency_expires ON idempotency (expires_at);
+"""
+
+class SQLiteIdempotencyCache(IdempotencyCache):
+    """
+    Idempotency cache shared by several MCP server processes through a SQLite file.
+
+    A worker claims a key by inserting a row without a response before it runs
+    the request, so a retry routed to another worker waits for that response
+    instead of running the request again. The claiming worker renews its claim
+    while the request runs, so a claim left by a worker that died lapses after
+    claim_timeout. Responses must be MCP messages; they are stored as JSON.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 300.0,
+        claim_timeout: float = 10.0,
+        poll_interval: float = 0.05,
+        clock: Callable[[], float] = time.time
+    ):
+        super().__init__(ttl=ttl, clock=clock)
+        self.path = path
+        self.claim_timeout = claim_timeout
+        self.poll_interval = poll_interval
+        self._claim_keepers: Set[asyncio.Task] = set()
+        self._conn = connect_shared_sqlite(path)
+        self._conn.executescript(_IDEMPOTENCY_SCHEMA)
+        # The connection is used from worker threads and done callbacks alike
+        self._lock = threading.Lock()
+
+    async def run(self, key: str, run: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stats["joined"] += 1
+            return await asyncio.shield(task)
+
+        waiting = False
+        while True:
+            claimed, stored = await asyncio.to_thread(self._claim, key)
+            if claimed:
+                break
+            if stored is not None:
+                self._stats["joined" if waiting else "replayed"] += 1
+                return validate_mcp_message_json(stored)
+            # Another worker is running the request
+            waiting = True
+            await asyncio.sleep(self.poll_interval)
+
+        self._stats["executed"] += 1
+        task = asyncio.ensure_future(run())
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._complete(key, done))
+        keeper = asyncio.ensure_future(self._keep_claim(key, task))
+        self._claim_keepers.add(keeper)
+        keeper.add_done_callback(self._claim_keepers.discard)
+        return await asyncio.shield(task)
+
+    async def _keep_claim(self, key: str, task: asyncio.Task):
+        """Renew the claim on key until its request finishes"""
+        while True:
+            await asyncio.wait({task}, timeout=self.claim_timeout / 3)
+            if task.done():
+                return
+            try:
+                await asyncio.to_thread(self._renew_claim, key)
+            except sqlite3.Error as e:
+                logger.warning(f"Renewing idempotency claim for {key} failed: {e}")
+
+    def _renew_claim(self, key: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE idempotency SET expires_at = ? WHERE key = ? AND response IS NULL",
+                (self.clock() + self.claim_timeout, key)
+            )
+
+    def _claim(self, key: str) -> Tuple[bool, Optional[str]]:
+        """Claim key for this worker, or return the response stored for it (None while running)"""
+        now = self.clock()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM idempotency WHERE expires_at <= ?", (now,))
+                row = self._conn.execute("SELECT response FROM idempotency WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self._conn.execute(
+                        "INSERT INTO idempotency (key, response, expires_at) VALUES (?, NULL, ?)",
+                        (key, now + self.claim_timeout)
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return (True, None) if row is None else (False, row[0])
+
+    def _complete(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        try:
+            with self._lock:
+                # Failed executions release the claim, so a retry runs the request again
+                if task.cancelled() or task.exception() is not None or not isinstance(task.result(), BaseModel):
+                    self._conn.execute("DELETE FROM idempotency WHERE key = ?", (key,))
+                else:
+                    self._conn.execute(
+                        "UPDATE idempotency SET response = ?, expires_at = ? WHERE key = ?",
+                        (task.result().model_dump_json(), self.clock() + self.ttl, key)
+                    )
+        except sqlite3.Error as e:
+            logger.error(f"Storing idempotent response for {key} failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stored = self._conn.execute(
+                "SELECT COUNT(*) FROM idempotency WHERE response IS NOT NULL AND expires_at > ?", (self.clock(),)
+            ).fetchone()[0]
+        return {**self._stats, "stored": stored, "in_flight": len(self._inflight)}
+
+    async def close(self):
+        for keeper in list(self._claim_keepers):
+            keeper.cancel()
+        with self._lock:
+            self._conn.close()
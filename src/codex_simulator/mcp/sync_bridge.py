@@ -0,0 +1,117 @@
+"""
+MCP Sync Bridge
+Runs MCP coroutines from synchronous code on a dedicated event-loop thread.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+class EventLoopThread:
+    """
+    An event loop running forever in a daemon thread.
+
+    Synchronous callers submit coroutines and wait on concurrent futures, so a
+    tool invoked from CrewAI's synchronous agent loop never re-enters, or waits
+    on, the event loop of the thread it was called from.
+    """
+
+    def __init__(self, name: str = "mcp-sync-bridge"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The bridge loop, started on first use"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                ready = threading.Event()
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._run_loop, args=(self._loop, ready), name=self.name, daemon=True
+                )
+                self._thread.start()
+                ready.wait()
+            return self._loop
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop, ready: threading.Event):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def in_bridge_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable[T]) -> "concurrent.futures.Future[T]":
+        """Schedule a coroutine on the bridge loop without waiting for it"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """
+        Run a coroutine on the bridge loop and wait for its result.
+
+        Raises:
+            TimeoutError: If it does not finish within timeout; it is then cancelled
+            RuntimeError: If called from the bridge thread itself, which would deadlock
+        """
+        if self.in_bridge_thread():
+            coro.close()
+            raise RuntimeError("EventLoopThread.run() called from its own loop; await the coroutine instead")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Coroutine did not finish within {timeout}s on {self.name}")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the loop and join the thread"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+_shared_bridge = EventLoopThread()
+
+def get_sync_bridge() -> EventLoopThread:
+    """The process-wide bridge shared by every MCP client and tool wrapper"""
+    return _shared_bridge
+
+def run_sync(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """Run an MCP coroutine to completion from synchronous code"""
+    return _shared_bridge.run(coro, timeout)
+
+def run_on_loop(coro: Awaitable[T], loop: asyncio.AbstractEventLoop, timeout: Optional[float] = None) -> T:
+    """
+    Run a coroutine on a loop running in another thread and wait for its result.
+
+    Raises:
+        TimeoutError: If it does not finish within timeout; it is then cancelled
+        RuntimeError: If called from that loop, which would deadlock
+    """
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("Blocking call made from the loop it must run on; await the coroutine instead")
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"Coroutine did not finish within {timeout}s")
@@ -0,0 +1,157 @@
+"""
+MCP Multi-Worker Mode
+Runs several MCPServer processes on one port, sharing state through SQLite.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .server import MCPServer, bind_unix_socket
+from .sqlite_store import SQLiteContextStore, SQLiteIdempotencyCache
+from .event_bus import SQLiteEventBus
+
+logger = logging.getLogger(__name__)
+
+ServerConfigurator = Callable[[MCPServer], None]
+
+def reuse_port_supported() -> bool:
+    """Whether the kernel can load-balance one port across independently bound sockets"""
+    return hasattr(socket, "SO_REUSEPORT")
+
+def bind_listening_socket(host: str, port: int, reuse_port: bool = False) -> socket.socket:
+    """Bind a TCP listening socket suitable for handing to uvicorn"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    # An explicit protocol lets asyncio enable TCP_NODELAY on accepted connections;
+    # with proto 0 small responses wait out delayed ACKs (~40ms each)
+    sock = socket.socket(family, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def _worker_main(
+    index: int,
+    host: str,
+    port: int,
+    state_path: str,
+    configure: Optional[ServerConfigurator],
+    server_kwargs: Dict[str, Any],
+    inherited_socket: Optional[socket.socket],
+    unix_socket: Optional[socket.socket] = None
+):
+    """Entry point of one worker process"""
+    # The supervisor handles Ctrl+C and terminates workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    sock = inherited_socket or bind_listening_socket(host, port, reuse_port=True)
+    sockets = [sock] if unix_socket is None else [sock, unix_socket]
+
+    async def serve():
+        server = MCPServer(
+            host,
+            port,
+            context_store=SQLiteContextStore(state_path),
+            event_bus=SQLiteEventBus(state_path),
+            idempotency=SQLiteIdempotencyCache(state_path),
+            **server_kwargs
+        )
+        server.server_id = f"{server.server_id}-w{index}"
+        if configure is not None:
+            configure(server)
+        await server.start(sockets=sockets)
+
+    asyncio.run(serve())
+
+def run_mcp_server_workers(
+    host: str = "localhost",
+    port: int = 8000,
+    workers: Optional[int] = None,
+    state_path: str = "mcp_state.sqlite3",
+    configure: Optional[ServerConfigurator] = None,
+    server_kwargs: Optional[Dict[str, Any]] = None,
+    restart_delay: float = 1.0,
+    uds: Optional[str] = None,
+    uds_mode: int = 0o660
+):
+    """
+    Serve one port from several MCPServer processes and supervise them.
+
+    With SO_REUSEPORT each worker binds its own socket and the kernel spreads
+    connections across them; otherwise the listening socket is bound once here and
+    inherited by forked workers. Context and idempotent responses live in a shared
+    SQLite file, and broadcasts, context deltas and cache invalidations travel over an event bus in
+    the same file. Crashed workers are restarted.
+
+    Args:
+        configure: Called in each worker with its MCPServer to register tools;
+            must be picklable (a module-level function) when workers are spawned
+        server_kwargs: Extra MCPServer arguments, e.g. max_concurrent_requests
+        uds: Unix domain socket to serve as well; bound once here and shared by all workers
+    """
+    workers = workers or os.cpu_count() or 1
+    server_kwargs = server_kwargs or {}
+    reuse_port = reuse_port_supported()
+    shared_socket = None if reuse_port else bind_listening_socket(host, port)
+    unix_socket = bind_unix_socket(uds, uds_mode) if uds is not None else None
+    # Workers that inherit a socket must be forked
+    inherits = shared_socket is not None or unix_socket is not None
+    context = multiprocessing.get_context("fork" if inherits else None)
+
+    # Create the schema once so workers do not race to do it
+    asyncio.run(SQLiteContextStore(state_path).close())
+    asyncio.run(SQLiteEventBus(state_path).close())
+    asyncio.run(SQLiteIdempotencyCache(state_path).close())
+
+    def spawn(index: int) -> multiprocessing.Process:
+        process = context.Process(
+            target=_worker_main,
+            args=(index, host, port, state_path, configure, server_kwargs, shared_socket, unix_socket),
+            name=f"mcp-worker-{index}",
+            daemon=False
+        )
+        process.start()
+        return process
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # Terminating the supervisor must take the workers down with it
+    signal.signal(signal.SIGTERM, stop)
+    processes: List[multiprocessing.Process] = [spawn(index) for index in range(workers)]
+    logger.info(
+        f"Started {workers} MCP workers on {host}:{port} "
+        f"({'SO_REUSEPORT' if reuse_port else 'shared socket'}, state in {state_path})"
+    )
+
+    try:
+        while True:
+            time.sleep(restart_delay)
+            for index, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.warning(f"MCP worker {index} exited with code {process.exitcode}; restarting")
+                    processes[index] = spawn(index)
+    except KeyboardInterrupt:
+        logger.info("Stopping MCP workers...")
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join(timeout=10)
+        if shared_socket is not None:
+            shared_socket.close()
+        if unix_socket is not None:
+            unix_socket.close()
+            try:
+                os.unlink(uds)
+            except FileNotFoundError:
+                pass
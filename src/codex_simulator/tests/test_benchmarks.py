@@ -0,0 +1,116 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from ..benchmarks import compare_to_baseline, load_results, percentile, summarize_latencies, write_results
+from ..benchmarks.mcp_bench import SCENARIOS, Scenario, create_benchmark_server, run_case
+from ..benchmarks.e2e_bench import PhaseTimer, ScriptedLLM, UNSCRIPTED_ANSWER, act, answer, instrument
+
+
+class TestBenchmarkStats:
+    """Test cases for latency summaries and baseline comparison"""
+    
+    def test_percentiles_interpolate(self):
+        """Test percentiles of sorted samples"""
+        values = [1.0, 2.0, 3.0, 4.0, 5.0]
+        assert percentile(values, 50) == 3.0
+        assert percentile(values, 95) == pytest.approx(4.8)
+        assert percentile([], 99) == 0.0
+        
+        summary = summarize_latencies([0.003, 0.001, 0.002])
+        assert summary.count == 3
+        assert summary.p50 == pytest.approx(2.0)
+        assert summary.max == pytest.approx(3.0)
+    
+    def test_compare_to_baseline(self, tmp_path):
+        """Test that only changes beyond the tolerance in the wrong direction regress"""
+        def case(name, rps, p95):
+            return {"name": name, "throughput_rps": rps, "latency_ms": {"p50": 1.0, "p95": p95, "p99": p95}}
+        
+        path = str(tmp_path / "baseline.json")
+        write_results(path, "mcp", [case("fast", 100.0, 10.0), case("slow", 100.0, 10.0)], {})
+        baseline = load_results(path)
+        
+        regressions, unmatched = compare_to_baseline(
+            [case("fast", 150.0, 5.0), case("slow", 80.0, 10.5), case("new", 1.0, 1.0)], baseline, tolerance=0.1
+        )
+        assert unmatched == ["new"]
+        assert [(r.case, r.metric) for r in regressions] == [("slow", "throughput_rps")]
+        assert regressions[0].change == pytest.approx(-0.2)
+        
+        # Large relative changes in tiny values are ignored below min_delta
+        regressions, _ = compare_to_baseline([case("fast", 100.0, 12.0)], baseline, tolerance=0.1, min_delta=5.0)
+        assert regressions == []
+        
+        (tmp_path / "other.json").write_text('{"cases": []}')
+        with pytest.raises(ValueError):
+            load_results(str(tmp_path / "other.json"))
+
+
+class TestMCPBenchmark:
+    """Test cases for the MCP benchmark harness"""
+    
+    @pytest.mark.asyncio
+    async def test_run_case_in_process(self):
+        """Test a small case against an in-process server"""
+        server = create_benchmark_server()
+        await server.startup()
+        try:
+            case = await run_case(server.local_url, "local", SCENARIOS["payload"], clients=2, requests=3)
+            failing = await run_case(server.local_url, "local", Scenario("missing", "missing_tool"), 1, 2)
+        finally:
+            await server.shutdown()
+        
+        assert case["name"] == "payload/local/c2"
+        assert case["requests"] == 6 and case["errors"] == 0
+        assert case["latency_ms"]["count"] == 6
+        assert case["throughput_rps"] > 0
+        assert failing["errors"] == 2 and failing["latency_ms"]["count"] == 0
+
+
+class TestE2EBenchmark:
+    """Test cases for the end-to-end benchmark's scripted LLM and phase timing"""
+    
+    def test_scripted_llm_answers_by_agent_role(self):
+        """Test that turns go to the agent they address, in order"""
+        llm = ScriptedLLM()
+        llm.load([
+            act("Commander", "delegate_tool", task="ls", coworker="FileNavigator"),
+            answer("Navigator", "a.txt"),
+            answer("Commander", "done")
+        ])
+        commander = SimpleNamespace(role="Terminal Commander\n")
+        navigator = SimpleNamespace(role="File Navigator")
+        
+        first = llm.call([], from_task=SimpleNamespace(agent=commander))
+        assert "Action: delegate_tool" in first and '"task": "ls"' in first
+        assert llm.call([], from_agent=commander).endswith("Final Answer: done")
+        assert llm.call([], from_agent=commander) == UNSCRIPTED_ANSWER
+        assert (llm.calls, llm.unscripted, llm.remaining) == (3, 1, 1)
+        
+        llm.load([])
+        assert (llm.calls, llm.remaining) == (0, 0)
+    
+    def test_phase_timer_excludes_nested_phases(self):
+        """Test that nested phase time is not counted twice, and instrumentation is undone"""
+        timer = PhaseTimer()
+        
+        class Worker:
+            def outer(self):
+                time.sleep(0.02)
+                self.inner()
+            
+            def inner(self):
+                time.sleep(0.03)
+        
+        worker = Worker()
+        with instrument(timer, [(Worker, "outer", "framework"), (worker, "inner", "tool_execution")]):
+            worker.outer()
+        phases = timer.collect()
+        
+        assert phases["tool_execution"] == pytest.approx(0.03, abs=0.015)
+        assert phases["framework"] == pytest.approx(0.02, abs=0.015)
+        assert "inner" not in vars(worker)
+        assert Worker.outer.__name__ == "outer" and not hasattr(Worker.outer, "__wrapped__")
+        assert timer.collect() == {}
@@ -4,10 +4,19 @@ from unittest.mock import Mock, AsyncMock, patch
 from datetime import datetime
 
 from ..mcp import (
-    MCPServer, MCPClient, MCPToolWrapper, MCPConnectionConfig,
-    MCPToolInvocationRequest, MCPToolInvocationResponse,
-    validate_mcp_message
+    MCPServer, MCPClient, MCPToolWrapper, MCPClientPool, MCPConnectionConfig, MCPRequestError,
+    MCPToolInvocationRequest, MCPToolInvocationResponse, MCPContextFetchResponse,
+    MCPStateUpdateResponse, MCPContextFetchRequest, MCPStateUpdateRequest, MCPHeartbeatMessage,
+    validate_mcp_message, validate_mcp_message_json
 )
+from ..mcp.codec import get_codec
+from ..mcp.scheduler import MCPToolScheduler, MCPServerBusyError
+from ..mcp.result_cache import MCPResultCache
+from ..mcp.context_store import DELETED, InMemoryContextStore, ScopeLimits
+from ..mcp.persistence import StatePersistence
+from ..mcp.sqlite_store import SQLiteContextStore, SQLiteIdempotencyCache
+from ..mcp.event_bus import SQLiteEventBus
+from ..mcp.outbound import OutboundQueue, ConnectionClosedError, SLOW_CONSUMER_CLOSE_CODE
 from ..mcp.server import run_mcp_server
 from ..mcp.client import create_mcp_client, wrap_tools_with_mcp
 
@@ -88,6 +97,120 @@ class TestMCPSchemas:
         with pytest.raises(ValueError, match="Unsupported message type"):
             validate_mcp_message(invalid_data)
 
+    def test_response_type_discriminator(self):
+        """Test that responses are parsed by their explicit response_type"""
+        response_data = {
+            "message_type": "response",
+            "response_type": "context_fetch",
+            "request_id": "test-123",
+            "success": True,
+            "context_data": {"result": "looks like a tool response"}
+        }
+        
+        response = validate_mcp_message(response_data)
+        assert isinstance(response, MCPContextFetchResponse)
+
+    def test_legacy_response_without_response_type(self):
+        """Test that responses from older peers are still recognized"""
+        response = validate_mcp_message_json(
+            '{"message_type": "response", "request_id": "test-123", "success": true, "updated_keys": ["a"]}'
+        )
+        assert isinstance(response, MCPStateUpdateResponse)
+        assert response.updated_keys == ["a"]
+    
+    def test_trusted_message_skips_validation(self):
+        """Test that trusted in-process messages are built without validation"""
+        message_data = {
+            "message_type": "invoke_tool",
+            "request_id": "test-123",
+            "agent_id": "test_agent",
+            "tool_name": "test_tool",
+            "priority": 99
+        }
+        
+        with pytest.raises(ValueError):
+            validate_mcp_message(message_data)
+        
+        request = validate_mcp_message(message_data, trusted=True)
+        assert isinstance(request, MCPToolInvocationRequest)
+        assert request.priority == 99
+        assert request.timeout == 30
+
+class TestMCPCodecs:
+    """Test wire encodings for MCP messages"""
+    
+    @pytest.mark.parametrize("encoding", ["json", "msgpack"])
+    def test_codec_round_trip(self, encoding):
+        """Test that each codec restores the original message"""
+        if encoding == "msgpack":
+            pytest.importorskip("msgpack")
+        codec = get_codec(encoding)
+        
+        response = MCPToolInvocationResponse(
+            request_id="test-123",
+            success=True,
+            result={"content": "x" * 1000, "lines": [1, 2, 3]},
+            execution_time=0.5
+        )
+        
+        encoded = codec.encode(response)
+        assert isinstance(encoded, bytes if codec.binary else str)
+        
+        decoded = codec.decode(encoded)
+        assert isinstance(decoded, MCPToolInvocationResponse)
+        assert decoded.result == response.result
+        assert decoded.timestamp == response.timestamp
+    
+    def test_msgpack_non_string_keys(self):
+        """Test that tool results with non-string dict keys survive msgpack"""
+        pytest.importorskip("msgpack")
+        codec = get_codec("msgpack")
+        response = MCPToolInvocationResponse(request_id="test-123", success=True, result={1: "x", 2.5: "y"})
+        
+        assert codec.decode(codec.encode(response)).result == {1: "x", 2.5: "y"}
+    
+    def test_codec_base_is_abstract(self):
+        """Test that a codec must implement encode and loads"""
+        from ..mcp.codec import MCPCodec
+        
+        class Partial(MCPCodec):
+            def encode(self, message):
+                return message.model_dump_json()
+        
+        with pytest.raises(TypeError):
+            MCPCodec()
+        with pytest.raises(TypeError):
+            Partial()
+    
+    def test_http_encoding_negotiation(self):
+        """Test that HTTP responses follow the Accept header"""
+        pytest.importorskip("msgpack")
+        from fastapi.testclient import TestClient
+        
+        server = MCPServer(host="localhost", port=8001)
+        server.register_tool("test_tool", lambda message: f"Processed: {message}")
+        request = MCPToolInvocationRequest(
+            request_id="test-123",
+            agent_id="test_agent",
+            tool_name="test_tool",
+            arguments={"message": "compact"}
+        )
+        msgpack_codec = get_codec("msgpack")
+        
+        with TestClient(server.app) as test_client:
+            http_response = test_client.post(
+                "/invoke_tool",
+                content=msgpack_codec.encode(request),
+                headers={"Content-Type": "application/msgpack", "Accept": "application/msgpack"}
+            )
+            assert http_response.headers["content-type"] == "application/msgpack"
+            response = msgpack_codec.decode(http_response.content)
+            assert response.result == "Processed: compact"
+            
+            # Plain JSON clients are unaffected
+            http_response = test_client.post("/invoke_tool", content=request.model_dump_json())
+            assert http_response.json()["result"] == "Processed: compact"
+
 class TestMCPServer:
     """Test MCP server functionality"""
     
@@ -117,6 +240,841 @@ class TestMCPServer:
         assert "key1" in mcp_server.context_store["session"]
         assert mcp_server.context_store["session"]["key1"] == "value1"
 
+    def test_websocket_multiplexing(self):
+        """Test that a slow tool call does not block later messages on the same socket"""
+        from fastapi.testclient import TestClient
+        
+        server = MCPServer(host="localhost", port=8001)
+        
+        async def slow_tool() -> str:
+            await asyncio.sleep(0.5)
+            return "slow"
+        
+        server.register_tool("slow_tool", slow_tool)
+        server.register_tool("fast_tool", lambda: "fast")
+        
+        with TestClient(server.app) as test_client:
+            with test_client.websocket_connect("/ws/test_agent") as websocket:
+                for request_id, tool_name in (("req-slow", "slow_tool"), ("req-fast", "fast_tool")):
+                    websocket.send_text(MCPToolInvocationRequest(
+                        request_id=request_id,
+                        agent_id="test_agent",
+                        tool_name=tool_name
+                    ).json())
+                
+                first = websocket.receive_json()
+                second = websocket.receive_json()
+        
+        assert first["request_id"] == "req-fast"
+        assert second["request_id"] == "req-slow"
+        assert second["result"] == "slow"
+
+    def test_agents_ranked_by_heartbeat_load(self):
+        """Test that /agents orders agents by the load their heartbeats report"""
+        from fastapi.testclient import TestClient
+        import time
+        
+        server = MCPServer(host="localhost", port=8001)
+        with TestClient(server.app) as test_client:
+            with test_client.websocket_connect("/ws/busy_agent") as busy, \
+                    test_client.websocket_connect("/ws/idle_agent") as idle:
+                busy.send_text(MCPHeartbeatMessage(
+                    agent_id="busy_agent", status="busy",
+                    load_metrics={"in_flight": 6, "queue_depth": 4, "cpu_percent": 90}
+                ).model_dump_json())
+                idle.send_text(MCPHeartbeatMessage(
+                    agent_id="idle_agent", status="idle",
+                    load_metrics={"in_flight": 0, "queue_depth": 0, "cpu_percent": 5}
+                ).model_dump_json())
+                
+                deadline = time.monotonic() + 2
+                while time.monotonic() < deadline:
+                    agents = test_client.get("/agents").json()
+                    if all(agent["load_metrics"] for agent in agents) and len(agents) == 2:
+                        break
+                    time.sleep(0.02)
+                
+                assert [agent["agent_id"] for agent in agents] == ["idle_agent", "busy_agent"]
+                assert agents[0]["load_score"] == pytest.approx(0.05)
+                assert test_client.get("/agents", params={"limit": 1}).json()[0]["agent_id"] == "idle_agent"
+                assert server.least_loaded_agent(exclude_agents={"idle_agent"}) is None
+    
+    def test_silent_agents_are_reaped(self):
+        """Test that an agent missing its heartbeats is disconnected and forgotten"""
+        from fastapi.testclient import TestClient
+        from ..mcp.server import AGENT_TIMEOUT_CLOSE_CODE
+        
+        server = MCPServer(host="localhost", port=8001, agent_timeout=0.3)
+        with TestClient(server.app) as test_client:
+            with test_client.websocket_connect("/ws/silent_agent") as websocket:
+                assert "silent_agent" in server.agent_registry
+                frame = websocket.receive()
+        
+        assert frame["type"] == "websocket.close"
+        assert frame["code"] == AGENT_TIMEOUT_CLOSE_CODE
+        assert "silent_agent" not in server.agent_registry
+
+    def test_http_compression_negotiation(self):
+        """Test that large HTTP bodies are compressed both ways per the client's headers"""
+        import gzip
+        from fastapi.testclient import TestClient
+        
+        server = MCPServer(host="localhost", port=8001, http_compression=["gzip"])
+        server.register_tool("read_text", lambda size: "line of text\n" * size)
+        
+        def invoke(size: int) -> bytes:
+            return MCPToolInvocationRequest(
+                request_id=f"read-{size}", agent_id="test_agent", tool_name="read_text", arguments={"size": size}
+            ).model_dump_json().encode()
+        
+        with TestClient(server.app) as test_client:
+            large = test_client.post("/invoke_tool", content=invoke(1000), headers={"Accept-Encoding": "gzip"})
+            small = test_client.post("/invoke_tool", content=invoke(1), headers={"Accept-Encoding": "gzip"})
+            refused = test_client.post("/invoke_tool", content=invoke(1000), headers={"Accept-Encoding": "identity"})
+            compressed_request = test_client.post(
+                "/invoke_tool", content=gzip.compress(invoke(2)),
+                headers={"Content-Encoding": "gzip", "Accept-Encoding": "identity"}
+            )
+            unsupported = test_client.post("/invoke_tool", content=invoke(2), headers={"Content-Encoding": "br"})
+        
+        assert large.headers["content-encoding"] == "gzip"
+        assert large.headers["accept-encoding"] == "gzip"
+        assert large.json()["result"] == "line of text\n" * 1000
+        assert "content-encoding" not in small.headers
+        assert "content-encoding" not in refused.headers
+        assert compressed_request.json()["result"] == "line of text\n" * 2
+        assert unsupported.status_code == 415
+    
+    def test_batch_invocation_over_http(self):
+        """Test that the HTTP batch endpoint returns every response in request order"""
+        from fastapi.testclient import TestClient
+        from ..mcp import MCPToolBatchRequest, MCPToolBatchResponse
+        
+        server = MCPServer(host="localhost", port=8001, max_batch_size=3)
+        server.register_tool("double", lambda value: value * 2)
+        
+        def batch(count: int) -> str:
+            return MCPToolBatchRequest(
+                request_id=f"batch-{count}",
+                agent_id="test_agent",
+                invocations=[
+                    MCPToolInvocationRequest(
+                        request_id=f"item-{index}", agent_id="test_agent",
+                        tool_name="double", arguments={"value": index}
+                    )
+                    for index in range(count)
+                ]
+            ).model_dump_json()
+        
+        with TestClient(server.app) as test_client:
+            response = validate_mcp_message(test_client.post("/invoke_tools_batch", content=batch(3)).json())
+            oversized = test_client.post("/invoke_tools_batch", content=batch(4))
+        
+        assert isinstance(response, MCPToolBatchResponse)
+        assert response.success is True and response.succeeded == 3
+        assert [item.result for item in response.responses] == [0, 2, 4]
+        assert [item.request_id for item in response.responses] == ["item-0", "item-1", "item-2"]
+        assert oversized.status_code == 500
+
+def _square(value: int) -> int:
+    """CPU-bound test tool; module level so it can be pickled"""
+    return value * value
+
+def _worker_pid(delay: float = 0.0) -> int:
+    """CPU-bound test tool reporting which worker process ran it"""
+    import os
+    import time
+    time.sleep(delay)
+    return os.getpid()
+
+class TestMCPToolScheduler:
+    """Test priority scheduling and admission control for tool execution"""
+    
+    @pytest.mark.asyncio
+    async def test_scheduler_honors_priority(self):
+        """Test that queued jobs start in priority order"""
+        scheduler = MCPToolScheduler(max_concurrent=1)
+        started = []
+        gate = asyncio.Event()
+        
+        async def blocker():
+            await gate.wait()
+        
+        async def record(label: str):
+            started.append(label)
+        
+        scheduler.configure_tool("blocker", blocker)
+        scheduler.configure_tool("record", record)
+        
+        first = asyncio.create_task(scheduler.submit("blocker", blocker, {}))
+        await asyncio.sleep(0)
+        jobs = [
+            asyncio.create_task(scheduler.submit("record", record, {"label": label}, priority=priority))
+            for label, priority in (("low", 9), ("high", 1), ("normal", 5))
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.get_stats()["queued"] == 3
+        
+        gate.set()
+        await asyncio.gather(first, *jobs)
+        assert started == ["high", "normal", "low"]
+        scheduler.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_scheduler_per_tool_limit_and_admission(self):
+        """Test per-tool concurrency limits and rejection of excess work"""
+        scheduler = MCPToolScheduler(max_concurrent=4, max_queue_size=1, retry_after=2.5)
+        peak = 0
+        
+        async def limited():
+            nonlocal peak
+            peak = max(peak, scheduler.get_stats()["running_per_tool"].get("limited", 0))
+            await asyncio.sleep(0.05)
+        
+        scheduler.configure_tool("limited", limited, max_concurrency=1)
+        
+        running = asyncio.create_task(scheduler.submit("limited", limited, {}))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(scheduler.submit("limited", limited, {}))
+        await asyncio.sleep(0)
+        
+        with pytest.raises(MCPServerBusyError) as excinfo:
+            await scheduler.submit("limited", limited, {})
+        assert excinfo.value.retry_after == 2.5
+        
+        await asyncio.gather(running, queued)
+        assert peak == 1
+        assert scheduler.get_stats()["rejected"] == 1
+        scheduler.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_bad_arguments_release_slot(self):
+        """Test that an async tool rejecting its arguments fails the call and frees its slot"""
+        scheduler = MCPToolScheduler(max_concurrent=2)
+        
+        async def echo(message: str):
+            return message
+        
+        scheduler.configure_tool("echo", echo)
+        for _ in range(2):
+            with pytest.raises(TypeError):
+                await scheduler.submit("echo", echo, {"unexpected": 1})
+        assert scheduler.get_stats()["running"] == 0
+        
+        assert await asyncio.wait_for(scheduler.submit("echo", echo, {"message": "hi"}), timeout=1) == "hi"
+        scheduler.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_scheduler_runs_cpu_tools_in_process_pool(self):
+        """Test that CPU-bound tools execute in worker processes"""
+        scheduler = MCPToolScheduler(cpu_workers=1)
+        scheduler.configure_tool("square", _square, kind="cpu")
+        assert scheduler.tool_configs["square"].kind == "cpu"
+        
+        assert await scheduler.submit("square", _square, {"value": 7}) == 49
+        scheduler.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_cpu_tools_leave_default_executor_free(self):
+        """Test that waiting on a CPU job holds no thread of the loop's default executor"""
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=1))
+        release = threading.Event()
+        blocked = loop.run_in_executor(None, release.wait, 30)
+
+        scheduler = MCPToolScheduler(cpu_workers=1)
+        scheduler.configure_tool("square", _square, kind="cpu")
+        try:
+            assert await asyncio.wait_for(scheduler.submit("square", _square, {"value": 3}), timeout=10) == 9
+        finally:
+            release.set()
+            await blocked
+            scheduler.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_timed_out_cpu_tool_kills_worker(self):
+        """Test that a timed-out process-pool job terminates its worker"""
+        scheduler = MCPToolScheduler(cpu_workers=1)
+        scheduler.configure_tool("pid", _worker_pid, kind="cpu")
+        
+        first_pid = await scheduler.submit("pid", _worker_pid, {})
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.submit("pid", _worker_pid, {"delay": 30}), timeout=0.5)
+        await asyncio.sleep(0.1)
+        
+        assert scheduler.get_stats()["running"] == 0
+        assert await scheduler.submit("pid", _worker_pid, {}) != first_pid
+        scheduler.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_timed_out_io_tool_receives_cancellation(self):
+        """Test that thread-pool tools declaring cancel_token are told to stop"""
+        import threading
+        scheduler = MCPToolScheduler()
+        stopped = threading.Event()
+        
+        def cooperative(cancel_token=None):
+            if cancel_token.wait(timeout=30):
+                stopped.set()
+        
+        scheduler.configure_tool("cooperative", cooperative)
+        assert scheduler.tool_configs["cooperative"].accepts_cancel_token
+        
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.submit("cooperative", cooperative, {}), timeout=0.1)
+        
+        assert await asyncio.get_running_loop().run_in_executor(None, stopped.wait, 5)
+        scheduler.shutdown()
+    
+    def test_cancel_token_kills_process_group(self):
+        """Test that cancelling a shell command kills the whole process group"""
+        import threading
+        import time
+        from ..utils.cancellation import CancellationToken, ToolCancelledError, run_cancellable
+        
+        token = CancellationToken()
+        threading.Timer(0.2, token.cancel).start()
+        started = time.monotonic()
+        with pytest.raises(ToolCancelledError):
+            run_cancellable("sleep 30 & sleep 30", token, timeout=60, shell=True, text=True)
+        assert time.monotonic() - started < 5
+    
+    @pytest.mark.asyncio
+    async def test_server_reports_busy_over_http(self):
+        """Test that a full queue surfaces as 503 with Retry-After"""
+        import httpx
+        
+        server = MCPServer(host="localhost", port=8001, max_concurrent_requests=1, max_queued_requests=0)
+        gate = asyncio.Event()
+        
+        async def blocker():
+            await gate.wait()
+            return "done"
+        
+        server.register_tool("blocker", blocker)
+        
+        def request_body(request_id: str) -> str:
+            return MCPToolInvocationRequest(
+                request_id=request_id, agent_id="test_agent", tool_name="blocker"
+            ).model_dump_json()
+        
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://mcp") as http_client:
+            first = asyncio.create_task(http_client.post("/invoke_tool", content=request_body("first")))
+            await asyncio.sleep(0.1)
+            
+            rejected = await http_client.post("/invoke_tool", content=request_body("second"))
+            gate.set()
+            accepted = await first
+        
+        assert rejected.status_code == 503
+        assert rejected.headers["retry-after"] == "1"
+        assert rejected.json()["error_code"] == "SERVER_BUSY"
+        assert accepted.json()["result"] == "done"
+        server.scheduler.shutdown()
+
+class TestMCPResultCache:
+    """Test result caching and request coalescing for idempotent tools"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_calls_share_one_execution(self):
+        """Test that identical in-flight calls are coalesced"""
+        cache = MCPResultCache()
+        cache.configure_tool("read", idempotent=True)
+        calls = 0
+        
+        async def run():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "contents"
+        
+        results = await asyncio.gather(*(cache.get_or_run("read", {"path": "a"}, run) for _ in range(5)))
+        assert results == ["contents"] * 5
+        assert calls == 1
+        assert cache.get_stats()["coalesced"] == 4
+        
+        assert await cache.get_or_run("read", {"path": "a"}, run) == "contents"
+        assert calls == 1
+    
+    @pytest.mark.asyncio
+    async def test_ttl_expiry_and_failures_not_cached(self):
+        """Test that entries expire and errors are never cached"""
+        now = [0.0]
+        cache = MCPResultCache(clock=lambda: now[0])
+        cache.configure_tool("read", idempotent=True, ttl=10)
+        calls = 0
+        
+        async def run():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise RuntimeError("transient")
+            return calls
+        
+        with pytest.raises(RuntimeError):
+            await cache.get_or_run("read", {}, run)
+        assert await cache.get_or_run("read", {}, run) == 2
+        assert await cache.get_or_run("read", {}, run) == 2
+        
+        now[0] = 11
+        assert await cache.get_or_run("read", {}, run) == 3
+    
+    @pytest.mark.asyncio
+    async def test_write_tool_invalidates_dependent_results(self):
+        """Test dependency-based invalidation through the server"""
+        server = MCPServer(host="localhost", port=8001)
+        files = {"/data/notes.txt": "v1"}
+        
+        def read_file(file_path: str) -> str:
+            return files[file_path]
+        
+        def list_dir(directory_path: str) -> list:
+            return sorted(files)
+        
+        def write_file(file_path: str, content: str) -> str:
+            files[file_path] = content
+            return "ok"
+        
+        server.register_tool("read_file", read_file, idempotent=True,
+                             depends_on=lambda args: [args["file_path"]])
+        server.register_tool("list_dir", list_dir, idempotent=True,
+                             depends_on=lambda args: [args["directory_path"]])
+        server.register_tool("write_file", write_file, invalidates=lambda args: [args["file_path"]])
+        
+        async def invoke(tool_name: str, **arguments):
+            response = await server._handle_tool_invocation(MCPToolInvocationRequest(
+                request_id="req", agent_id="test_agent", tool_name=tool_name, arguments=arguments
+            ))
+            return response.result
+        
+        assert await invoke("read_file", file_path="/data/notes.txt") == "v1"
+        assert await invoke("list_dir", directory_path="/data") == ["/data/notes.txt"]
+        files["/data/notes.txt"] = "changed behind the cache"
+        assert await invoke("read_file", file_path="/data/notes.txt") == "v1"
+        
+        # A new file changes the listing but not unrelated cached reads
+        await invoke("write_file", file_path="/data/other.txt", content="new")
+        assert await invoke("list_dir", directory_path="/data") == ["/data/notes.txt", "/data/other.txt"]
+        assert await invoke("read_file", file_path="/data/notes.txt") == "v1"
+        
+        await invoke("write_file", file_path="/data/notes.txt", content="v2")
+        assert await invoke("read_file", file_path="/data/notes.txt") == "v2"
+        server.scheduler.shutdown()
+
+class TestMCPContextStore:
+    """Test the bounded, sharded context store"""
+    
+    @pytest.mark.asyncio
+    async def test_agent_namespaces_and_bounded_append(self):
+        """Test agent isolation and that append keeps only the newest items"""
+        store = InMemoryContextStore(num_shards=4, limits={"session": ScopeLimits(max_list_length=3)})
+        
+        await store.apply_updates("agent", "agent_a", {"notes": "a"})
+        await store.apply_updates("agent", "agent_b", {"notes": "b"})
+        assert await store.get_many("agent", "agent_a", ["notes"]) == {"notes": "a"}
+        assert store["agent"] == {"agent_a.notes": "a", "agent_b.notes": "b"}
+        
+        for batch in ([1, 2], [3, 4], [5]):
+            await store.apply_updates("session", "", {"history": batch}, merge_strategy="append")
+        assert (await store.get_many("session", "", ["history"]))["history"] == [3, 4, 5]
+    
+    @pytest.mark.asyncio
+    async def test_ttl_lru_and_byte_limits(self):
+        """Test expiry, LRU eviction and oversized value rejection"""
+        now = [0.0]
+        store = InMemoryContextStore(
+            num_shards=1,
+            limits={"global": ScopeLimits(max_keys=2, max_value_bytes=100, ttl=10)},
+            clock=lambda: now[0]
+        )
+        
+        await store.apply_updates("global", "", {"a": 1, "b": 2})
+        await store.get_many("global", "", ["a"])
+        await store.apply_updates("global", "", {"c": 3})
+        assert set(store["global"]) == {"a", "c"}
+        assert store.get_stats()["evictions"] == 1
+        
+        with pytest.raises(ValueError):
+            await store.apply_updates("global", "", {"big": "x" * 200})
+        
+        now[0] = 11
+        assert await store.get_many("global", "", ["a", "c"]) == {}
+        assert store.get_stats()["scopes"]["global"]["keys"] == 0
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("backend", ["memory", "sqlite"])
+    async def test_rejected_batch_and_tombstones(self, backend, tmp_path):
+        """Test that an oversized value rejects its whole batch and deletes leave versioned tombstones"""
+        limits = {"global": ScopeLimits(max_value_bytes=100)}
+        if backend == "memory":
+            store = InMemoryContextStore(num_shards=4, limits=limits)
+        else:
+            store = SQLiteContextStore(str(tmp_path / "context.db"), limits=limits)
+        try:
+            await store.apply_updates("global", "", {"a": 1})
+            with pytest.raises(ValueError):
+                await store.apply_updates("global", "", {"a": 2, "b": 3, "big": "x" * 200})
+            assert store.snapshot("global") == {"a": 1}
+            
+            since = await store.get_version()
+            assert await store.delete("global", "", ["a", "missing"]) == 1
+            assert await store.changed_since("global", "", since) == {"a": (await store.get_version(), DELETED)}
+            # Writing the key again replaces its tombstone
+            await store.apply_updates("global", "", {"a": 4})
+            assert await store.changed_since("global", "", since) == {"a": (await store.get_version(), 4)}
+        finally:
+            await store.close()
+    
+    @pytest.mark.asyncio
+    async def test_server_uses_context_store(self):
+        """Test state updates and fetches through the server handlers"""
+        server = MCPServer(host="localhost", port=8001)
+        
+        update = await server._handle_state_update(MCPStateUpdateRequest(
+            request_id="u1", agent_id="agent_a", scope="agent",
+            state_updates={"plan": {"step": 1}}
+        ))
+        await server._handle_state_update(MCPStateUpdateRequest(
+            request_id="u2", agent_id="agent_a", scope="agent",
+            state_updates={"plan": {"done": False}}
+        ))
+        fetch = await server._handle_context_fetch(MCPContextFetchRequest(
+            request_id="f1", agent_id="agent_a", scope="agent", context_keys=["plan", "missing"]
+        ))
+        
+        assert update.updated_keys == ["plan"]
+        assert fetch.context_data == {"plan": {"step": 1, "done": False}}
+        assert fetch.missing_keys == ["missing"]
+        server.scheduler.shutdown()
+
+class TestMCPStatePersistence:
+    """Test WAL and snapshot recovery of shared context"""
+    
+    @pytest.mark.asyncio
+    async def test_recovery_replays_wal_after_snapshot(self, tmp_path):
+        """Test that state survives a restart through snapshot plus WAL tail"""
+        store = InMemoryContextStore()
+        persistence = StatePersistence(str(tmp_path), snapshot_every=3)
+        await persistence.recover(store)
+        persistence.start()
+        
+        for batch in ([1], [2], [3], [4]):
+            await store.apply_updates("session", "", {"log": batch}, "append")
+            await persistence.record("session", "", {"log": batch}, "append")
+        await persistence.flush()
+        await persistence.snapshot()
+        await store.apply_updates("global", "", {"mode": "fast"}, "replace")
+        await persistence.record("global", "", {"mode": "fast"}, "replace")
+        await persistence.flush()
+        # Simulate a crash: no close(), so the last update exists only in the WAL
+        persistence._flusher.cancel()
+        
+        recovered = InMemoryContextStore()
+        replayed = await StatePersistence(str(tmp_path)).recover(recovered)
+        assert replayed == 1
+        assert recovered["session"] == {"log": [1, 2, 3, 4]}
+        assert recovered["global"] == {"mode": "fast"}
+    
+    @pytest.mark.asyncio
+    async def test_server_persists_state_updates(self, tmp_path):
+        """Test that updates through the server survive a restart"""
+        from fastapi.testclient import TestClient
+        
+        server = MCPServer(host="localhost", port=8001,
+                           persistence=StatePersistence(str(tmp_path), sync_mode="always"))
+        with TestClient(server.app) as client:
+            client.post("/update_state", json=MCPStateUpdateRequest(
+                request_id="u1", agent_id="agent_a", state_updates={"goal": "ship"}
+            ).model_dump(mode="json"))
+        
+        restarted = MCPServer(host="localhost", port=8001, persistence=StatePersistence(str(tmp_path)))
+        with TestClient(restarted.app):
+            assert restarted.context_store["session"] == {"goal": "ship"}
+
+    @pytest.mark.asyncio
+    async def test_concurrent_updates_logged_in_applied_order(self, tmp_path):
+        """Test that concurrent appends to one scope replay in the order they were applied"""
+        
+        class SlowFirstStore(InMemoryContextStore):
+            """Yields inside the first write, so a second update could overtake its WAL record"""
+            async def apply_updates(self, *args, **kwargs):
+                updated = await super().apply_updates(*args, **kwargs)
+                if self["session"].get("log") == [1]:
+                    await asyncio.sleep(0.05)
+                return updated
+        
+        store = SlowFirstStore()
+        persistence = StatePersistence(str(tmp_path))
+        server = MCPServer(host="localhost", port=8001, context_store=store, persistence=persistence)
+        await persistence.recover(store)
+        persistence.start()
+        
+        await asyncio.gather(*(
+            server._handle_state_update(MCPStateUpdateRequest(
+                request_id=f"u{item}", agent_id="agent_a", state_updates={"log": [item]}, merge_strategy="append"
+            ))
+            for item in (1, 2)
+        ))
+        await persistence.flush()
+        # Crash before close() writes a snapshot, so recovery replays the WAL
+        persistence._flusher.cancel()
+        
+        recovered = InMemoryContextStore()
+        await StatePersistence(str(tmp_path)).recover(recovered)
+        assert recovered["session"] == store["session"] == {"log": [1, 2]}
+        server.scheduler.shutdown()
+
+def _free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class TestMCPOutboundQueue:
+    """Test per-connection outbound queues and slow-consumer handling"""
+    
+    @staticmethod
+    def _blocked_connection():
+        """Frame sender that stalls until released, recording what it sent"""
+        sent, closed, release = [], [], asyncio.Event()
+        
+        async def send_frame(frame):
+            await release.wait()
+            sent.append(frame)
+        
+        async def close_connection(code, reason):
+            closed.append(code)
+        
+        return sent, closed, release, send_frame, close_connection
+    
+    @pytest.mark.asyncio
+    async def test_drop_oldest_keeps_responses(self):
+        """Test that a full queue sheds old broadcasts but never responses"""
+        sent, _, release, send_frame, close_connection = self._blocked_connection()
+        queue = OutboundQueue(send_frame, close_connection, max_size=3, policy="drop_oldest")
+        queue.start()
+        
+        assert queue.offer("b1") is True
+        await asyncio.sleep(0)  # The writer takes b1 and blocks on it
+        response = asyncio.create_task(queue.send("response"))
+        await asyncio.sleep(0)
+        for frame in ("b2", "b3", "b4"):
+            assert queue.offer(frame) is True
+        
+        release.set()
+        await response
+        await asyncio.sleep(0.01)
+        assert sent == ["b1", "response", "b3", "b4"]
+        assert queue.get_stats()["dropped"] == 1
+        await queue.close()
+    
+    @pytest.mark.asyncio
+    async def test_disconnect_policy_closes_slow_consumer(self):
+        """Test that the disconnect policy closes the connection and fails queued sends"""
+        _, closed, _, send_frame, close_connection = self._blocked_connection()
+        queue = OutboundQueue(send_frame, close_connection, max_size=1, policy="disconnect")
+        queue.start()
+        
+        queue.offer("first")
+        await asyncio.sleep(0)
+        pending = asyncio.create_task(queue.send("queued"))
+        await asyncio.sleep(0)
+        assert queue.offer("overflow") is False
+        await asyncio.sleep(0.01)
+        
+        assert closed == [SLOW_CONSUMER_CLOSE_CODE]
+        assert queue.closed
+        with pytest.raises(ConnectionClosedError):
+            await pending
+    
+    @pytest.mark.asyncio
+    async def test_broadcast_not_stalled_by_slow_agent(self):
+        """Test that broadcast encodes once and returns while one client is stuck"""
+        server = MCPServer(host="localhost", port=8001, max_outbound_queue=2)
+        codec = get_codec("json")
+        _, _, release, slow_send, close_connection = self._blocked_connection()
+        fast_frames = []
+        
+        async def fast_send(frame):
+            fast_frames.append(frame)
+        
+        for agent_id, send_frame in (("slow", slow_send), ("fast", fast_send)):
+            queue = OutboundQueue(send_frame, close_connection, max_size=2, name=agent_id)
+            queue.start()
+            server.outbound_queues[agent_id] = queue
+            server.connection_codecs[agent_id] = codec
+        
+        with patch.object(codec, "encode", wraps=codec.encode) as encode:
+            for index in range(5):
+                message = MCPStateUpdateResponse(request_id=f"broadcast-{index}", success=True)
+                await asyncio.wait_for(server.broadcast_message(message), timeout=1)
+            assert encode.call_count == 5
+        await asyncio.sleep(0.01)
+        
+        assert len(fast_frames) == 5
+        assert server.outbound_queues["slow"].get_stats()["dropped"] > 0
+        release.set()
+        await server._cleanup_connections()
+
+class TestMCPScaleOut:
+    """Test shared SQLite state and cross-worker delivery"""
+    
+    @pytest.mark.asyncio
+    async def test_sqlite_store_is_shared_and_bounded(self, tmp_path):
+        """Test that two store instances on one file see each other's versioned writes"""
+        path = str(tmp_path / "state.sqlite3")
+        first = SQLiteContextStore(path, limits={"global": ScopeLimits(max_keys=2)})
+        second = SQLiteContextStore(path, limits={"global": ScopeLimits(max_keys=2)})
+        try:
+            await first.apply_updates("global", "", {"log": [1]}, "append")
+            await second.apply_updates("global", "", {"log": [2]}, "append")
+            versioned = await first.get_versioned("global", "", ["log"])
+            assert versioned["log"] == (2, [1, 2])
+            assert await first.get_version() == await second.get_version() == 2
+            
+            await second.apply_updates("global", "", {"a": 1, "b": 2})
+            assert set(first["global"]) == {"a", "b"}
+            assert await first.changed_since("global", "", 2, ["b"]) == {"b": (4, 2)}
+        finally:
+            await first.close()
+            await second.close()
+    
+    @pytest.mark.asyncio
+    async def test_idempotency_shared_across_workers(self, tmp_path):
+        """Test that a retry reaching another worker waits for and replays the original response"""
+        path = str(tmp_path / "state.sqlite3")
+        first, second = (SQLiteIdempotencyCache(path, poll_interval=0.01) for _ in range(2))
+        calls = []
+        
+        async def update():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return MCPStateUpdateResponse(request_id="u1", success=True, updated_keys=["plan"])
+        
+        async def fail():
+            raise RuntimeError("store unavailable")
+        
+        try:
+            original = asyncio.create_task(first.run("update_state:key-1", update))
+            await asyncio.sleep(0.02)
+            retried = await second.run("update_state:key-1", update)
+            assert retried == await original
+            assert len(calls) == 1
+            assert (await second.run("update_state:key-1", update)).updated_keys == ["plan"]
+            assert second.get_stats()["joined"] == 1 and second.get_stats()["replayed"] == 1
+            
+            # A failed execution releases its claim so a retry elsewhere runs again
+            with pytest.raises(RuntimeError):
+                await first.run("update_state:key-2", fail)
+            assert (await second.run("update_state:key-2", update)).success is True
+            assert len(calls) == 2
+        finally:
+            await first.close()
+            await second.close()
+    
+    @pytest.mark.asyncio
+    async def test_idempotency_claim_of_dead_worker_lapses(self, tmp_path):
+        """Test that a running request keeps its claim but a dead worker's claim expires quickly"""
+        path = str(tmp_path / "state.sqlite3")
+        first, second = (SQLiteIdempotencyCache(path, claim_timeout=0.1, poll_interval=0.01) for _ in range(2))
+        calls = []
+        
+        async def update():
+            calls.append(1)
+            await asyncio.sleep(0.3)
+            return MCPStateUpdateResponse(request_id="u1", success=True)
+        
+        try:
+            # A request outliving claim_timeout is renewed, not run again
+            original = asyncio.create_task(first.run("update_state:key-1", update))
+            await asyncio.sleep(0.02)
+            assert await second.run("update_state:key-1", update) == await original
+            assert len(calls) == 1
+            
+            # A claim nobody renews, as left by a worker that died, lets a retry run
+            assert first._claim("update_state:key-2") == (True, None)
+            assert (await asyncio.wait_for(second.run("update_state:key-2", update), timeout=2)).success
+            assert len(calls) == 2
+        finally:
+            await first.close()
+            await second.close()
+    
+    @pytest.mark.asyncio
+    async def test_delta_and_broadcast_cross_workers(self, tmp_path):
+        """Test that a subscriber on one worker sees updates and broadcasts made on another"""
+        path = str(tmp_path / "state.sqlite3")
+        servers = [
+            MCPServer(host="127.0.0.1", port=_free_port(), context_store=SQLiteContextStore(path),
+                      event_bus=SQLiteEventBus(path, poll_interval=0.01))
+            for _ in range(2)
+        ]
+        tasks = [asyncio.create_task(server.start()) for server in servers]
+        await asyncio.sleep(0.5)
+        
+        def client_for(server: MCPServer, agent_id: str) -> MCPClient:
+            config = MCPConnectionConfig(server_url=f"http://127.0.0.1:{server.port}", client_id=agent_id, timeout=5)
+            return MCPClient(config, agent_id)
+        
+        watcher = client_for(servers[1], "watcher")
+        writer = client_for(servers[0], "writer")
+        deltas = []
+        try:
+            await watcher.connect(use_websocket=True)
+            await writer.connect(use_websocket=True)
+            await watcher.subscribe_context(["plan."], callback=deltas.append)
+            
+            await writer.update_state({"plan.step": 1, "other": True}, merge_strategy="replace")
+            fetched = await watcher.fetch_context(["plan.step"])
+            assert fetched.context_data == {"plan.step": 1}
+            
+            for _ in range(50):
+                if deltas:
+                    break
+                await asyncio.sleep(0.02)
+            assert [delta.changes for delta in deltas] == [{"plan.step": 1}]
+            assert watcher.context_cache["session"] == {"plan.step": 1}
+        finally:
+            await watcher.disconnect()
+            await writer.disconnect()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def test_workers_share_one_port(self, tmp_path):
+        """Test that several worker processes answer on the same port"""
+        import multiprocessing
+        import os
+        import signal
+        import time
+        import httpx
+        from ..mcp.workers import run_mcp_server_workers
+        
+        port = _free_port()
+        supervisor = multiprocessing.get_context("fork").Process(
+            target=run_mcp_server_workers,
+            kwargs={"host": "127.0.0.1", "port": port, "workers": 2,
+                    "state_path": str(tmp_path / "state.sqlite3")}
+        )
+        supervisor.start()
+        try:
+            server_ids = set()
+            deadline = time.monotonic() + 15
+            while len(server_ids) < 2 and time.monotonic() < deadline:
+                try:
+                    # A fresh connection each time lets the kernel pick a worker
+                    with httpx.Client() as http_client:
+                        server_ids.add(http_client.get(f"http://127.0.0.1:{port}/").json()["server_id"])
+                except httpx.TransportError:
+                    time.sleep(0.1)
+            assert len(server_ids) == 2
+        finally:
+            os.kill(supervisor.pid, signal.SIGTERM)
+            supervisor.join(timeout=15)
+        assert supervisor.exitcode == 0
+
 class TestMCPClient:
     """Test MCP client functionality"""
     
@@ -159,6 +1117,595 @@ class TestMCPClient:
         
         assert response.success is False
         assert "not found" in response.error_message.lower()
+    
+    def test_heartbeat_load_metrics(self):
+        """Test that heartbeats report outstanding work and process load"""
+        config = MCPConnectionConfig(server_url="http://localhost:8001", client_id="test_client")
+        queued = {"queue_depth": 0}
+        client = MCPClient(config, "test_agent", load_provider=lambda: queued, busy_threshold=3)
+        
+        metrics = client.collect_load_metrics()
+        assert metrics["in_flight"] == 0 and metrics["rss_bytes"] > 0 and "cpu_percent" in metrics
+        assert client._load_status(metrics) == "idle"
+        
+        client._response_futures["pending"] = Mock()
+        assert client._load_status(client.collect_load_metrics()) == "active"
+        queued["queue_depth"] = 2
+        assert client._load_status(client.collect_load_metrics()) == "busy"
+
+    def test_load_sampler_without_rss_source(self, monkeypatch):
+        """Test that RSS is left out of load metrics where neither psutil, /proc nor resource exist"""
+        from types import SimpleNamespace
+        from ..mcp import load
+        monkeypatch.setattr(load, "psutil", None)
+        monkeypatch.setattr(load, "resource", None)
+        monkeypatch.setattr(load, "os", SimpleNamespace())
+
+        metrics = load.ProcessLoadSampler().sample()
+        assert load.RSS_BYTES not in metrics and load.CPU_PERCENT in metrics
+
+    @pytest.mark.asyncio
+    async def test_http_retry_is_deduplicated_by_idempotency_key(self):
+        """Test that a retry after a lost response returns the original result"""
+        import httpx
+        
+        server = MCPServer(host="localhost", port=8001)
+        calls = []
+        server.register_tool("count", lambda: calls.append(1) or len(calls))
+        
+        class LossyTransport(httpx.AsyncBaseTransport):
+            """Runs the first request on the server, then drops its response"""
+            def __init__(self, inner):
+                self.inner = inner
+                self.keys = []
+            
+            async def handle_async_request(self, request):
+                self.keys.append(request.headers.get("idempotency-key"))
+                response = await self.inner.handle_async_request(request)
+                if len(self.keys) == 1:
+                    await response.aread()
+                    raise httpx.ReadError("connection reset", request=request)
+                return response
+        
+        transport = LossyTransport(httpx.ASGITransport(app=server.app))
+        config = MCPConnectionConfig(server_url="http://mcp", client_id="test_client", retry_backoff=0.01)
+        client = MCPClient(config, "test_agent")
+        await client.connect(use_websocket=False)
+        client._http2_client = httpx.AsyncClient(transport=transport)
+        try:
+            response = await client.invoke_tool("count", {})
+        finally:
+            await client.disconnect()
+            server.scheduler.shutdown()
+        
+        assert response.success is True and response.result == 1
+        assert len(transport.keys) == 2 and transport.keys[0] == transport.keys[1]
+        assert calls == [1]
+        assert server.idempotency.get_stats()["replayed"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_http_request_bodies_compressed_once_server_accepts(self):
+        """Test that the client compresses large request bodies after the server advertises support"""
+        import httpx
+        
+        server = MCPServer(host="localhost", port=8001, http_compression=["gzip"])
+        server.register_tool("count_chars", lambda text: len(text))
+        
+        class RecordingTransport(httpx.AsyncBaseTransport):
+            def __init__(self, inner):
+                self.inner = inner
+                self.encodings = []
+            
+            async def handle_async_request(self, request):
+                self.encodings.append(request.headers.get("content-encoding"))
+                return await self.inner.handle_async_request(request)
+        
+        transport = RecordingTransport(httpx.ASGITransport(app=server.app))
+        config = MCPConnectionConfig(server_url="http://mcp", client_id="test_client")
+        client = MCPClient(config, "test_agent")
+        await client.connect(use_websocket=False)
+        client._http2_client = httpx.AsyncClient(transport=transport)
+        try:
+            first = await client.invoke_tool("count_chars", {"text": "a" * 5000})
+            second = await client.invoke_tool("count_chars", {"text": "a" * 5000})
+            small = await client.invoke_tool("count_chars", {"text": "a"})
+        finally:
+            await client.disconnect()
+            server.scheduler.shutdown()
+        
+        assert (first.result, second.result, small.result) == (5000, 5000, 1)
+        # Nothing is known about the server before its first response
+        assert transport.encodings == [None, "gzip", None]
+    
+    @pytest.mark.asyncio
+    async def test_http_retries_respect_status_and_budget(self):
+        """Test that client errors are not retried and retries stop when the budget is spent"""
+        import aiohttp
+        from ..mcp.client import RetryBudget
+        
+        config = MCPConnectionConfig(
+            server_url="http://localhost:8001", client_id="test_client", retry_attempts=5, retry_backoff=0.001
+        )
+        client = MCPClient(config, "test_agent")
+        client.session = Mock()
+        
+        client._post = AsyncMock(return_value=(404, "text/plain", b"no such endpoint"))
+        with pytest.raises(MCPRequestError) as excinfo:
+            await client.invoke_tool("test_tool", {})
+        assert excinfo.value.status == 404
+        assert client._post.await_count == 1
+        
+        client._retry_budget = RetryBudget(ratio=0.0, capacity=1)
+        client._post = AsyncMock(side_effect=aiohttp.ServerDisconnectedError())
+        with pytest.raises(aiohttp.ServerDisconnectedError):
+            await client.invoke_tool("test_tool", {})
+        assert client._post.await_count == 2
+
+class TestMCPWebSocketClient:
+    """Test the WebSocket transport of the MCP client"""
+    
+    @pytest.mark.asyncio
+    async def test_websocket_round_trip(self):
+        """Test tool invocation and error responses over a live WebSocket"""
+        import socket
+        
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        
+        server = MCPServer(host="127.0.0.1", port=port)
+        server.register_tool("test_tool", lambda message: f"Processed: {message}")
+        server_task = asyncio.create_task(server.start())
+        await asyncio.sleep(0.5)
+        
+        config = MCPConnectionConfig(server_url=f"http://127.0.0.1:{port}", client_id="ws_client", timeout=5)
+        client = MCPClient(config, "ws_agent")
+        try:
+            await client.connect(use_websocket=True)
+            
+            response = await client.invoke_tool("test_tool", {"message": "over websocket"})
+            assert response.success is True
+            assert response.result == "Processed: over websocket"
+            
+            # A request the server rejects comes back as an error response
+            invalid = MCPToolInvocationRequest.model_construct(
+                request_id="bad-request", agent_id="ws_agent", tool_name="test_tool", priority=99
+            )
+            with pytest.raises(MCPRequestError, match="PROCESSING_ERROR"):
+                await client._send_websocket_request(invalid)
+        finally:
+            await client.disconnect()
+            server_task.cancel()
+            try:
+                await server_task
+            except asyncio.CancelledError:
+                pass
+    
+    @pytest.mark.asyncio
+    async def test_batch_invocation_streams_items(self):
+        """Test that a batch runs concurrently and each item is answered as it completes"""
+        port = _free_port()
+        server = MCPServer(host="127.0.0.1", port=port)
+        
+        async def slow_echo(value: str) -> str:
+            await asyncio.sleep(0.3)
+            return value
+        
+        server.register_tool("slow_echo", slow_echo)
+        server_task = asyncio.create_task(server.start())
+        await asyncio.sleep(0.5)
+        
+        config = MCPConnectionConfig(server_url=f"http://127.0.0.1:{port}", client_id="ws_client", timeout=5)
+        client = MCPClient(config, "batch_agent")
+        try:
+            await client.connect(use_websocket=True)
+            started = asyncio.get_running_loop().time()
+            responses = await client.invoke_tools_batch(
+                [("slow_echo", {"value": str(index)}) for index in range(5)] + [("missing_tool", {})]
+            )
+            elapsed = asyncio.get_running_loop().time() - started
+            
+            assert [response.result for response in responses[:5]] == ["0", "1", "2", "3", "4"]
+            assert responses[5].success is False and "not found" in responses[5].error_message
+            # Five 0.3s calls ran side by side rather than one after another
+            assert elapsed < 1.0
+            assert client._response_futures == {}
+        finally:
+            await client.disconnect()
+            server_task.cancel()
+            try:
+                await server_task
+            except asyncio.CancelledError:
+                pass
+    
+    @pytest.mark.asyncio
+    async def test_large_results_stream_in_chunks(self):
+        """Test that large results arrive as ordered chunks and reassemble on request"""
+        port = _free_port()
+        server = MCPServer(host="127.0.0.1", port=port)
+        server.register_tool("read_text", lambda size: "x" * (size - 1) + "!")
+        server.register_tool("read_rows", lambda rows: [{"row": index} for index in range(rows)])
+        server_task = asyncio.create_task(server.start())
+        await asyncio.sleep(0.5)
+        
+        config = MCPConnectionConfig(server_url=f"http://127.0.0.1:{port}", client_id="ws_client", timeout=5)
+        client = MCPClient(config, "stream_agent")
+        try:
+            await client.connect(use_websocket=True)
+            
+            chunks = [chunk async for chunk in client.stream_tool("read_text", {"size": 10000}, chunk_size=4096)]
+            assert [len(chunk) for chunk in chunks] == [4096, 4096, 1808]
+            assert "".join(chunks).endswith("!")
+            
+            response = await client.invoke_tool("read_rows", {"rows": 500}, chunk_size=1000)
+            assert response.chunks > 1 and response.chunk_encoding == "json"
+            assert response.result == [{"row": index} for index in range(500)]
+            
+            # Results that fit in one chunk come back whole
+            response = await client.invoke_tool("read_text", {"size": 10}, chunk_size=1000)
+            assert response.chunks is None and response.result == "xxxxxxxxx!"
+            
+            with pytest.raises(RuntimeError, match="not found"):
+                async for _ in client.stream_tool("missing_tool", {}):
+                    pass
+            assert client._chunk_queues == {}
+        finally:
+            await client.disconnect()
+            server_task.cancel()
+            try:
+                await server_task
+            except asyncio.CancelledError:
+                pass
+    
+    @pytest.mark.asyncio
+    async def test_unix_socket_listener(self, tmp_path):
+        """Test HTTP and WebSocket clients over the server's Unix domain socket"""
+        import os
+        import stat
+        
+        socket_path = str(tmp_path / "mcp.sock")
+        server = MCPServer(host="127.0.0.1", port=_free_port(), uds=socket_path)
+        server.register_tool("echo", lambda value: value)
+        server_task = asyncio.create_task(server.start())
+        await asyncio.sleep(0.5)
+        
+        config = MCPConnectionConfig(server_url=f"unix://{socket_path}", client_id="uds_client", timeout=5)
+        http_client = MCPClient(config, "uds_http_agent")
+        ws_client = MCPClient(config, "uds_ws_agent")
+        try:
+            # Access is controlled by the socket file's permissions
+            assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o660
+            
+            await http_client.connect(use_websocket=False)
+            await ws_client.connect(use_websocket=True)
+            assert (await http_client.invoke_tool("echo", {"value": "over http"})).result == "over http"
+            assert (await ws_client.invoke_tool("echo", {"value": "over ws"})).result == "over ws"
+            assert [agent.agent_id for agent in await http_client.list_agents()] == ["uds_ws_agent"]
+        finally:
+            await http_client.disconnect()
+            await ws_client.disconnect()
+            server_task.cancel()
+            try:
+                await server_task
+            except asyncio.CancelledError:
+                pass
+        assert not os.path.exists(socket_path)
+    
+    def test_unix_socket_replaces_only_stale_files(self, tmp_path):
+        """Test that a dead server's socket file is reused but a live one is not"""
+        import socket
+        from ..mcp.server import bind_unix_socket
+        
+        socket_path = str(tmp_path / "mcp.sock")
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(socket_path)
+        stale.close()
+        
+        live = bind_unix_socket(socket_path)
+        try:
+            with pytest.raises(OSError, match="Another server"):
+                bind_unix_socket(socket_path)
+        finally:
+            live.close()
+        
+        (tmp_path / "notes.txt").write_text("not a socket")
+        with pytest.raises(OSError, match="not a socket"):
+            bind_unix_socket(str(tmp_path / "notes.txt"))
+    
+    @pytest.mark.asyncio
+    async def test_context_subscription_receives_filtered_deltas(self):
+        """Test versioned diffs and prefix-filtered push over live WebSockets"""
+        import socket
+        
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        
+        server = MCPServer(host="127.0.0.1", port=port)
+        server_task = asyncio.create_task(server.start())
+        await asyncio.sleep(0.5)
+        
+        config = MCPConnectionConfig(server_url=f"http://127.0.0.1:{port}", client_id="ws_client", timeout=5)
+        watcher = MCPClient(config, "watcher")
+        writer = MCPClient(config, "writer")
+        deltas = []
+        try:
+            await watcher.connect(use_websocket=True)
+            await writer.connect(use_websocket=True)
+            
+            await writer.update_state({"context.cwd": "/tmp"}, merge_strategy="replace")
+            subscribed = await watcher.subscribe_context(["context."], callback=deltas.append)
+            assert subscribed.context_data == {"context.cwd": "/tmp"}
+            
+            first = await writer.sync_state({"context.cwd": "/srv", "current_command": "ls"})
+            assert sorted(first.updated_keys) == ["context.cwd", "current_command"]
+            assert await writer.sync_state({"context.cwd": "/srv", "current_command": "ls"}) is None
+            second = await writer.sync_state({"context.cwd": "/srv", "current_command": "pwd"})
+            assert second.updated_keys == ["current_command"]
+            
+            await writer.sync_state({"current_command": "pwd"})
+            await asyncio.sleep(0.2)
+            
+            # Only keys under the watched prefix are pushed, and deletions are mirrored
+            assert [delta.changes for delta in deltas] == [{"context.cwd": "/srv"}, {}]
+            assert deltas[1].deleted_keys == ["context.cwd"]
+            assert watcher.context_cache["session"] == {}
+            
+            stale = await writer.update_state(
+                {"current_command": "whoami"}, merge_strategy="replace", base_version=first.version
+            )
+            assert stale.conflicts == ["current_command"]
+            
+            # sync_state is based on the version of its last push, so a later write by another agent is kept
+            await watcher.update_state({"current_command": "top"}, merge_strategy="replace")
+            conflicted = await writer.sync_state({"current_command": "htop", "notes": "x"})
+            assert conflicted.conflicts == ["current_command"] and conflicted.updated_keys == ["notes"]
+            fetched = await writer.fetch_context(["current_command"])
+            assert fetched.context_data == {"current_command": "top"}
+            resolved = await writer.sync_state({"current_command": "htop", "notes": "x"})
+            assert resolved.conflicts == [] and resolved.updated_keys == ["current_command"]
+        finally:
+            await watcher.disconnect()
+            await writer.disconnect()
+            server_task.cancel()
+            try:
+                await server_task
+            except asyncio.CancelledError:
+                pass
+    
+    @pytest.mark.asyncio
+    async def test_pending_requests_fail_when_connection_drops(self):
+        """Test that in-flight requests fail immediately on disconnect"""
+        import websockets
+        
+        class DroppingWebSocket:
+            def __aiter__(self):
+                return self
+            
+            async def __anext__(self):
+                await asyncio.sleep(0.05)
+                raise websockets.exceptions.ConnectionClosedError(None, None)
+        
+        config = MCPConnectionConfig(server_url="http://localhost:8001", client_id="test_client")
+        client = MCPClient(config, "test_agent")
+        client.websocket = DroppingWebSocket()
+        client.is_connected = True
+        
+        future = asyncio.get_running_loop().create_future()
+        client._response_futures["pending"] = future
+        
+        await client._websocket_message_handler()
+        
+        assert client.is_connected is False
+        with pytest.raises(ConnectionError):
+            future.result()
+
+class TestMCPLocalTransport:
+    """Test cases for the in-process transport"""
+    
+    @pytest.mark.asyncio
+    async def test_local_client_matches_websocket_semantics(self):
+        """Test tools, errors, batches, streams and context pushes without a socket"""
+        server = MCPServer(host="localhost", port=8001)
+        server.register_tool("echo", lambda value: value)
+        server.register_tool("read_text", lambda size: "x" * size)
+        await server.startup()
+        
+        config = MCPConnectionConfig(server_url=server.local_url, client_id="local_client", timeout=5)
+        watcher = MCPClient(config, "watcher")
+        writer = MCPClient(config, "writer")
+        deltas = []
+        try:
+            await watcher.connect()
+            await writer.connect()
+            assert set(server.agent_registry) == {"watcher", "writer"}
+            
+            response = await writer.invoke_tool("echo", {"value": ("a", 1)})
+            # Validated like a wire frame: the tuple comes back as a JSON list
+            assert response.success is True and response.result == ["a", 1]
+            
+            invalid = MCPToolInvocationRequest.model_construct(
+                request_id="bad-request", agent_id="writer", tool_name="echo", priority=99
+            )
+            with pytest.raises(MCPRequestError, match="PROCESSING_ERROR"):
+                await writer._send_websocket_request(invalid)
+            
+            batch = await writer.invoke_tools_batch([("echo", {"value": 1}), ("missing_tool", {})])
+            assert [item.success for item in batch] == [True, False]
+            
+            chunks = [chunk async for chunk in writer.stream_tool("read_text", {"size": 2500}, chunk_size=1000)]
+            assert [len(chunk) for chunk in chunks] == [1000, 1000, 500]
+            
+            await watcher.subscribe_context(["context."], callback=deltas.append)
+            await writer.update_state({"context.cwd": "/srv"}, merge_strategy="replace")
+            await asyncio.sleep(0.05)
+            assert [delta.changes for delta in deltas] == [{"context.cwd": "/srv"}]
+            assert watcher.context_cache["session"] == {"context.cwd": "/srv"}
+        finally:
+            await watcher.disconnect()
+            await writer.disconnect()
+            await server.shutdown()
+        assert server.agent_registry == {}
+    
+    @pytest.mark.asyncio
+    async def test_local_transport_selection(self):
+        """Test that the listening URL is used in-process only when the server is hosted here"""
+        server = MCPServer(host="localhost", port=8001)
+        payload = [1, 2, 3]
+        server.register_tool("payload", lambda: payload)
+        await server.startup(url="http://localhost:8001")
+        try:
+            # Loopback aliases name the same server; validation can be skipped
+            config = MCPConnectionConfig(
+                server_url="http://127.0.0.1:8001", client_id="local_client", local_validation=False
+            )
+            client = MCPClient(config, "trusted_agent")
+            await client.connect(use_websocket=False)
+            try:
+                response = await client.invoke_tool("payload", {})
+                assert response.result is payload
+                assert client.session is None
+            finally:
+                await client.disconnect()
+            
+            network = MCPClient(config.model_copy(update={"transport": "network"}), "network_agent")
+            assert network._find_local_server() is None
+        finally:
+            await server.shutdown()
+        
+        missing = MCPClient(MCPConnectionConfig(server_url="local://nowhere", client_id="c"), "agent")
+        with pytest.raises(ConnectionError):
+            await missing.connect()
+        
+        # Once shut down, the URL is no longer served in-process
+        client = MCPClient(MCPConnectionConfig(server_url="http://localhost:8001", client_id="c"), "agent")
+        assert client._find_local_server() is None
+    
+    def test_local_sync_calls(self):
+        """Test that synchronous tool and delegation calls reach an in-process server"""
+        from ..mcp.sync_bridge import EventLoopThread
+        from ..tools.delegate_tool import MCPDelegateTool
+        
+        server = MCPServer(host="localhost", port=8001)
+        server.register_tool("echo", lambda value: value)
+        server.register_tool("file_navigator_agent", lambda task: f"listed: {task}")
+        # Synchronous callers block their thread, so server and client run on a loop of their own
+        server_thread = EventLoopThread("local-server")
+        config = MCPConnectionConfig(server_url="http://localhost:8001", client_id="sync_client", timeout=5)
+        client = MCPClient(config, "sync_agent")
+        server_thread.run(server.startup(url="http://localhost:8001"))
+        try:
+            server_thread.run(client.connect(use_websocket=False))
+            wrapper = MCPToolWrapper("echo", client)
+            assert wrapper._run(value="from sync code") == "from sync code"
+            
+            delegate_tool = MCPDelegateTool(agents_dict={}, mcp_client=client)
+            result = delegate_tool._run(task="list files", coworker="FileNavigator")
+            assert result == "FileNavigator completed the task: listed: list files"
+            
+            # Blocking the loop the server answers on would deadlock
+            async def call_from_server_loop():
+                return wrapper._run(value=1)
+            with pytest.raises(RuntimeError, match="await the coroutine"):
+                server_thread.run(call_from_server_loop())
+        finally:
+            server_thread.run(client.disconnect())
+            server_thread.run(server.shutdown())
+            server_thread.stop()
+
+class TestMCPClientPool:
+    """Test load-aware routing and health tracking in the client pool"""
+    
+    @staticmethod
+    def _make_pool(client_count: int, **kwargs) -> MCPClientPool:
+        configs = [
+            MCPConnectionConfig(server_url=f"http://localhost:90{i:02d}", client_id=f"client-{i}")
+            for i in range(client_count)
+        ]
+        return MCPClientPool(configs, **kwargs)
+    
+    @pytest.mark.asyncio
+    async def test_pool_routes_to_least_loaded_client(self):
+        """Test that busy or slow clients are avoided"""
+        pool = self._make_pool(3)
+        with patch('codex_simulator.mcp.client.MCPClient.connect', new=AsyncMock()):
+            await pool.initialize()
+        
+        pool.stats[0].in_flight = 4
+        pool.stats[1].ewma_latency = 2.0
+        pool.stats[2].ewma_latency = 0.1
+        
+        assert pool.get_client() is pool.clients[2]
+        
+        # Equal load falls back to round-robin
+        for stats in pool.stats:
+            stats.in_flight = 0
+            stats.ewma_latency = 0.1
+        selected = {pool.get_client().agent_id for _ in range(3)}
+        assert len(selected) == 3
+    
+    @pytest.mark.asyncio
+    async def test_pool_ejects_and_reconnects_failing_client(self):
+        """Test that a client is ejected after consecutive failures and rejoins"""
+        pool = self._make_pool(2, max_consecutive_failures=2, reconnect_interval=0.01)
+        with patch('codex_simulator.mcp.client.MCPClient.connect', new=AsyncMock()):
+            await pool.initialize()
+            
+            pool.stats[1].in_flight = 5  # Force routing to client 0
+            for _ in range(2):
+                with pytest.raises(ConnectionError):
+                    async with pool.get_client_context() as client:
+                        assert client is pool.clients[0]
+                        raise ConnectionError("server down")
+            
+            assert pool.stats[0].healthy is False
+            assert pool.get_client() is pool.clients[1]
+            
+            await asyncio.sleep(0.1)
+        
+        assert pool.stats[0].healthy is True
+        assert pool.stats[0].consecutive_failures == 0
+        await pool.cleanup()
+    
+    @pytest.mark.asyncio
+    async def test_pool_statistics(self):
+        """Test in-flight, latency and failure accounting"""
+        pool = self._make_pool(1)
+        with patch('codex_simulator.mcp.client.MCPClient.connect', new=AsyncMock()):
+            await pool.initialize()
+        
+        async with pool.get_client_context():
+            assert pool.get_stats()["in_flight"] == 1
+        
+        stats = pool.get_stats()
+        assert stats["in_flight"] == 0
+        assert stats["total_requests"] == 1
+        assert stats["healthy_clients"] == 1
+        assert stats["clients"][0]["ewma_latency"] is not None
+        
+        # Requests cancelled by a caller's timeout free their slot without counting as failures
+        async def slow_request():
+            async with pool.get_client_context():
+                await asyncio.sleep(10)
+        
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(slow_request(), timeout=0.01)
+        
+        stats = pool.get_stats()
+        assert stats["in_flight"] == 0
+        assert (stats["total_cancelled"], stats["total_failures"]) == (1, 0)
+    
+    @pytest.mark.asyncio
+    async def test_pool_without_healthy_clients(self):
+        """Test that routing fails fast when every client is ejected"""
+        pool = self._make_pool(1, reconnect_interval=60)
+        with patch('codex_simulator.mcp.client.MCPClient.connect',
+                   new=AsyncMock(side_effect=ConnectionError("refused"))):
+            await pool.initialize()
+        
+        with pytest.raises(RuntimeError, match="No healthy clients"):
+            pool.get_client()
+        await pool.cleanup()
 
 class TestMCPToolWrapper:
     """Test MCP tool wrapper functionality"""
@@ -179,6 +1726,48 @@ class TestMCPToolWrapper:
         result = wrapper._run(message="sync test")
         assert "Processed: sync test" in str(result)
 
+    @pytest.mark.asyncio
+    async def test_tool_wrapper_sync_call_inside_running_loop(self):
+        """Test that _run called from a coroutine neither deadlocks nor re-enters the loop"""
+        import threading
+        
+        port = _free_port()
+        server = MCPServer(host="127.0.0.1", port=port)
+        server.register_tool("test_tool", lambda message: f"Processed: {message}")
+        # The calling loop is blocked during _run, so the server needs a loop of its own
+        server_loop = asyncio.new_event_loop()
+        server_task = server_loop.create_task(server.start())
+        
+        def serve():
+            try:
+                server_loop.run_until_complete(server_task)
+            except asyncio.CancelledError:
+                pass
+            leftover = asyncio.all_tasks(server_loop)
+            for task in leftover:
+                task.cancel()
+            server_loop.run_until_complete(asyncio.gather(*leftover, return_exceptions=True))
+            server_loop.close()
+        
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        await asyncio.sleep(0.5)
+        
+        config = MCPConnectionConfig(server_url=f"http://127.0.0.1:{port}", client_id="sync_client", timeout=5)
+        client = MCPClient(config, "sync_agent")
+        try:
+            await client.connect(use_websocket=True)
+            wrapper = MCPToolWrapper("test_tool", client)
+            
+            assert wrapper._run(message="from sync code") == "Processed: from sync code"
+            # The WebSocket on this loop still works afterwards
+            response = await client.invoke_tool("test_tool", {"message": "async"})
+            assert response.result == "Processed: async"
+        finally:
+            await client.disconnect()
+            server_loop.call_soon_threadsafe(server_task.cancel)
+            thread.join(5)
+
 class TestMCPIntegration:
     """Test MCP integration with CodexSimulator components"""
     
@@ -0,0 +1,139 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from ..llms.custom_gemini_llm import CustomGeminiLLM
+from ..utils import token_accounting, tracing
+from ..utils.token_accounting import (
+    ContextSection, TokenLedger, estimate_tokens, fit_to_budget, format_token_report,
+    install_token_accounting, summarize_trace
+)
+from ..utils.tracing import Tracer, set_tracer
+
+
+@pytest.fixture
+def tracer():
+    tracer = Tracer()
+    set_tracer(tracer)
+    yield tracer
+    set_tracer(None)
+
+
+class TestContextBudget:
+    """Test cases for fitting task context sections into a token budget"""
+
+    def test_lowest_priority_is_trimmed_first(self):
+        """Test that required sections stay whole and low priority sections go first"""
+        sections = [
+            ContextSection("command", "list the files", required=True),
+            ContextSection("history", "ls, pwd, cat notes.md", priority=3, keep="tail"),
+            ContextSection("user_context", "u" * 400, priority=2),
+            ContextSection("claude_context", "c" * 4000, priority=1)
+        ]
+        context = fit_to_budget(sections, budget=150)
+
+        assert context.tokens <= 150 and not context.over_budget
+        assert context.trimmed == ["claude_context"]
+        assert context.sections["command"] == "list the files"
+        assert context.sections["user_context"] == "u" * 400
+        assert context.sections["claude_context"].endswith("...")
+
+        tight = fit_to_budget(sections, budget=8)
+        assert tight.trimmed == ["claude_context", "user_context", "history"]
+        assert tight.sections["claude_context"] == "" and tight.sections["user_context"] == ""
+        assert tight.sections["history"].startswith("...") and tight.sections["history"].endswith("notes.md")
+        assert tight.tokens <= 8
+
+    def test_section_cap_and_required_overflow(self):
+        """Test max_tokens caps a section within budget and required text is never cut"""
+        capped = fit_to_budget([ContextSection("claude_context", "c" * 2000, max_tokens=250)], budget=10000)
+        assert capped.trimmed == ["claude_context"]
+        assert estimate_tokens(capped.sections["claude_context"]) == 250
+
+        overflow = fit_to_budget([ContextSection("command", "x" * 400, required=True)], budget=10)
+        assert overflow.over_budget and overflow.sections["command"] == "x" * 400
+
+
+class TestTokenAccounting:
+    """Test cases for per-command token accounting"""
+
+    def test_summarize_by_agent_and_tool(self, tracer):
+        """Test that LLM tokens go to the enclosing agent and tool results to their tool"""
+        with tracer.span("command", "command", command="ls"):
+            with tracer.span("crew.construct", "crew", context_tokens=420, context_trimmed="claude_context"):
+                pass
+            with tracer.span("agent:Commander", "agent", role="Commander"):
+                with tracer.span("llm:gemini", "llm", prompt_tokens=100, completion_tokens=20):
+                    pass
+                with tracer.span("agent:FileNavigator", "agent", role="FileNavigator"):
+                    with tracer.span("tool:dir", "tool", tool="dir", result_chars=400):
+                        pass
+                    with tracer.span("llm:gemini", "llm", prompt_chars=800, completion_chars=40):
+                        pass
+
+        usage = summarize_trace(tracer.last_trace)
+        assert usage.command == "ls"
+        assert (usage.total.calls, usage.total.prompt_tokens, usage.total.completion_tokens) == (2, 300, 30)
+        assert usage.by_agent["Commander"].prompt_tokens == 100
+        assert usage.by_agent["FileNavigator"].prompt_tokens == 200
+        assert usage.by_tool["dir"].prompt_tokens == 100
+        assert usage.estimated
+        assert (usage.context_tokens, usage.context_trimmed) == (420, ["claude_context"])
+
+    def test_ledger_listens_to_tracer(self, tracer):
+        """Test that the ledger accumulates session totals from finished traces"""
+        ledger = TokenLedger()
+        tracer.add_listener(ledger.record_trace)
+        tracer.add_listener(ledger.record_trace)
+        assert "No token usage" in format_token_report(ledger)
+        for command in ("ls", "pwd"):
+            with tracer.span("command", "command", command=command):
+                with tracer.span("llm:gemini", "llm", prompt_tokens=50, completion_tokens=5):
+                    pass
+
+        assert ledger.command_count == 2 and ledger.last.command == "pwd"
+        assert ledger.session.total_tokens == 110
+        report = format_token_report(ledger)
+        assert "Last command: pwd" in report and "Session (2 commands)" in report
+
+    def test_gemini_usage_recorded_on_span(self, tracer):
+        """Test that CustomGeminiLLM copies Gemini's usage metadata onto its llm span"""
+        llm = CustomGeminiLLM(model="gemini-test", google_api_key="test-key")
+        response = SimpleNamespace(
+            text="hello",
+            usage_metadata=SimpleNamespace(prompt_token_count=12, candidates_token_count=3, total_token_count=15)
+        )
+        llm.client = MagicMock(generate_content=MagicMock(return_value=response))
+        with tracer.span("command", "command"):
+            assert llm.invoke("say hello") == "hello"
+
+        llm_span = tracer.last_trace[1]
+        assert llm_span.kind == "llm"
+        assert (llm_span.attributes["prompt_tokens"], llm_span.attributes["completion_tokens"]) == (12, 3)
+        assert summarize_trace(tracer.last_trace).total.total_tokens == 15
+
+    def test_accounting_without_tracing(self, monkeypatch):
+        """Test that calls count towards the session with tracing off and the ledger survives set_tracer"""
+        ledger = TokenLedger()
+        monkeypatch.setattr(token_accounting, "_ledger", ledger)
+        monkeypatch.setattr(tracing, "_listeners", [])
+        install_token_accounting()
+
+        set_tracer(Tracer(enabled=False))
+        try:
+            llm = CustomGeminiLLM(model="gemini-test", google_api_key="test-key")
+            llm.client = MagicMock(generate_content=MagicMock(return_value=SimpleNamespace(text="hello")))
+            assert llm.invoke("say hello") == "hello"
+            # No usage metadata: 9 and 5 characters round up to 3 and 2 tokens
+            assert (ledger.untraced.calls, ledger.session.prompt_tokens, ledger.session.completion_tokens) == (1, 3, 2)
+            assert "tracing is off" in format_token_report(ledger)
+
+            replacement = Tracer()
+            set_tracer(replacement)
+            with replacement.span("command", "command", command="ls"):
+                with replacement.span("llm:gemini", "llm", prompt_tokens=10, completion_tokens=1):
+                    pass
+            assert ledger.command_count == 1 and ledger.session.total_tokens == 16
+        finally:
+            set_tracer(None)
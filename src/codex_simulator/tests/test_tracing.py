@@ -0,0 +1,162 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from ..llms import custom_gemini_llm
+from ..llms.custom_gemini_llm import CustomGeminiLLM
+from ..tools.delegate_tool import DelegateTool
+from ..tools.safe_directory_tool import SafeDirectoryTool
+from ..utils.tracing import (
+    Tracer, _crewai_agent_events, create_exporter, format_flame, install_crewai_hooks, self_times, set_tracer,
+    trace_tool
+)
+
+
+class RecordingExporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, spans):
+        self.traces.append(spans)
+
+
+class MockAgent:
+    def execute(self, task_description: str):
+        return f"done: {task_description}"
+
+
+@pytest.fixture
+def tracer():
+    tracer = Tracer(exporter=RecordingExporter())
+    set_tracer(tracer)
+    yield tracer
+    set_tracer(None)
+
+
+class TestTracer:
+    """Test cases for span nesting, export and the flame breakdown"""
+
+    def test_spans_nest_and_finish_with_root(self, tracer):
+        """Test that spans opened inside another become its children"""
+        with tracer.span("command", "command") as root:
+            with tracer.span("router.classify", "router") as router:
+                router.set_attribute("route", "crew")
+            with tracer.span("crew.kickoff", "crew") as kickoff:
+                with tracer.span("tool:ls", "tool") as tool:
+                    pass
+            assert tracer.last_trace == []
+
+        assert [span.name for span in tracer.last_trace] == ["command", "router.classify", "crew.kickoff", "tool:ls"]
+        assert {span.trace_id for span in tracer.last_trace} == {root.trace_id}
+        assert router.parent_id == root.span_id and tool.parent_id == kickoff.span_id
+        assert tracer.exporter.traces == [tracer.last_trace]
+        assert tracer.current_span() is None
+
+    def test_errors_are_recorded(self, tracer):
+        """Test that an exception marks its span failed and still ends the trace"""
+        with pytest.raises(RuntimeError):
+            with tracer.span("command", "command"):
+                with tracer.span("llm:gemini", "llm"):
+                    raise RuntimeError("quota exceeded")
+
+        llm_span = tracer.last_trace[1]
+        assert llm_span.status == "error"
+        assert "quota exceeded" in llm_span.error
+
+    def test_unended_spans_close_with_root(self, tracer):
+        """Test that spans left open, like an agent missing its completion event, are closed"""
+        with tracer.span("command", "command"):
+            tracer.start_span("agent:FileNavigator", "agent")
+
+        agent_span = tracer.last_trace[1]
+        assert agent_span.ended and agent_span.status == "error"
+        assert tracer.current_span() is None
+
+    def test_flame_breakdown(self, tracer):
+        """Test the flame text and self time per layer"""
+        with tracer.span("command", "command"):
+            with tracer.span("llm:gemini", "llm", prompt_tokens=120, completion_tokens=30):
+                pass
+
+        flame = format_flame(tracer.last_trace)
+        assert "command" in flame and "  llm:gemini" in flame
+        assert "tokens 120 in / 30 out" in flame
+        assert "LLM calls: 1" in flame
+        assert set(self_times(tracer.last_trace)) == {"command", "llm"}
+        assert "No trace" in format_flame([])
+
+    @pytest.mark.parametrize("format", ["jsonl", "otlp"])
+    def test_file_exporters(self, tmp_path, format):
+        """Test that traces are appended to the file in either format"""
+        path = tmp_path / "traces" / "spans.jsonl"
+        tracer = Tracer(exporter=create_exporter(str(path), format))
+        for _ in range(2):
+            with tracer.span("command", "command", command="ls"):
+                with tracer.span("crew.construct", "crew"):
+                    pass
+
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        if format == "jsonl":
+            assert [line["name"] for line in lines] == ["command", "crew.construct"] * 2
+            assert lines[1]["parent_id"] == lines[0]["span_id"]
+        else:
+            assert len(lines) == 2
+            spans = lines[0]["resourceSpans"][0]["scopeSpans"][0]["spans"]
+            assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+            assert {"key": "command", "value": {"stringValue": "ls"}} in spans[0]["attributes"]
+
+        with pytest.raises(ValueError):
+            create_exporter(str(path), "xml")
+
+    def test_tool_and_delegation_spans(self, tracer, tmp_path):
+        """Test that traced tools and delegation hops record spans"""
+        tool = trace_tool(trace_tool(SafeDirectoryTool()))
+        delegate_tool = DelegateTool(agents_dict={"FileNavigator": MockAgent()})
+        with tracer.span("command", "command"):
+            tool._run(str(tmp_path))
+            delegate_tool._run(task="list files", coworker="FileNavigator")
+
+        assert [(span.kind, span.name) for span in tracer.last_trace[1:]] == [
+            ("tool", f"tool:{tool.name}"),
+            ("delegation", "delegate:FileNavigator")
+        ]
+
+    def test_gemini_call_span(self, tracer):
+        """Test that CustomGeminiLLM.invoke answers and records an llm span with Gemini's token counts"""
+        response = SimpleNamespace(
+            text="hello",
+            usage_metadata=SimpleNamespace(prompt_token_count=12, candidates_token_count=3, total_token_count=15)
+        )
+        with patch.object(custom_gemini_llm, "genai_sdk") as genai:
+            llm = CustomGeminiLLM(model="gemini-test", google_api_key="test-key")
+            llm.client = genai.GenerativeModel(model_name="gemini-test")
+            llm.client.generate_content.return_value = response
+            with tracer.span("command", "command"):
+                assert llm.invoke("say hello") == "hello"
+
+        genai.GenerativeModel.return_value.generate_content.assert_called_once()
+        llm_span = tracer.last_trace[1]
+        assert (llm_span.kind, llm_span.name) == ("llm", "llm:gemini-test")
+        assert llm_span.status == "ok"
+        assert (llm_span.attributes["prompt_tokens"], llm_span.attributes["completion_tokens"]) == (12, 3)
+
+    def test_crewai_agent_spans(self, tracer):
+        """Test that CrewAI agent execution events open and close agent spans"""
+        events = _crewai_agent_events()
+        if events is None:
+            pytest.skip("CrewAI event bus not available")
+        event_bus, started_event, completed_event, _ = events
+        install_crewai_hooks()
+
+        agent = SimpleNamespace(role="FileNavigator")
+        task = SimpleNamespace(description="list files")
+        with tracer.span("command", "command"):
+            event_bus.emit(agent, started_event.model_construct(agent=agent, task=task, tools=[], task_prompt=""))
+            event_bus.emit(agent, completed_event.model_construct(agent=agent, task=task, output="a.txt b.txt"))
+
+        agent_span = tracer.last_trace[1]
+        assert (agent_span.kind, agent_span.name) == ("agent", "agent:FileNavigator")
+        assert agent_span.status == "ok" and agent_span.parent_id == tracer.last_trace[0].span_id
+        assert (agent_span.attributes["task"], agent_span.attributes["output_chars"]) == ("list files", 11)
@@ -1,10 +1,15 @@
-import asyncio
 from typing import Any, Dict, Optional, Type, Union
 from pydantic import BaseModel, Field
 from crewai.tools import BaseTool
 
 # Add MCP imports
 from ..mcp import MCPClient, MCPToolInvocationRequest
+from ..mcp.client import SYNC_GRACE_PERIOD
+from ..mcp.sync_bridge import run_sync
+from ..utils.tracing import get_tracer
+
+# Seconds a delegated task may run on the specialist agent
+DELEGATION_TIMEOUT = 60
 
 class DelegateToolInput(BaseModel):
     """Input schema for the delegation tool."""
@@ -42,6 +47,12 @@ class DelegateTool(BaseTool):
         return str(value) if value is not None else ""
     
     def _run(self, task: str, coworker: str, context: str = "") -> str:
+        """Delegate a task to another agent, as one delegation hop in the command's trace."""
+        target = self._extract_str_from_dict(coworker)
+        with get_tracer().span(f"delegate:{target}", "delegation", coworker=target):
+            return self._delegate(task, coworker, context)
+    
+    def _delegate(self, task: str, coworker: str, context: str = "") -> str:
         """
         Delegate a task to another agent and return the result.
         
@@ -158,7 +169,7 @@ class MCPDelegateTool(BaseTool):
             response = await self.mcp_client.invoke_tool(
                 tool_name=agent_tool,
                 arguments={"task": full_task},
-                timeout=60
+                timeout=DELEGATION_TIMEOUT
             )
             
             if response.success:
@@ -176,20 +187,23 @@ class MCPDelegateTool(BaseTool):
         coworker = self._extract_str_from_dict(coworker)
         context = self._extract_str_from_dict(context)
         
+        with get_tracer().span(f"delegate:{coworker}", "delegation", coworker=coworker, via_mcp=self.mcp_client is not None):
+            return self._delegate(task, coworker, context)
+    
+    def _delegate(self, task: str, coworker: str, context: str = "") -> str:
+        """Delegate over MCP when connected, otherwise directly"""
         # Check if MCP client is available
         if self.mcp_client:
-            # Run async delegation
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # Create task for async execution
-                task_coro = self._delegate_via_mcp(task, coworker, context)
-                future = asyncio.ensure_future(task_coro)
-                try:
-                    return loop.run_until_complete(future)
-                except Exception as e:
-                    return f"Async delegation failed: {str(e)}"
-            else:
-                return loop.run_until_complete(self._delegate_via_mcp(task, coworker, context))
+            # Run on the MCP sync bridge so the caller's event loop is never re-entered;
+            # a client connected in-process picks the loop its server answers on
+            run = self.mcp_client.run_sync if isinstance(self.mcp_client, MCPClient) else run_sync
+            try:
+                return run(
+                    self._delegate_via_mcp(task, coworker, context),
+                    timeout=DELEGATION_TIMEOUT + SYNC_GRACE_PERIOD
+                )
+            except Exception as e:
+                return f"Async delegation failed: {str(e)}"
         
         # Fallback to direct delegation if MCP not available
         return self._direct_delegate(task, coworker, context)
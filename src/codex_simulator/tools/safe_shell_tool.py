@@ -1,10 +1,12 @@
 import os
 import re
 import subprocess
-from typing import Dict, List, Type
+from typing import Dict, List, Optional, Type
 from pydantic import BaseModel, Field
 from crewai.tools import BaseTool
 
+from ..utils.cancellation import CancellationToken, ToolCancelledError, run_cancellable
+
 class SafeShellToolInput(BaseModel):
     """Input for the SafeShellTool."""
     command: str = Field(..., description="The shell command to execute.")
@@ -62,7 +64,13 @@ class SafeShellTool(BaseTool):
         
         return {"safe": True, "reason": "Command passed safety checks"}
 
-    def _run(self, command: str) -> str:
+    def _execute(self, command: str, cancel_token: Optional[CancellationToken] = None):
+        """Run the command; with a cancel token its whole process group can be killed."""
+        if cancel_token is None:
+            return subprocess.run(command, shell=True, capture_output=True, text=True, timeout=60)
+        return run_cancellable(command, cancel_token, timeout=60, shell=True, text=True)
+
+    def _run(self, command: str, cancel_token: Optional[CancellationToken] = None) -> str:
         """Execute a shell command if it passes safety checks."""
         # Check if this is a python script execution command
         executing_python_file = False
@@ -121,7 +129,7 @@ class SafeShellTool(BaseTool):
             
             # Execute the command
             print(f"Executing command: {command}")
-            result = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=60)
+            result = self._execute(command, cancel_token)
             
             # Format the output
             output = ""
@@ -145,7 +153,7 @@ class SafeShellTool(BaseTool):
                     print(f"Added execute permission to: {file_path}")
                     
                     # Run again
-                    result = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=60)
+                    result = self._execute(command, cancel_token)
                     
                     # Update output
                     output = ""
@@ -165,5 +173,7 @@ class SafeShellTool(BaseTool):
             return output
         except subprocess.TimeoutExpired:
             return f"Error: Command '{command}' timed out after 60 seconds."
+        except ToolCancelledError:
+            return f"Error: Command '{command}' was cancelled."
         except Exception as e:
             return f"Error executing command: {str(e)}"
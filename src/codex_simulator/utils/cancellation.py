@@ -0,0 +1,112 @@
+"""
+Cancellation support for long-running tool executions.
+Tools accept an optional cancel_token and either poll it or register a callback
+that stops their work, such as killing a spawned process group.
+"""
+
+import os
+import signal
+import subprocess
+import threading
+from typing import Callable, List, Optional
+
+class ToolCancelledError(Exception):
+    """Raised by a tool that stopped because its cancel token fired"""
+
+class CancellationToken:
+    """Thread-safe flag with callbacks, shared between a caller and a running tool"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        """Mark the work as cancelled and run registered callbacks once"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def add_callback(self, callback: Callable[[], None]):
+        """Run callback on cancellation, immediately if already cancelled"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise ToolCancelledError("Tool execution was cancelled")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until cancelled or timeout; returns True if cancelled"""
+        return self._event.wait(timeout)
+
+def _kill_process_group(process: subprocess.Popen):
+    """Kill a process and everything it spawned"""
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def run_cancellable(
+    command,
+    cancel_token: Optional[CancellationToken] = None,
+    timeout: Optional[float] = None,
+    **popen_kwargs
+) -> subprocess.CompletedProcess:
+    """
+    Run a command like subprocess.run(capture_output=True), in its own process group.
+
+    Cancelling the token or hitting the timeout kills the whole group, so shells
+    and their children do not outlive the request.
+
+    Raises:
+        subprocess.TimeoutExpired: If the command exceeds timeout
+        ToolCancelledError: If the token was cancelled
+    """
+    if os.name == "posix":
+        popen_kwargs.setdefault("start_new_session", True)
+
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **popen_kwargs
+    )
+    kill = lambda: _kill_process_group(process)
+    if cancel_token is not None:
+        cancel_token.add_callback(kill)
+
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill()
+        process.communicate()
+        raise
+    finally:
+        if cancel_token is not None:
+            cancel_token.remove_callback(kill)
+
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+
+    return subprocess.CompletedProcess(process.args, process.returncode, stdout, stderr)
@@ -0,0 +1,266 @@
+"""
+Token accounting and prompt budgeting.
+Per-command token usage is read off the command's trace: llm spans carry the
+prompt and completion token counts Gemini reports, and tool spans the size of
+the results fed back into agent prompts. With tracing off, LLM calls are only
+added to the session totals. Task descriptions are fitted to a token budget by
+trimming their lowest-priority context sections first.
+"""
+
+import os
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from .tracing import TRACING_ENV, Span, add_trace_listener
+
+# Rough size of a Gemini token in English text and code; used where no exact count exists
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = "..."
+
+TASK_CONTEXT_BUDGET_ENV = "CODEX_TASK_CONTEXT_TOKENS"
+DEFAULT_TASK_CONTEXT_BUDGET = 1500
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of text, rounded up"""
+    return chars_to_tokens(len(text))
+
+def chars_to_tokens(chars: int) -> int:
+    """Approximate token count of text chars characters long, rounded up"""
+    return (chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def task_context_budget() -> int:
+    """Token budget for a task description, from CODEX_TASK_CONTEXT_TOKENS"""
+    try:
+        return int(os.getenv(TASK_CONTEXT_BUDGET_ENV, DEFAULT_TASK_CONTEXT_BUDGET))
+    except ValueError:
+        return DEFAULT_TASK_CONTEXT_BUDGET
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """
+    Shorten text to about max_tokens, marking the cut.
+
+    Args:
+        keep: "head" keeps the start of the text, "tail" the end
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    chars = max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARKER)
+    if chars <= 0:
+        return ""
+    return TRUNCATION_MARKER + text[-chars:] if keep == "tail" else text[:chars] + TRUNCATION_MARKER
+
+@dataclass
+class ContextSection:
+    """
+    One part of a task description.
+
+    Sections with a lower priority are trimmed first; required sections are
+    never trimmed. max_tokens caps a section even when the budget has room.
+    """
+    name: str
+    text: str
+    priority: int = 0
+    required: bool = False
+    max_tokens: Optional[int] = None
+    keep: str = "head"
+
+@dataclass
+class BudgetedContext:
+    """Section texts after fitting, and what it took"""
+    sections: Dict[str, str]
+    tokens: int
+    budget: int
+    trimmed: List[str] = field(default_factory=list)
+
+    @property
+    def over_budget(self) -> bool:
+        """Whether it did not fit even with every optional section trimmed"""
+        return self.tokens > self.budget
+
+def fit_to_budget(sections: Sequence[ContextSection], budget: int) -> BudgetedContext:
+    """Trim optional sections, lowest priority first, until all sections fit the budget"""
+    texts: Dict[str, str] = {}
+    trimmed: List[str] = []
+    for section in sections:
+        text = section.text
+        if section.max_tokens is not None and not section.required:
+            text = truncate_to_tokens(text, section.max_tokens, section.keep)
+            if text != section.text:
+                trimmed.append(section.name)
+        texts[section.name] = text
+
+    total = sum(estimate_tokens(text) for text in texts.values())
+    for section in sorted((s for s in sections if not s.required), key=lambda s: s.priority):
+        if total <= budget:
+            break
+        current = estimate_tokens(texts[section.name])
+        if current == 0:
+            continue
+        texts[section.name] = truncate_to_tokens(texts[section.name], max(current - (total - budget), 0), section.keep)
+        total += estimate_tokens(texts[section.name]) - current
+        if section.name not in trimmed:
+            trimmed.append(section.name)
+    return BudgetedContext(sections=texts, tokens=total, budget=budget, trimmed=trimmed)
+
+@dataclass
+class TokenTotals:
+    """Token counts of a group of LLM or tool calls"""
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, prompt_tokens: int, completion_tokens: int, calls: int = 1):
+        self.calls += calls
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+    def merge(self, other: "TokenTotals"):
+        self.add(other.prompt_tokens, other.completion_tokens, other.calls)
+
+@dataclass
+class CommandTokens:
+    """
+    Token usage of one command.
+
+    Tool totals count a tool's calls and its results' estimated tokens, which
+    agents carry in their prompts for the rest of the task.
+    """
+    command: str
+    total: TokenTotals = field(default_factory=TokenTotals)
+    by_agent: Dict[str, TokenTotals] = field(default_factory=dict)
+    by_tool: Dict[str, TokenTotals] = field(default_factory=dict)
+    context_tokens: int = 0
+    context_trimmed: List[str] = field(default_factory=list)
+    estimated: bool = False
+
+def _nearest_agent(span: Span, spans_by_id: Dict[str, Span]) -> str:
+    parent = spans_by_id.get(span.parent_id) if span.parent_id else None
+    while parent is not None:
+        if parent.kind == "agent":
+            return parent.attributes.get("role", parent.name)
+        parent = spans_by_id.get(parent.parent_id) if parent.parent_id else None
+    return "(no agent)"
+
+def llm_span_tokens(span: Span) -> Tuple[int, int, bool]:
+    """
+    Prompt and completion tokens of an llm span, and whether they are estimated.
+
+    Without usage metadata in the response, counts are estimated from the text sizes.
+    """
+    attributes = span.attributes
+    prompt, completion = attributes.get("prompt_tokens"), attributes.get("completion_tokens")
+    estimated = prompt is None or completion is None
+    if prompt is None:
+        prompt = chars_to_tokens(attributes.get("prompt_chars", 0))
+    if completion is None:
+        completion = chars_to_tokens(attributes.get("completion_chars", 0))
+    return prompt, completion, estimated
+
+def summarize_trace(spans: List[Span]) -> CommandTokens:
+    """Token usage of the command traced by spans"""
+    spans_by_id = {span.span_id: span for span in spans}
+    root = next((span for span in spans if span.parent_id is None), None)
+    usage = CommandTokens(command=str(root.attributes.get("command", root.name)) if root else "")
+    for span in spans:
+        attributes = span.attributes
+        if span.kind == "llm":
+            prompt, completion, estimated = llm_span_tokens(span)
+            usage.estimated = usage.estimated or estimated
+            usage.total.add(prompt, completion)
+            usage.by_agent.setdefault(_nearest_agent(span, spans_by_id), TokenTotals()).add(prompt, completion)
+        elif span.kind == "tool":
+            tool = attributes.get("tool", span.name)
+            usage.by_tool.setdefault(tool, TokenTotals()).add(chars_to_tokens(attributes.get("result_chars", 0)), 0)
+        if "context_tokens" in attributes:
+            usage.context_tokens += attributes["context_tokens"]
+            usage.context_trimmed.extend(name for name in attributes.get("context_trimmed", "").split(",") if name)
+    return usage
+
+class TokenLedger:
+    """
+    Token usage of recent commands and running totals for the session.
+
+    LLM calls made while tracing is off count towards the session totals and
+    untraced, but belong to no command, agent or tool.
+    """
+
+    def __init__(self, history: int = 50):
+        self.commands: Deque[CommandTokens] = deque(maxlen=history)
+        self.command_count = 0
+        self.session = TokenTotals()
+        self.session_by_agent: Dict[str, TokenTotals] = {}
+        self.session_by_tool: Dict[str, TokenTotals] = {}
+        self.untraced = TokenTotals()
+        self.untraced_estimated = False
+        self._lock = threading.Lock()
+
+    @property
+    def last(self) -> Optional[CommandTokens]:
+        return self.commands[-1] if self.commands else None
+
+    def record_trace(self, spans: List[Span]):
+        """Trace listener: account for a finished command"""
+        usage = summarize_trace(spans)
+        with self._lock:
+            self.commands.append(usage)
+            self.command_count += 1
+            self.session.merge(usage.total)
+            for totals, session_totals in ((usage.by_agent, self.session_by_agent), (usage.by_tool, self.session_by_tool)):
+                for name, value in totals.items():
+                    session_totals.setdefault(name, TokenTotals()).merge(value)
+
+    def record_untraced(self, span: Span):
+        """Account for an LLM call no trace reports, from its detached llm span"""
+        prompt, completion, estimated = llm_span_tokens(span)
+        with self._lock:
+            self.session.add(prompt, completion)
+            self.untraced.add(prompt, completion)
+            self.untraced_estimated = self.untraced_estimated or estimated
+
+_ledger = TokenLedger()
+
+def get_token_ledger() -> TokenLedger:
+    return _ledger
+
+def install_token_accounting():
+    """Account for every command traced by the process-wide tracer, now or after set_tracer()"""
+    add_trace_listener(_ledger.record_trace)
+
+def _format_totals(label: str, totals: TokenTotals) -> str:
+    return (
+        f"  {label:<44.44} {totals.calls:>4} calls  {totals.prompt_tokens:>8} in  "
+        f"{totals.completion_tokens:>7} out"
+    )
+
+def format_token_report(ledger: TokenLedger) -> str:
+    """Token usage of the last command by agent and tool, and session totals"""
+    usage = ledger.last
+    if usage is None and not ledger.untraced.calls:
+        return "No token usage recorded yet. Run a command first."
+    lines = []
+    if usage is not None:
+        lines.append(f"Last command: {usage.command}" + (" (estimated)" if usage.estimated else ""))
+        lines.append(_format_totals("total", usage.total))
+        for agent, totals in sorted(usage.by_agent.items(), key=lambda item: -item[1].total_tokens):
+            lines.append(_format_totals(f"agent {agent}", totals))
+        for tool, totals in sorted(usage.by_tool.items(), key=lambda item: -item[1].prompt_tokens):
+            lines.append(f"  {'tool ' + tool:<44.44} {totals.calls:>4} calls  {totals.prompt_tokens:>8} result tokens")
+        if usage.context_tokens:
+            trimmed = f", trimmed {', '.join(usage.context_trimmed)}" if usage.context_trimmed else ""
+            lines.append(f"  task context {usage.context_tokens} tokens{trimmed}")
+    else:
+        lines.append(f"No per-command breakdown while tracing is off ({TRACING_ENV}).")
+    lines.append(f"Session ({ledger.command_count} commands):")
+    lines.append(_format_totals("total", ledger.session))
+    if ledger.untraced.calls:
+        label = "untraced LLM calls" + (" (estimated)" if ledger.untraced_estimated else "")
+        lines.append(_format_totals(label, ledger.untraced))
+    for agent, totals in sorted(ledger.session_by_agent.items(), key=lambda item: -item[1].total_tokens):
+        lines.append(_format_totals(f"agent {agent}", totals))
+    return "\n".join(lines)
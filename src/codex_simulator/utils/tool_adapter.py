@@ -48,6 +48,7 @@ def patch_tool_methods(agent):
         return
         
     for tool in agent.tools:
-        if hasattr(tool, '_run'):
+        # Agents are reused across commands; wrapping again would stack adapters
+        if hasattr(tool, '_run') and not hasattr(tool, '_original_run'):
             tool._original_run = tool._run  # Save original method
             tool._run = create_simple_tool_adapter(tool._run)  # Replace with adapted version
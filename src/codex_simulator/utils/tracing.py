@@ -0,0 +1,453 @@
+"""
+Per-command tracing.
+Nested spans record where a command spends its time across the router, crew
+construction, agents, delegation hops, tools and LLM calls. The spans of the
+last finished command are kept for the REPL "trace" command and, when
+CODEX_TRACE_FILE is set, appended to that file as JSONL or OTLP/JSON.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACE_FILE_ENV = "CODEX_TRACE_FILE"
+TRACE_FORMAT_ENV = "CODEX_TRACE_FORMAT"
+TRACING_ENV = "CODEX_TRACING"
+SERVICE_NAME = "codex_simulator"
+
+@dataclass
+class Span:
+    """One timed operation; spans sharing a trace_id form one command's tree"""
+    name: str
+    kind: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_time_ns: int
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    duration_ns: Optional[int] = None
+    status: str = "ok"
+    error: Optional[str] = None
+    _started: int = field(default=0, repr=False)
+    _token: Optional[contextvars.Token] = field(default=None, repr=False)
+
+    @property
+    def ended(self) -> bool:
+        return self.duration_ns is not None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.duration_ns or 0) / 1e6
+
+    @property
+    def end_time_ns(self) -> int:
+        return self.start_time_ns + (self.duration_ns or 0)
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        """Mark the span failed, e.g. for errors that are handled rather than raised"""
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time_ns": self.start_time_ns,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+class JsonlSpanExporter:
+    """Appends every span of a finished trace to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+
+    def _lines(self, spans: List[Span]) -> List[str]:
+        return [json.dumps(span.to_dict(), default=str) for span in spans]
+
+    def export(self, spans: List[Span]):
+        lines = self._lines(spans)
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as trace_file:
+                trace_file.write("\n".join(lines) + "\n")
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+class OtlpJsonFileExporter(JsonlSpanExporter):
+    """
+    Appends each finished trace as one OTLP/JSON ExportTraceServiceRequest line,
+    the format the OpenTelemetry Collector's file exporter and receiver use.
+    """
+
+    def _lines(self, spans: List[Span]) -> List[str]:
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(span.start_time_ns),
+                "endTimeUnixNano": str(span.end_time_ns),
+                "attributes": _otlp_attributes({"codex.kind": span.kind, **span.attributes}),
+                "status": {"code": 2, "message": span.error or ""} if span.status == "error" else {"code": 1}
+            }
+            if span.parent_id:
+                otlp_span["parentSpanId"] = span.parent_id
+            otlp_spans.append(otlp_span)
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": otlp_spans}]
+            }]
+        }
+        return [json.dumps(request, default=str)]
+
+EXPORTERS = {"jsonl": JsonlSpanExporter, "otlp": OtlpJsonFileExporter}
+
+def create_exporter(path: str, format: str = "jsonl"):
+    """
+    Exporter writing to path in the given format.
+
+    Raises:
+        ValueError: If format is not jsonl or otlp
+    """
+    if format not in EXPORTERS:
+        raise ValueError(f"Unknown trace format '{format}'. Use one of: {', '.join(EXPORTERS)}")
+    return EXPORTERS[format](path)
+
+class Tracer:
+    """
+    Creates nested spans and collects them per trace.
+
+    The current span is tracked in a context variable, so spans opened while
+    another is open become its children. A trace is finished, kept as
+    last_trace, exported and passed to each listener when its root span ends.
+    """
+
+    def __init__(self, exporter=None, enabled: bool = True):
+        self.exporter = exporter
+        self.enabled = enabled
+        self.last_trace: List[Span] = []
+        self.listeners: List[Callable[[List[Span]], None]] = []
+        self._current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+            f"codex_current_span_{id(self)}", default=None
+        )
+        self._open_traces: Dict[str, List[Span]] = {}
+        self._lock = threading.Lock()
+
+    def current_span(self) -> Optional[Span]:
+        return self._current.get()
+
+    def add_listener(self, listener: Callable[[List[Span]], None]):
+        """Call listener with the spans of every finished trace; added once"""
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def start_span(self, name: str, kind: str = "internal", **attributes) -> Optional[Span]:
+        """Open a span as a child of the current one; returns None when disabled"""
+        if not self.enabled:
+            return None
+        parent = self._current.get()
+        span = Span(
+            name=name,
+            kind=kind,
+            trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+            span_id=os.urandom(8).hex(),
+            parent_id=parent.span_id if parent else None,
+            start_time_ns=time.time_ns(),
+            attributes=dict(attributes),
+            _started=time.perf_counter_ns()
+        )
+        span._token = self._current.set(span)
+        with self._lock:
+            self._open_traces.setdefault(span.trace_id, []).append(span)
+        return span
+
+    def end_span(self, span: Optional[Span], error: Optional[BaseException] = None):
+        """Close a span and make its parent current again"""
+        if span is None or span.ended:
+            return
+        span.duration_ns = time.perf_counter_ns() - span._started
+        if error is not None:
+            span.record_error(error)
+        try:
+            self._current.reset(span._token)
+        except ValueError:
+            # Ended in another context than it started in (e.g. from an event handler)
+            parent = self._find(span.trace_id, span.parent_id)
+            self._current.set(parent if parent is not None and not parent.ended else None)
+        span._token = None
+        if span.parent_id is None:
+            self._finish_trace(span)
+
+    def _find(self, trace_id: str, span_id: Optional[str]) -> Optional[Span]:
+        with self._lock:
+            for span in self._open_traces.get(trace_id, []):
+                if span.span_id == span_id:
+                    return span
+        return None
+
+    def _finish_trace(self, root: Span):
+        with self._lock:
+            spans = self._open_traces.pop(root.trace_id, [])
+        for span in spans:
+            if not span.ended:
+                # Children that never ended, e.g. an agent whose completion event never came
+                span.duration_ns = max(root.end_time_ns - span.start_time_ns, 0)
+                span.status = "error"
+                span.error = "Span was not ended before its trace finished"
+        self.last_trace = spans
+        if self.exporter is not None:
+            try:
+                self.exporter.export(spans)
+            except Exception as e:
+                logger.warning(f"Could not export trace {root.trace_id}: {e}")
+        for listener in self.listeners:
+            try:
+                listener(spans)
+            except Exception as e:
+                logger.warning(f"Trace listener {listener!r} failed: {e}")
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes) -> Iterator[Optional[Span]]:
+        """Context manager around start_span/end_span that records exceptions"""
+        span = self.start_span(name, kind, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, error=e)
+            raise
+        self.end_span(span)
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+# Listeners of the process-wide tracer, kept across set_tracer()
+_listeners: List[Callable[[List[Span]], None]] = []
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer, configured from the environment on first use"""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                path = os.getenv(TRACE_FILE_ENV)
+                exporter = create_exporter(path, os.getenv(TRACE_FORMAT_ENV, "jsonl")) if path else None
+                enabled = os.getenv(TRACING_ENV, "true").lower() not in ("0", "false", "no")
+                tracer = Tracer(exporter=exporter, enabled=enabled)
+                for listener in _listeners:
+                    tracer.add_listener(listener)
+                _tracer = tracer
+    return _tracer
+
+def set_tracer(tracer: Optional[Tracer]):
+    """Replace the process-wide tracer; None reconfigures it from the environment"""
+    global _tracer
+    if tracer is not None:
+        for listener in _listeners:
+            tracer.add_listener(listener)
+    _tracer = tracer
+
+def add_trace_listener(listener: Callable[[List[Span]], None]):
+    """Listen to every trace of the process-wide tracer, including tracers set later"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+    get_tracer().add_listener(listener)
+
+def detached_span(name: str, kind: str = "internal", **attributes) -> Span:
+    """A span outside any trace, for collecting attributes while tracing is off"""
+    return Span(
+        name=name, kind=kind, trace_id="", span_id="", parent_id=None,
+        start_time_ns=time.time_ns(), attributes=dict(attributes)
+    )
+
+def traced(name: Optional[str] = None, kind: str = "internal"):
+    """Decorator running the function inside a span, named after it by default"""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_tracer().span(span_name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def trace_tool(tool):
+    """Wrap a tool's _run in a tool span, in place; safe to apply more than once"""
+    run = getattr(tool, "_run", None)
+    if run is None or getattr(run, "_codex_traced", False):
+        return tool
+    tool_name = getattr(tool, "name", type(tool).__name__)
+
+    @functools.wraps(run)
+    def traced_run(*args, **kwargs):
+        with get_tracer().span(f"tool:{tool_name}", "tool", tool=tool_name) as span:
+            result = run(*args, **kwargs)
+            if span is not None:
+                # The result goes back into the agent's prompt
+                span.set_attribute("result_chars", len(str(result)))
+            return result
+
+    traced_run._codex_traced = True
+    tool._run = traced_run
+    return tool
+
+_crewai_hooks_installed = False
+
+def _crewai_agent_events() -> Optional[tuple]:
+    """
+    CrewAI's event bus and agent execution event types, or None without them.
+    They moved from crewai.utilities.events to crewai.events after 0.120.
+    """
+    try:
+        from crewai.events import (
+            crewai_event_bus, AgentExecutionStartedEvent,
+            AgentExecutionCompletedEvent, AgentExecutionErrorEvent
+        )
+    except ImportError:
+        try:
+            from crewai.utilities.events import (
+                crewai_event_bus, AgentExecutionStartedEvent,
+                AgentExecutionCompletedEvent, AgentExecutionErrorEvent
+            )
+        except ImportError:
+            return None
+    return crewai_event_bus, AgentExecutionStartedEvent, AgentExecutionCompletedEvent, AgentExecutionErrorEvent
+
+def install_crewai_hooks():
+    """
+    Open an agent span for every CrewAI agent execution, using the CrewAI event
+    bus. Does nothing if CrewAI's event bus is unavailable or already hooked.
+    """
+    global _crewai_hooks_installed
+    if _crewai_hooks_installed:
+        return
+    events = _crewai_agent_events()
+    if events is None:
+        return
+    crewai_event_bus, AgentExecutionStartedEvent, AgentExecutionCompletedEvent, AgentExecutionErrorEvent = events
+    _crewai_hooks_installed = True
+    open_spans: Dict[tuple, Span] = {}
+
+    def key(event) -> tuple:
+        return (id(event.agent), id(event.task))
+
+    @crewai_event_bus.on(AgentExecutionStartedEvent)
+    def on_agent_started(source, event):
+        # A retried execution starts again without completing the failed attempt
+        get_tracer().end_span(open_spans.pop(key(event), None), error=RuntimeError("Agent execution retried"))
+        role = getattr(event.agent, "role", "agent")
+        span = get_tracer().start_span(
+            f"agent:{role}", "agent",
+            role=role,
+            task=str(getattr(event.task, "description", ""))[:200],
+            tools=len(event.tools or [])
+        )
+        if span is not None:
+            open_spans[key(event)] = span
+
+    @crewai_event_bus.on(AgentExecutionCompletedEvent)
+    def on_agent_completed(source, event):
+        span = open_spans.pop(key(event), None)
+        if span is not None:
+            span.set_attribute("output_chars", len(str(event.output)))
+        get_tracer().end_span(span)
+
+    @crewai_event_bus.on(AgentExecutionErrorEvent)
+    def on_agent_error(source, event):
+        get_tracer().end_span(open_spans.pop(key(event), None), error=RuntimeError(event.error))
+
+def _children(spans: List[Span]) -> Dict[Optional[str], List[Span]]:
+    children: Dict[Optional[str], List[Span]] = {}
+    for span in sorted(spans, key=lambda s: s.start_time_ns):
+        children.setdefault(span.parent_id, []).append(span)
+    return children
+
+def self_times(spans: List[Span]) -> Dict[str, float]:
+    """Milliseconds spent in each kind of span, excluding time in child spans"""
+    children = _children(spans)
+    totals: Dict[str, float] = {}
+    for span in spans:
+        own = span.duration_ms - sum(child.duration_ms for child in children.get(span.span_id, []))
+        totals[span.kind] = totals.get(span.kind, 0.0) + max(own, 0.0)
+    return totals
+
+def _describe(span: Span) -> str:
+    details = []
+    if span.kind == "llm":
+        prompt, completion = span.attributes.get("prompt_tokens"), span.attributes.get("completion_tokens")
+        if prompt is not None or completion is not None:
+            details.append(f"tokens {prompt or 0} in / {completion or 0} out")
+    if span.kind == "router" and "route" in span.attributes:
+        details.append(f"-> {span.attributes['route']}")
+    if span.status == "error":
+        details.append(f"ERROR {span.error}")
+    return "  ".join(details)
+
+def format_flame(spans: List[Span], width: int = 30) -> str:
+    """
+    Text flame graph of one trace: each span indented under its parent with its
+    duration, share of the whole command and a proportional bar, followed by the
+    self time of each layer.
+    """
+    if not spans:
+        return "No trace recorded yet. Run a command first."
+    children = _children(spans)
+    roots = children.get(None, [])
+    total = sum(root.duration_ms for root in roots) or 1.0
+    lines = []
+
+    def render(span: Span, depth: int):
+        share = span.duration_ms / total
+        label = f"{'  ' * depth}{span.name}"
+        bar = "█" * int(round(share * width))
+        line = f"{label:<48.48} {span.duration_ms:>10.1f} ms {share:>6.1%}  {bar:<{width}}"
+        description = _describe(span)
+        lines.append(f"{line}  {description}".rstrip())
+        for child in children.get(span.span_id, []):
+            render(child, depth + 1)
+
+    for root in roots:
+        render(root, 0)
+
+    lines.append("")
+    by_kind = sorted(self_times(spans).items(), key=lambda item: item[1], reverse=True)
+    lines.append("Self time by layer: " + ", ".join(f"{kind} {ms:.1f} ms ({ms / total:.0%})" for kind, ms in by_kind))
+    tokens = [span.attributes for span in spans if span.kind == "llm"]
+    if tokens:
+        prompt = sum(attributes.get("prompt_tokens") or 0 for attributes in tokens)
+        completion = sum(attributes.get("completion_tokens") or 0 for attributes in tokens)
+        lines.append(f"LLM calls: {len(tokens)}, tokens {prompt} in / {completion} out")
+    return "\n".join(lines)